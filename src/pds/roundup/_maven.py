@@ -5,8 +5,9 @@
 from .context import Context
 from .errors import InvokedProcessError, MissingEnvVarError, RoundupError
 from .step import ChangeLogStep as BaseChangeLogStep
-from .step import Step, StepName, NullStep, DocPublicationStep, RequirementsStep
-from .util import invoke, invokeGIT, TAG_RE, git_config, delete_tags, add_version_label_to_open_bugs
+from .step import Resource, Step, StepName, NullStep, DocPublicationStep, RequirementsStep
+from .util import invoke, TAG_RE, git_config, delete_tags, add_version_label_to_open_bugs
+from .util import git_describe_tag, plan_delete_tags, plan_git_config
 from lxml import etree
 import logging, os, base64, subprocess, re
 
@@ -66,23 +67,34 @@ class _MavenStep(Step):
 
     def invokeMaven(self, args):
         '''Invoke Maven with the given ``args``.'''
-        argv = ['mvn', '--quiet', '--update-snapshots'] + args
-        return invoke(argv)
+        invoke(self.mavenArgv(args))
+
+    def mavenArgv(self, args):
+        '''Make the command line that invokes Maven with the given ``args``.'''
+        return ['mvn', '--quiet', '--update-snapshots'] + args
+
+    def plan_commit_poms(self, message):
+        '''Return the command lines ``commit_poms`` would invoke'''
+        return plan_git_config() + [
+            ['git', 'add', '«each pom.xml»'],
+            ['git', 'commit', '--allow-empty', '--message', message],
+        ]
 
     def commit_poms(self, message):
-        '''Commit all poms to the HEAD of main (or whatever branch) with the given ``message``.'''
-        git_config()
+        '''Commit all poms to the HEAD of main (or whatever branch) with the given ``message``; the
+        context's git transaction pushes them later.
+        '''
+        transaction = self.getTransaction()
         for folder, subdirs, filenames in os.walk(self.assembly.context.cwd):
             for fn in filenames:
                 if fn == 'pom.xml':
                     path = os.path.join(folder, fn)
                     try:
-                        invokeGIT(['add', path])
+                        transaction.add(path)
                     except InvokedProcessError:
                         # #87: we may have just tried to add a generated pom.xml which is in the ``.gitignore``
                         # file. No need to add it! Just treat this softly and continue on.
                         _logger.info('🤫 Ignoring ``git add`` on %s', path)
-        invokeGIT(['commit', '--allow-empty', '--message', message])
 
         # To resolve #76, @jordnpadams removed the ``--force`` from the git invocation below ↓
         #
@@ -92,11 +104,14 @@ class _MavenStep(Step):
         # https://github.com/actions/checkout/issues/317
 
         # NASA-PDS/roundup-action#160 — push to the named branch reference
-        invokeGIT(['push', 'origin', f'HEAD:{self.get_branch_ref()}'])
+        transaction.commit(message, self.get_branch_ref())
 
 
 class _PreparationStep(Step):
     '''Step that prepares for future steps by setting up Maven and code signing.'''
+    reads  = frozenset()
+    writes = frozenset({Resource.environment})
+
     def _createSettingsXML(self):
         '''Create a Maven-compatible ``settings.xml`` file for future use by
         ``Step``s created by this context.
@@ -168,14 +183,25 @@ class _PreparationStep(Step):
         self._createSettingsXML()
         self._createKeyring()
 
+    def plan(self):
+        return plan_git_config() + [['gpg', '--batch', '--yes', '--import']]
+
 
 class _UnitTestStep(_MavenStep):
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.dist})
+
     def execute(self):
         _logger.debug('Maven unit test step')
         self.invokeMaven(self.assembly.context.args.maven_test_phases.split(','))
 
+    def plan(self):
+        return [self.mavenArgv(self.assembly.context.args.maven_test_phases.split(','))]
+
 
 class _IntegrationTestStep(_MavenStep):
+    reads = writes = frozenset()
+
     def execute(self):
         _logger.debug('Maven integration test step; TBD')
 
@@ -188,20 +214,34 @@ class _DocsStep(_MavenStep):
     to package the software in case there are sub-module dependencies,
     build the site as normal, and aggregate the docs (site:stage)
     '''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.dist, Resource.docs})
+
     def execute(self):
         _logger.debug('Maven docs step')
         self.invokeMaven(self.assembly.context.args.maven_doc_phases.split(','))
 
+    def plan(self):
+        return [self.mavenArgv(self.assembly.context.args.maven_doc_phases.split(','))]
+
 
 class _BuildStep(_MavenStep):
     '''Maven build step.'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.dist})
+
     def execute(self):
         _logger.debug('Maven build step')
         self.invokeMaven(self.assembly.context.args.maven_build_phases.split(','))
 
+    def plan(self):
+        return [self.mavenArgv(self.assembly.context.args.maven_build_phases.split(','))]
+
 
 class _GitHubReleaseStep(_MavenStep):
     '''Maven GitHub release step.'''
+    reads  = frozenset({Resource.dist, Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.release, Resource.workspace})
 
     def _prune_dev_tags(self):
         '''Remove all ``SNAPSHOT`` tags.'''
@@ -216,7 +256,7 @@ class _GitHubReleaseStep(_MavenStep):
 
     def _tag_release(self):
         _logger.debug('🏷 Tagging the release')
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             _logger.debug('🕊 Cannot determine what tag we are currently on, so skipping re-tagging')
             return
@@ -231,8 +271,8 @@ class _GitHubReleaseStep(_MavenStep):
         _logger.debug('🆕 New GitHub tag will be %s and pom version will be %s', tag, pom_version)
         self.invokeMaven([_backupPomsFlag, f'-DnewVersion={major}.{minor}.{micro}', _mavenVersionSetCommand])
         self.commit_poms(f'Stable release {pom_version} in poms')
-        invokeGIT(['tag', '--annotate', '--force', '--message', f'Tag release {tag}', tag])
-        invokeGIT(['push', '--tags'])
+        self.getTransaction().tag(tag, f'Tag release {tag}')
+        self.record(githubTag=tag)
 
     def execute(self):
         _logger.debug('maven-release release step')
@@ -251,25 +291,57 @@ class _GitHubReleaseStep(_MavenStep):
 
         self._prune_dev_tags()
         if not self.assembly.isStable():
+            self.getTransaction().sync()
             invoke(['maven-release', '--snapshot', '--token', token])
             self._prune_release_tags()
         else:  # it's stable release
             self._tag_release()
+            # The release tool works from what's on GitHub, so everything so far has to be there
+            self.getTransaction().sync()
             invoke(['maven-release', '--token', token])
 
+    def plan(self):
+        if not self.getToken(): return []
+        commands = plan_delete_tags('*SNAPSHOT*')
+        if not self.assembly.isStable():
+            commands.extend(self.getTransaction().plan_sync(self.plan_branch_ref()))
+            commands.append(['maven-release', '--snapshot', '--token', '«token»'])
+            commands.extend(plan_delete_tags('release/*'))
+        else:
+            commands.extend([
+                ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+                self.mavenArgv([_backupPomsFlag, '-DnewVersion=«X.Y.Z»', _mavenVersionSetCommand]),
+            ])
+            commands.extend(self.plan_commit_poms('Stable release «X.Y.Z» in poms'))
+            commands.append(['git', 'tag', '--annotate', '--force', '--message', 'Tag release «vX.Y.Z»', '«vX.Y.Z»'])
+            commands.extend(self.getTransaction().plan_sync(self.plan_branch_ref()))
+            commands.append(['maven-release', '--token', '«token»'])
+        return commands
+
 
 class _ArtifactPublicationStep(_MavenStep):
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.dist, Resource.docs, Resource.release})
+    background = True
+
     def execute(self):
         _logger.debug('❗️ Before I run `mvn deploy`, here is what the pom.xml looks like as far as <version>')
         with open('pom.xml', 'r') as f:
             for 𝐋 in f:
                 if 'version' in 𝐋: _logger.debug(f'“{𝐋.strip()}”')
+        self.invokeMaven(self._args())
+
+    def plan(self):
+        return [self.mavenArgv(self._args())]
+
+    def _args(self):
+        '''Get the Maven arguments for publishing artifacts'''
         if self.assembly.isStable():
             args = ['--errors', '--activate-profiles', 'release']
             args.extend(self.assembly.context.args.maven_stable_artifact_phases.split(','))
-            self.invokeMaven(args)
+            return args
         else:
-            self.invokeMaven(self.assembly.context.args.maven_unstable_artifact_phases.split(','))
+            return self.assembly.context.args.maven_unstable_artifact_phases.split(',')
 
 
 class _DocPublicationStep(DocPublicationStep):
@@ -294,13 +366,16 @@ class _DocPublicationStep(DocPublicationStep):
 
 class _VersionBumpingStep(_MavenStep):
     '''Step that sets a version number as needed.'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.workspace})
+
     def execute(self):
         '''Set the version number.'''
         if not self.assembly.isStable():
             _logger.debug('Skipping version bump for unstable build')
             return
 
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             raise RoundupError('🕊 Cannot determine the release tag so version bump fail')
         match = TAG_RE.match(tag)
@@ -310,6 +385,7 @@ class _VersionBumpingStep(_MavenStep):
         full_version = f'{major}.{minor}.{micro}'
         _logger.debug('🔖 So we got version %s', full_version)
         add_version_label_to_open_bugs(full_version)
+        self.record(version=full_version, releaseTag=tag)
         if micro is None:
             raise RoundupError('Invalid release version supplied in tag name. You must supply Major.Minor.Micro')
         self.invokeMaven([_backupPomsFlag, f'-DnewVersion={major}.{minor}.{micro}', _mavenVersionSetCommand])
@@ -318,9 +394,19 @@ class _VersionBumpingStep(_MavenStep):
             for 𝐋 in f:
                 if 'version' in 𝐋: _logger.debug(f'“{𝐋.strip()}”')
 
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return [
+            ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+            self.mavenArgv([_backupPomsFlag, '-DnewVersion=«X.Y.Z»', _mavenVersionSetCommand]),
+        ]
+
 
 class _VersionCommittingStep(_MavenStep):
     '''Step that commits the new version, as needed.'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         '''Commit the new version number.'''
         if not self.assembly.isStable():
@@ -332,9 +418,16 @@ class _VersionCommittingStep(_MavenStep):
                 if 'version' in 𝐋: _logger.debug(f'“{𝐋.strip()}”')
         self.commit_poms('Committing poms for stable release')
 
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return self.plan_commit_poms('Committing poms for stable release')
+
 
 class _CleanupStep(_MavenStep):
     '''Step that tidies up.'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         _logger.debug('Maven cleanup step')
 
@@ -343,10 +436,10 @@ class _CleanupStep(_MavenStep):
             return
 
         # NASA-PDS/roundup-action#99: delete the release/X.Y.Z tag
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             raise RoundupError('🏷 Cannot determine the release tag at cleanup step')
-        invokeGIT(['push', 'origin', f':{tag}'])
+        self.getTransaction().delete_tag(tag)
 
         pomVersion = self.getVersionFromPOM()
         match = re.match(r'(\d+)\.(\d+)\.(\d+)', pomVersion)
@@ -359,9 +452,19 @@ class _CleanupStep(_MavenStep):
         self.invokeMaven([_backupPomsFlag, f'-DnewVersion={newVersion}', _mavenVersionSetCommand])
         self.commit_poms(f'Setting snapshot version for {major}.{minor}.{micro}-SNAPSHOT')
 
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return [
+            ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+            self.mavenArgv([_backupPomsFlag, '-DnewVersion=«X.Y+1.0-SNAPSHOT»', _mavenVersionSetCommand]),
+        ] + self.plan_commit_poms('Setting snapshot version for «X.Y+1.Z»-SNAPSHOT')
+
 
 class ChangeLogStep(BaseChangeLogStep):
     def execute(self):
         _logger.debug('Maven changelog step')
         delete_tags('*SNAPSHOT*')
         super().execute()
+
+    def plan(self):
+        return plan_delete_tags('*SNAPSHOT*') + super().plan()
@@ -4,8 +4,9 @@
 
 from .context import Context
 from .errors import RoundupError, InvokedProcessError
-from .step import Step, StepName, NullStep, RequirementsStep, DocPublicationStep, ChangeLogStep as BaseChangeLogStep
-from .util import git_config, invoke, invokeGIT, TAG_RE, add_version_label_to_open_bugs, commit, delete_tags
+from .step import Resource, Step, StepName, NullStep, RequirementsStep, DocPublicationStep, ChangeLogStep as BaseChangeLogStep
+from .util import git_config, invoke, TAG_RE, add_version_label_to_open_bugs, delete_tags
+from .util import git_describe_tag, plan_delete_tags, plan_git_config
 import shutil, logging, os, json, re
 
 _logger = logging.getLogger(__name__)
@@ -65,6 +66,9 @@ class _NodeJSStep(Step):
 
 class _PreparationStep(_NodeJSStep):
     '''Prepare the python repository for action.'''
+    reads  = frozenset({Resource.workspace})
+    writes = frozenset({Resource.environment, Resource.workspace})
+
     def _make_npmrc(self):
         token = os.getenv('NPMJS_COM_TOKEN')
         if not token:
@@ -102,30 +106,50 @@ npmScopes:
 
         # ☑️ TODO: what other prep steps are there?
 
+    def plan(self):
+        return plan_git_config() + [['npm', 'install']]
+
 
 class _UnitTestStep(_NodeJSStep):
     '''Unit test step, bruh.'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset()
+
     def execute(self):
         _logger.debug('Node.js unit test step')
         invoke(['npm', 'test'])
 
+    def plan(self):
+        return [['npm', 'test']]
+
 
 class _IntegrationTestStep(_NodeJSStep):
     '''A step to take for integration tests with Node.js; what actually happens here is yet
     to be determined.
     '''
+    reads = writes = frozenset()
+
     def execute(self):
         _logger.debug('Node.js integration test step; TBD')
 
 
 class _DocsStep(_NodeJSStep):
     '''A step that uses JSDoc (invoked by ``npm docs``) to generate documentation'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.docs})
+
     def execute(self):
         invoke(['npm', 'run', 'jsdoc'])
 
+    def plan(self):
+        return [['npm', 'run', 'jsdoc']]
+
 
 class _VersionBumpingStep(_NodeJSStep):
     '''Bump the version but do not commit it (yet).'''
+    reads  = frozenset({Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.workspace})
+
     def execute(self):
         if not self.assembly.isStable():
             _logger.debug('Skipping version bump for unstable build')
@@ -134,7 +158,7 @@ class _VersionBumpingStep(_NodeJSStep):
         # Figure out the tag name; we use ``--tags`` to pick up all tags, not just the annotated
         # ones. This'll help reduce erros by users who forget to annotate (``-a`` or ``--annoate``)
         # their tags. The ``--abbrev 0`` truncates any post-tag commits
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
 
         if not tag:
             raise RoundupError('🕊 Cannot determine the release tag; version bump failed')
@@ -151,20 +175,37 @@ class _VersionBumpingStep(_NodeJSStep):
             raise RoundupError('Invalid release version supplied in tag name. You must supply Major.Minor.Micro')
 
         add_version_label_to_open_bugs(full_version)
+        self.record(version=full_version, releaseTag=tag)
         self.write_version_number(full_version)
 
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return [['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*']]
+
 
 class _VersionCommittingStep(_NodeJSStep):
     '''Commit the bumped version.'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         if not self.assembly.isStable():
             _logger.debug('Skipping version commit for unstable build')
             return
-        commit('package.json', 'Commiting package.json for stable release', self.get_branch_ref())
+        self.getTransaction().commit_file('package.json', 'Commiting package.json for stable release', self.get_branch_ref())
+
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return self.getTransaction().plan_commit_file(
+            'package.json', 'Commiting package.json for stable release', self.plan_branch_ref()
+        )
 
 
 class _BuildStep(_NodeJSStep):
     '''A step that makes an installable package.'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.dist, Resource.workspace})
+
     def execute(self):
         if self.assembly.isStable():
             # The package.json should already have the "stable" version number from the _VersionBumpingStep
@@ -177,10 +218,16 @@ class _BuildStep(_NodeJSStep):
             self.write_version_number(unstable_version)
             invoke(['npm', 'run', 'build'])
 
+    def plan(self):
+        return [['npm', 'run', 'build']]
+
 
 class _GitHubReleaseStep(_NodeJSStep):
     '''A step that releases software to GitHub
     '''
+    reads  = frozenset({Resource.dist, Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.release})
+
     def _pruneDev(self):
         '''Get rid of any "dev" tags. Apparently we want to do this always; see
         https://github.com/NASA-PDS/roundup-action/issues/32#issuecomment-776309904
@@ -194,7 +241,7 @@ class _GitHubReleaseStep(_NodeJSStep):
     def _tagRelease(self):
         '''Tag the current release using the v1.2.3-style tag based on the release/1.2.3-style tag.'''
         _logger.debug('🏷 Tagging the release')
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             _logger.debug('🕊 Cannot determine what tag we are currently on, so skipping re-tagging')
             return
@@ -207,8 +254,8 @@ class _GitHubReleaseStep(_NodeJSStep):
         # roundup-action#90: we no longer bump the version number; just re-tag at the current HEAD
         tag = f'v{major}.{minor}.{micro}'
         _logger.debug('🆕 New tag will be %s', tag)
-        invokeGIT(['tag', '--annotate', '--force', '--message', f'Tag release {tag}', tag])
-        invokeGIT(['push', '--tags'])
+        self.getTransaction().tag(tag, f'Tag release {tag}')
+        self.record(githubTag=tag)
 
     def execute(self):
         '''Execute the Node.js GitHub release step'''
@@ -220,14 +267,36 @@ class _GitHubReleaseStep(_NodeJSStep):
         self._pruneDev()
         if self.assembly.isStable():
             self._tagRelease()
+            # The release tool works from what's on GitHub, so everything so far has to be there
+            self.getTransaction().sync()
             invoke(['/usr/local/bin/nodejs-release', '--debug', '--token', token])
         else:  # It's unstable release
+            self.getTransaction().sync()
             invoke(['/usr/local/bin/nodejs-release', '--debug', '--snapshot', '--token', token])
             self._pruneReleaseTags()
 
+    def plan(self):
+        if not self.getToken(): return []
+        commands = plan_delete_tags('*dev*')
+        if self.assembly.isStable():
+            commands.extend([
+                ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+                ['git', 'tag', '--annotate', '--force', '--message', 'Tag release «vX.Y.Z»', '«vX.Y.Z»'],
+            ])
+            commands.extend(self.getTransaction().plan_sync(self.plan_branch_ref()))
+            commands.append(['/usr/local/bin/nodejs-release', '--debug', '--token', '«token»'])
+        else:
+            commands.extend(self.getTransaction().plan_sync(self.plan_branch_ref()))
+            commands.append(['/usr/local/bin/nodejs-release', '--debug', '--snapshot', '--token', '«token»'])
+            commands.extend(plan_delete_tags('release/*'))
+        return commands
+
 
 class _ArtifactPublicationStep(_NodeJSStep):
     '''A step that publishes artifacts to the npmjs.com'''
+    reads  = frozenset({Resource.dist, Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.release, Resource.workspace})
+
     def execute(self):
         try:
             if self.assembly.isStable():
@@ -246,7 +315,7 @@ class _ArtifactPublicationStep(_NodeJSStep):
                 major, minor, micro = int(match.group(1)), int(match.group(2)), int(match.group(3)) + 1
                 self.write_version_number(f'{major}.{minor}.{micro}-unstable')
                 argv = ['npm', 'publish', '--verbose', '--access', 'public']
-                commit(
+                self.getTransaction().commit_file(
                     'package.json', f'Committing bumped version № {major}.{minor}.{micro} for unstable assembly',
                     self.get_branch_ref()
                 )
@@ -255,6 +324,15 @@ class _ArtifactPublicationStep(_NodeJSStep):
             # For unstalbe releases, we ignore this
             if self.assembly.isStable(): raise
 
+    def plan(self):
+        commands = []
+        if not self.assembly.isStable():
+            commands.extend(self.getTransaction().plan_commit_file(
+                'package.json', 'Committing bumped version № «X.Y.Z+1» for unstable assembly', self.plan_branch_ref()
+            ))
+        commands.append(['npm', 'publish', '--verbose', '--access', 'public'])
+        return commands
+
 
 class _DocPublicationStep(DocPublicationStep):
 
@@ -266,6 +344,9 @@ class _CleanupStep(_NodeJSStep):
 
     At this point we're cleaing up so errors are not longer considered awful.
     '''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         _logger.debug('Node.js cleanup step')
         if not self.assembly.isStable():
@@ -273,10 +354,10 @@ class _CleanupStep(_NodeJSStep):
             return
 
         # NASA-PDS/roundup-action#99: delete the release/X.Y.Z tag
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             raise RoundupError('🏷 Cannot determine the release tag at cleanup step')
-        invokeGIT(['push', 'origin', f':{tag}'])
+        self.getTransaction().delete_tag(tag)
 
         version = self.read_package_metadata()['version']
         match = re.match(r'(\d+)\.(\d+)\.(\d+)', version)
@@ -288,7 +369,15 @@ class _CleanupStep(_NodeJSStep):
         new_version = f'{major}.{minor}.0'
         _logger.debug('🔖 Setting version %s in package.json', new_version)
         self.write_version_number(new_version)
-        commit('package.json', f'Setting next dev version to {new_version}', self.get_branch_ref())
+        self.getTransaction().commit_file('package.json', f'Setting next dev version to {new_version}', self.get_branch_ref())
+
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return [
+            ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+        ] + self.getTransaction().plan_commit_file(
+            'package.json', 'Setting next dev version to «X.Y+1.0»', self.plan_branch_ref()
+        )
 
 
 class ChangeLogStep(BaseChangeLogStep):
@@ -296,3 +385,6 @@ class ChangeLogStep(BaseChangeLogStep):
         _logger.debug('Node.js changelog step')
         delete_tags('*dev*')
         super().execute()
+
+    def plan(self):
+        return plan_delete_tags('*dev*') + super().plan()
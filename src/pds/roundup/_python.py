@@ -6,14 +6,23 @@ from .context import Context
 from .errors import InvokedProcessError, RoundupError
 from .errors import MissingEnvVarError
 from .step import ChangeLogStep as BaseChangeLogStep
-from .step import Step, StepName, NullStep, RequirementsStep, DocPublicationStep
-from .util import invoke, invokeGIT, TAG_RE, commit, delete_tags, git_config, add_version_label_to_open_bugs
+from .step import Resource, Step, StepName, NullStep, RequirementsStep, DocPublicationStep
+from .util import invoke, TAG_RE, delete_tags, git_config, add_version_label_to_open_bugs
+from .util import git_describe_tag, plan_delete_tags, plan_git_config
 from ._detectives import TextFileDetective
+from . import builder, testing, venvcache, wheelhouse
 import logging, os, re, shutil
 
 _logger = logging.getLogger(__name__)
 
 
+# Constants
+# =========
+
+# What to install of the project being rounded up
+_projectRequirements = ['--editable', '.[dev]']
+
+
 class PythonContext(Context):
     '''A Python context supports Python software proejcts'''
     def __init__(self, cwd, environ, args):
@@ -56,62 +65,115 @@ class _PythonStep(Step):
         if not password: raise MissingEnvVarError('pypi_password')
         return username, password
 
+    def venvBin(self, name=''):
+        '''Get the path to the executable ``name`` in the venv made by the preparation step, or
+        to the venv's ``bin`` directory itself if ``name`` is empty.
+        '''
+        return os.path.join(self.assembly.context.cwd, 'venv', 'bin', name)
+
 
 class _PreparationStep(_PythonStep):
     '''Prepare the python repository for action.'''
+    reads  = frozenset({Resource.workspace})
+    writes = frozenset({Resource.environment, Resource.workspace})
+
     def execute(self):
         git_config()
+        context = self.assembly.context
+        key = venvcache.key(context.cwd, venvcache.describePython(), getattr(context.args, 'packages', None))
+        cache = venvcache.VenvCache(context.getStateDir('venvs'))
         shutil.rmtree('venv', ignore_errors=True)
-        # We add access to system site packages so that projects can save time if they need numpy, pandas, etc.
-        invoke(['python', '-m', 'venv', '--system-site-packages', 'venv'])
         # Do the pseudo-equivalent of ``activate``:
-        venvBin = os.path.abspath(os.path.join(self.assembly.context.cwd, 'venv', 'bin'))
+        venvBin = os.path.abspath(self.venvBin())
         os.environ['PATH'] = f'{venvBin}:{os.environ["PATH"]}'
+        self.record(venvCacheKey=key)
+        if cache.restore(key, context.cwd):
+            # Nothing the project depends on changed, so all that's left is the project itself
+            _logger.info('♻️ Reusing the cached venv; just installing the project into it')
+            invoke([self.venvBin('pip'), 'install', '--quiet', '--no-deps', '--editable', '.'])
+            return
+        # We add access to system site packages so that projects can save time if they need numpy, pandas, etc.
+        invoke(['python', '-m', 'venv', '--system-site-packages', 'venv'])
         # Make sure we have the latest of pip+setuptools+wheel
-        invoke(['/github/workspace/venv/bin/pip', 'install', '--quiet', '--upgrade', 'pip', 'setuptools', 'wheel'])
+        invoke([self.venvBin('pip'), 'install', '--quiet', '--upgrade', 'pip', 'setuptools', 'wheel'])
         # Now install the package being rounded up … it should install its own sphinx-build, but if
-        # not we'll use our own older version (3.2.1 according to github-actions-base)
-        invoke(['/github/workspace/venv/bin/pip', 'install', '--verbose', '--editable', '.[dev]'])
+        # not we'll use our own older version (3.2.1 according to github-actions-base). Its
+        # dependencies come by way of the wheelhouse.
+        wheelhouse.install(self.venvBin('pip'), context.getStateDir('wheelhouse'), context.cwd, _projectRequirements)
+        cache.save(key, context.cwd, 'venv')
         # ☑️ TODO: what other prep steps are there? What about VERSION.txt overwriting?
 
+    def plan(self):
+        # Whether the venv cache has a venv for us isn't known until we hash what goes into it
+        return plan_git_config() + venvcache.plan_describePython() + [
+            ['python', '-m', 'venv', '--system-site-packages', 'venv'],
+            [self.venvBin('pip'), 'install', '--quiet', '--upgrade', 'pip', 'setuptools', 'wheel'],
+        ] + wheelhouse.plan_install(self.venvBin('pip'), '«wheelhouse»', _projectRequirements)
+
 
 class _UnitTestStep(_PythonStep):
     '''Unit test step, duh.'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset()
+
     def execute(self):
         _logger.debug('Python unit test step')
-        tox = os.path.abspath(os.path.join(self.assembly.context.cwd, 'venv', 'bin', 'tox'))
+        tox, python = os.path.abspath(self.venvBin('tox')), os.path.abspath(self.venvBin('python'))
         if os.path.isfile(tox):
             _logger.debug('Trying the new way: ``tox``')
-            invoke([tox])
+            testing.runTox(tox, python, testing.cores())
+            # The tox envs passed, so they're worth keeping along with the venv they go with
+            key = self.assembly.context.objects.get('venvCacheKey')
+            if key:
+                context = self.assembly.context
+                venvcache.VenvCache(context.getStateDir('venvs')).save(key, context.cwd, '.tox')
+        elif os.path.isfile(python) and testing.hasModule(python, 'pytest'):
+            _logger.debug('No ``tox`` but there is ``pytest``')
+            testing.runPytest(python, testing.cores())
         else:
             _logger.debug('Trying the old way: ``setup.py test``')
             invoke(['python', 'setup.py', 'test'])
 
+    def plan(self):
+        # The venv doesn't exist until preparation, so we can't tell which way we'll go
+        return [[self.venvBin('tox'), '-e', '«each environment»', '--result-json', '«results»', '--parallel', '«cores»']]
+
 
 class _IntegrationTestStep(_PythonStep):
     '''A step to take for integration tests with Python; what actually happens here is yet
     to be determined.
     '''
+    reads = writes = frozenset()
+
     def execute(self):
         _logger.debug('Python integration test step; TBD')
 
 
 class _DocsStep(_PythonStep):
     '''A step that uses Sphinx to generate documentation'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.docs})
+
     def execute(self):
         _logger.info('📜 Documentation generation which relies on sphinx-build installed in the venv')
         _logger.debug('📜 by the way here is what is in the venv bin')
-        invoke(['ls', '-l', '/github/workspace/venv/bin'])
-        _logger.debug('📜 GOT THAT? Now onto /github/workspace/venv/bin/sphinx-build')
-        invoke(['/github/workspace/venv/bin/sphinx-build', '--version'])
-        invoke(['/github/workspace/venv/bin/sphinx-build', '-a', '-b', 'html', 'docs/source', '/tmp/docs'])
+        invoke(['ls', '-l', self.venvBin()])
+        _logger.debug('📜 GOT THAT? Now onto %s', self.venvBin('sphinx-build'))
+        invoke([self.venvBin('sphinx-build'), '--version'])
+        invoke([self.venvBin('sphinx-build'), '-a', '-b', 'html', 'docs/source', '/tmp/docs'])
         _logger.debug('📜 Documentation generated successfully; here is /tmp/docs')
         invoke(['ls', '-l', '/tmp/docs'])
         _logger.debug('📜 GOT THAT? This step is now done.')
 
+    def plan(self):
+        return [[self.venvBin('sphinx-build'), '-a', '-b', 'html', 'docs/source', '/tmp/docs']]
+
 
 class _VersionBumpingStep(_PythonStep):
     '''Bump the version but do not commit it (yet).'''
+    reads  = frozenset({Resource.gitRefs})
+    writes = frozenset({Resource.workspace})
+
     def execute(self):
         if not self.assembly.isStable():
             _logger.debug('Skipping version bump for unstable build')
@@ -120,7 +182,7 @@ class _VersionBumpingStep(_PythonStep):
         # Figure out the tag name; we use ``--tags`` to pick up all tags, not just the annotated
         # ones. This'll help reduce erros by users who forget to annotate (``-a`` or ``--annoate``)
         # their tags. The ``--abbrev 0`` truncates any post-tag commits
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
 
         if not tag:
             raise RoundupError('🕊 Cannot determine the release tag; version bump failed')
@@ -137,6 +199,7 @@ class _VersionBumpingStep(_PythonStep):
             raise RoundupError('Invalid release version supplied in tag name. You must supply Major.Minor.Micro')
 
         add_version_label_to_open_bugs(full_version)
+        self.record(version=full_version, releaseTag=tag)
         _logger.debug("Locating VERSION.txt to update with new release version.")
         try:
             version_file = TextFileDetective.locate_file(self.assembly.context.cwd)
@@ -151,9 +214,16 @@ class _VersionBumpingStep(_PythonStep):
             with open(version_file, 'w') as inp:
                 inp.write(f'{major}.{minor}.{micro}\n')
 
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return [['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*']]
+
 
 class _VersionCommittingStep(_PythonStep):
     '''Commit the bumped version.'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         if not self.assembly.isStable():
             _logger.debug('Skipping version commit for unstable build')
@@ -169,21 +239,39 @@ class _VersionCommittingStep(_PythonStep):
             _logger.debug(msg)
             raise RoundupError(msg)
 
-        commit(version_file, f'Commiting {version_file} for stable release', self.get_branch_ref())
+        self.getTransaction().commit_file(version_file, f'Commiting {version_file} for stable release', self.get_branch_ref())
+
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return self.getTransaction().plan_commit_file(
+            '«VERSION.txt»', 'Commiting «VERSION.txt» for stable release', self.plan_branch_ref()
+        )
 
 
 class _BuildStep(_PythonStep):
     '''A step that makes a Python wheel (of cheese)'''
+    reads  = frozenset({Resource.environment, Resource.workspace})
+    writes = frozenset({Resource.dist, Resource.workspace})
+
     def execute(self):
-        if self.assembly.isStable():
-            invoke(['python', 'setup.py', 'bdist_wheel'])
-        else:
-            invoke(['python', 'setup.py', 'egg_info', '--tag-build', 'dev', 'bdist_wheel'])
+        context = self.assembly.context
+        builder.build(
+            context.getStateDir('buildenvs'), context.getStateDir('wheelhouse'), context.cwd, not self.assembly.isStable()
+        )
+        dists = os.path.join(context.cwd, 'dist')
+        if os.path.isdir(dists):
+            self.record(dists=sorted(os.listdir(dists)))
+
+    def plan(self):
+        return builder.plan_build()
 
 
 class _GitHubReleaseStep(_PythonStep):
     '''A step that releases software to GitHub
     '''
+    reads  = frozenset({Resource.dist, Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.release})
+
     def _pruneDev(self):
         '''Get rid of any "dev" tags. Apparently we want to do this always; see
         https://github.com/NASA-PDS/roundup-action/issues/32#issuecomment-776309904
@@ -197,7 +285,7 @@ class _GitHubReleaseStep(_PythonStep):
     def _tagRelease(self):
         '''Tag the current release using the v1.2.3-style tag based on the release/1.2.3-style tag.'''
         _logger.debug('🏷 Tagging the release')
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             _logger.debug('🕊 Cannot determine what tag we are currently on, so skipping re-tagging')
             return
@@ -210,8 +298,8 @@ class _GitHubReleaseStep(_PythonStep):
         # roundup-action#90: we no longer bump the version number; just re-tag at the current HEAD
         tag = f'v{major}.{minor}.{micro}'
         _logger.debug('🆕 New tag will be %s', tag)
-        invokeGIT(['tag', '--annotate', '--force', '--message', f'Tag release {tag}', tag])
-        invokeGIT(['push', '--tags'])
+        self.getTransaction().tag(tag, f'Tag release {tag}')
+        self.record(githubTag=tag)
 
     def execute(self):
         '''Execute the Python GitHub release step'''
@@ -223,35 +311,43 @@ class _GitHubReleaseStep(_PythonStep):
         self._pruneDev()
         if self.assembly.isStable():
             self._tagRelease()
+            # The release tool works from what's on GitHub, so everything so far has to be there
+            self.getTransaction().sync()
             invoke(['/usr/local/bin/python-release', '--debug', '--token', token])
         else:  # It's unstable release
+            self.getTransaction().sync()
             invoke(['/usr/local/bin/python-release', '--debug', '--snapshot', '--token', token])
             self._pruneReleaseTags()
 
+    def plan(self):
+        if not self.getToken(): return []
+        commands = plan_delete_tags('*dev*')
+        if self.assembly.isStable():
+            commands.extend([
+                ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+                ['git', 'tag', '--annotate', '--force', '--message', 'Tag release «vX.Y.Z»', '«vX.Y.Z»'],
+            ])
+            commands.extend(self.getTransaction().plan_sync(self.plan_branch_ref()))
+            commands.append(['/usr/local/bin/python-release', '--debug', '--token', '«token»'])
+        else:
+            commands.extend(self.getTransaction().plan_sync(self.plan_branch_ref()))
+            commands.append(['/usr/local/bin/python-release', '--debug', '--snapshot', '--token', '«token»'])
+            commands.extend(plan_delete_tags('release/*'))
+        return commands
+
 
 class _ArtifactPublicationStep(_PythonStep):
     '''A step that publishes artifacts to the Cheeseshop'''
+    reads  = frozenset({Resource.dist, Resource.environment})
+    writes = frozenset({Resource.release})
+    background = True
+
     def execute(self):
         # 😮 TODO: It'd be more secure to use PyPI access tokens instead of usernames and passwords!
 
         _logger.info('❓ Just what version of twine is this?')
         invoke(['/usr/local/bin/twine', '--version'])
-        argv = [
-            '/usr/local/bin/twine',
-            'upload',
-            '--verbose',
-            '--username',
-            self.getCheeseshopCredentials()[0],
-            '--password',
-            self.getCheeseshopCredentials()[1],
-            '--non-interactive',
-            '--comment',
-            "🤠 Yee-haw! This here ar-tee-fact got done uploaded by the Roundup!",
-            '--skip-existing',
-            '--disable-progress-bar',
-            '--repository-url',
-            self.getCheeseshopURL()
-        ]
+        argv = self._argv(*self.getCheeseshopCredentials())
         dists = os.path.join(self.assembly.context.cwd, 'dist')
         argv.extend([os.path.join(dists, i) for i in os.listdir(dists) if os.path.isfile(os.path.join(dists, i))])
         # 😮 TODO: Use Twine API directly
@@ -266,6 +362,34 @@ class _ArtifactPublicationStep(_PythonStep):
             # (We really ought to re-think (ab)using test.pypi.org in this way.)
             if self.assembly.isStable(): raise
 
+    def plan(self):
+        dists = os.path.join(self.assembly.context.cwd, 'dist')
+        return [
+            ['/usr/local/bin/twine', '--version'],
+            self._argv('«pypi_username»', '«pypi_password»') + [os.path.join(dists, '«each built file»')],
+        ]
+
+    def _argv(self, username, password):
+        '''Make the command line to upload to the Cheeseshop with the given ``username`` and
+        ``password``, sans the files to upload.
+        '''
+        return [
+            '/usr/local/bin/twine',
+            'upload',
+            '--verbose',
+            '--username',
+            username,
+            '--password',
+            password,
+            '--non-interactive',
+            '--comment',
+            "🤠 Yee-haw! This here ar-tee-fact got done uploaded by the Roundup!",
+            '--skip-existing',
+            '--disable-progress-bar',
+            '--repository-url',
+            self.getCheeseshopURL()
+        ]
+
 
 class _DocPublicationStep(DocPublicationStep):
     default_documentation_dir = '/tmp/docs'
@@ -276,6 +400,9 @@ class _CleanupStep(_PythonStep):
 
     At this point we're cleaing up so errors are not longer considered awful.
     '''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         _logger.debug('Python cleanup step')
         if not self.assembly.isStable():
@@ -283,10 +410,10 @@ class _CleanupStep(_PythonStep):
             return
 
         # NASA-PDS/roundup-action#99: delete the release/X.Y.Z tag
-        tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+        tag = git_describe_tag('release/*')
         if not tag:
             raise RoundupError('🏷 Cannot determine the release tag at cleanup step')
-        invokeGIT(['push', 'origin', f':{tag}'])
+        self.getTransaction().delete_tag(tag)
 
         detective = TextFileDetective(self.assembly.context.cwd)
         version, version_file = detective.detect(), detective.locate_file(self.assembly.context.cwd)
@@ -303,7 +430,15 @@ class _CleanupStep(_PythonStep):
         _logger.debug('🔖 Setting version %s in src/…/VERSION.txt', new_version)
         with open(version_file, 'w') as f:
             f.write(f'{new_version}\n')
-        commit(version_file, f'Setting next dev version to {new_version}', self.get_branch_ref())
+        self.getTransaction().commit_file(version_file, f'Setting next dev version to {new_version}', self.get_branch_ref())
+
+    def plan(self):
+        if not self.assembly.isStable(): return []
+        return [
+            ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+        ] + self.getTransaction().plan_commit_file(
+            '«VERSION.txt»', 'Setting next dev version to «X.Y+1.0»', self.plan_branch_ref()
+        )
 
 
 class ChangeLogStep(BaseChangeLogStep):
@@ -311,3 +446,6 @@ class ChangeLogStep(BaseChangeLogStep):
         _logger.debug('Python changelog step')
         delete_tags('*dev*')
         super().execute()
+
+    def plan(self):
+        return plan_delete_tags('*dev*') + super().plan()
@@ -0,0 +1,217 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Accounting. Keeps tabs on the CPU time, memory, and wall-clock time of every
+process a roundup invokes, charged to the step that invoked it, so we can tell whether a step is
+busy computing, waiting on I/O, or just waiting.'''
+
+from contextlib import contextmanager
+import logging, os, threading, time
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# How often, in seconds, to sample the tree of processes under an invoked process
+_sampleInterval = 0.5
+
+_pageSize  = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_clockTick = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+# Functions
+# =========
+
+_current = threading.local()
+
+
+@contextmanager
+def charging(ledger, name):
+    '''Charge the processes invoked from this thread in the body of a ``with`` statement to the
+    step called ``name`` in the given ``ledger``.
+    '''
+    previous = getattr(_current, 'account', None)
+    _current.account = (ledger, name)
+    try:
+        yield
+    finally:
+        _current.account = previous
+
+
+def _stat(pid):
+    '''Return the parent pid, CPU seconds, and resident bytes of process ``pid`` from ``/proc``, or
+    None if it's gone (or there's no ``/proc``).
+    '''
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            fields = f.read().rsplit(b')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # Fields after the command name start at the state, so field N in proc(5) is fields[N - 3]
+    ppid, utime, stime, rss = int(fields[1]), int(fields[11]), int(fields[12]), int(fields[21])
+    return ppid, (utime + stime) / _clockTick, rss * _pageSize
+
+
+def _tree(root):
+    '''Return the stats of process ``root`` and all its descendants as a mapping of pid to the
+    results of ``_stat``.
+    '''
+    stats = {}
+    try:
+        pids = [int(i) for i in os.listdir('/proc') if i.isdigit()]
+    except OSError:
+        return stats
+    children = {}
+    for pid in pids:
+        stat = _stat(pid)
+        if stat is None: continue
+        stats[pid] = stat
+        children.setdefault(stat[0], []).append(pid)
+    tree, frontier = {}, [root]
+    while frontier:
+        pid = frontier.pop()
+        if pid in stats:
+            tree[pid] = stats[pid]
+            frontier.extend(children.get(pid, []))
+    return tree
+
+
+# Classes
+# =======
+
+class Usage(object):
+    '''Resources used by one or more invoked processes: wall-clock, user, and system seconds; the
+    peak resident set size in bytes of the process itself and of its whole process tree; and the
+    most processes seen in the tree at once.
+    '''
+    def __init__(self, wall=0.0, user=0.0, system=0.0, peakRSS=0, treeRSS=0, processes=0):
+        self.wall, self.user, self.system = wall, user, system
+        self.peakRSS, self.treeRSS, self.processes = peakRSS, treeRSS, processes
+
+    def __repr__(self):
+        return (
+            f'<{self.__class__.__name__}(wall={self.wall:.2f},user={self.user:.2f},system={self.system:.2f},'
+            f'peakRSS={self.peakRSS},treeRSS={self.treeRSS})>'
+        )
+
+    def add(self, other):
+        '''Add the ``other`` usage to this one: times add up, peaks take the larger'''
+        self.wall += other.wall
+        self.user += other.user
+        self.system += other.system
+        self.peakRSS = max(self.peakRSS, other.peakRSS)
+        self.treeRSS = max(self.treeRSS, other.treeRSS)
+        self.processes = max(self.processes, other.processes)
+
+
+class _Sampler(threading.Thread):
+    '''A thread that periodically samples the tree of processes under ``pid`` to find its peak
+    memory and how much CPU time its descendants used, including those the root never waits for.
+    '''
+    def __init__(self, pid):
+        super(_Sampler, self).__init__(name=f'sampler-{pid}', daemon=True)
+        self.pid, self.cpu, self.treeRSS, self.processes = pid, {}, 0, 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while True:
+            self.sample()
+            if self._stopped.wait(_sampleInterval): break
+
+    def sample(self):
+        tree = _tree(self.pid)
+        if not tree: return
+        self.treeRSS = max(self.treeRSS, sum(rss for ppid, cpu, rss in tree.values()))
+        self.processes = max(self.processes, len(tree))
+        for pid, (ppid, cpu, rss) in tree.items():
+            self.cpu[pid] = max(self.cpu.get(pid, 0.0), cpu)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Meter(object):
+    '''Measure the process with the given ``pid`` from now until it exits. If the current thread
+    is ``charging`` a step, what we measure goes to it.
+    '''
+    def __init__(self, pid):
+        self.pid, self.start, self.rusage = pid, time.perf_counter(), None
+        self.account = getattr(_current, 'account', None)
+        self.sampler = _Sampler(pid) if self.account else None
+        if self.sampler: self.sampler.start()
+
+    def wait(self, process):
+        '''Wait for the ``subprocess.Popen`` ``process`` we're metering to exit, getting its
+        resource usage along the way, and return its exit status.
+        '''
+        pid, status, self.rusage = os.wait4(self.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode
+
+    def finish(self, details):
+        '''Stop measuring, charge the usage to our step if any, and add it to the trace
+        ``details``. Return the ``Usage``.
+        '''
+        wall = time.perf_counter() - self.start
+        usage = Usage(wall=wall)
+        if self.sampler:
+            self.sampler.stop()
+            usage.treeRSS, usage.processes = self.sampler.treeRSS, self.sampler.processes
+        if self.rusage is not None:
+            # ru_maxrss is in kilobytes on Linux
+            usage.user, usage.system = self.rusage.ru_utime, self.rusage.ru_stime
+            usage.peakRSS = self.rusage.ru_maxrss * 1024
+        elif self.sampler:
+            # Without rusage (like when something else reaped the process) the samples are our best guess
+            usage.user = sum(self.sampler.cpu.values())
+        usage.treeRSS = max(usage.treeRSS, usage.peakRSS)
+        details.update(userSeconds=usage.user, systemSeconds=usage.system, peakRSS=usage.treeRSS)
+        if self.account:
+            ledger, name = self.account
+            ledger.charge(name, usage)
+        return usage
+
+
+class Ledger(object):
+    '''A ledger of the resources used by the processes each step invoked'''
+    def __init__(self):
+        self.entries, self.durations, self.counts, self._lock = {}, {}, {}, threading.Lock()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(#steps={len(self.entries)})>'
+
+    def charge(self, name, usage):
+        '''Charge the given ``usage`` of one process to the step called ``name``'''
+        with self._lock:
+            self.entries.setdefault(name, Usage()).add(usage)
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def close(self, name, duration):
+        '''Note that the step called ``name`` took ``duration`` seconds all told'''
+        with self._lock:
+            self.durations[name] = duration
+
+    def table(self):
+        '''Return a human-readable table of usage by step, or None if there's nothing to tell.
+
+        CPU% is CPU time over the step's duration: near 100% × cores means the step is busy
+        computing; near zero means it's waiting on the network, disk, or something else.
+        '''
+        with self._lock:
+            names = [name for name in self.durations if name in self.entries] + [
+                name for name in self.entries if name not in self.durations
+            ]
+            if not names: return None
+            lines = [
+                f'{"Step":<28}{"Cmds":>5}{"Wall":>10}{"In cmds":>10}{"User":>10}{"Sys":>10}{"CPU%":>7}{"Peak RSS":>11}'
+            ]
+            for name in names:
+                usage, duration = self.entries[name], self.durations.get(name, self.entries[name].wall)
+                cpu = 100.0 * (usage.user + usage.system) / duration if duration else 0.0
+                lines.append(
+                    f'{name:<28}{self.counts[name]:>5}{duration:>9.1f}s{usage.wall:>9.1f}s{usage.user:>9.1f}s'
+                    f'{usage.system:>9.1f}s{cpu:>6.0f}%{usage.treeRSS / 1048576:>8.0f} MiB'
+                )
+            return '\n'.join(lines)
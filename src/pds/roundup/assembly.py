@@ -2,11 +2,26 @@
 
 '''🤠 PDS Roundup: Assemblies. An assembly is responsible for conducting the roundup.'''
 
-from .step import StepName
-import logging
+from .accounting import Ledger, charging
+from .errors import RoundupError
+from .fetching import prefetch
+from .journal import Journal, COMPLETED, FAILED
+from .scheduler import Scheduler
+from .step import Resource, StepName
+from .tracing import tracer
+from .watchdog import deadline
+import logging, time
 
 _logger = logging.getLogger(__name__)
 
+# Resources that live only in the local checkout and its surroundings
+_localResources = frozenset({Resource.dist, Resource.docs, Resource.environment, Resource.workspace})
+
+
+def _stepNames(steps):
+    '''Make a human-readable list of the class names of the given ``steps``'''
+    return ', '.join(step.__class__.__name__ for step in steps) or '(none)'
+
 
 class Assembly(object):
     '''Generic assembly whose job is to do a roundup; subclasses provide refined assembly
@@ -16,7 +31,7 @@ class Assembly(object):
         '''Assemblies have a ``context`` that tells the morphology (location and environment) of
         the roundup and the names of the steps (``stepNames``) they'll need to do
         .'''
-        self.context, self.stepNames = context, stepNames
+        self.context, self.stepNames, self.journal, self.ledger = context, stepNames, None, Ledger()
 
     def __repr__(self):
         return f'<{self.__class__.__name__}(context={self.context},#stepNames={len(self.stepNames)})>'
@@ -27,6 +42,50 @@ class Assembly(object):
             '🤠 Preparing %s roundup for %r with the following steps: %r',
             self.__class__.__name__, self.context, self.stepNames
         )
+        steps = self.createSteps()
+        self.journal = Journal.forAssembly(self)
+        if self.journal is not None and getattr(self.context.args, 'resume', False):
+            steps = self._resume(steps)
+        jobs = getattr(self.context.args, 'jobs', 1) or 1
+        _logger.debug('Executing roundup with up to %d concurrent step(s)', jobs)
+        failed, finished = [], False
+        try:
+            prefetch(steps)
+            completed, failed, not_run = Scheduler(steps, jobs).run(self._execute)
+            finished = True
+        finally:
+            table = self.ledger.table()
+            if table: _logger.info('📊 Resources used by the processes each step invoked:\n%s', table)
+            # Whatever the steps committed and tagged goes to origin now, even if a later step
+            # failed—just like when each step pushed its own
+            try:
+                self._sync(quietly=bool(failed) or not finished)
+            finally:
+                self.context.close()
+        if failed:
+            failedSteps = [step for step, ex in failed]
+            _logger.critical(
+                '💥 Roundup failed at step: %s\n'
+                '  ✅ Completed (%d): %s\n'
+                '  ❌ Failed    (%d): %s\n'
+                '  ⏭  Not run  (%d): %s',
+                failedSteps[0].__class__.__name__,
+                len(completed),
+                _stepNames(completed),
+                len(failedSteps),
+                _stepNames(failedSteps),
+                len(not_run),
+                _stepNames(not_run),
+            )
+            # Steps running alongside the first failure may have failed too; make sure we hear about them
+            for step, ex in failed[1:]:
+                _logger.error('💥 Step %s also failed', step.__class__.__name__, exc_info=ex)
+            raise failed[0][1]
+
+    def createSteps(self):
+        '''Create the steps of this assembly fitted to our context, skipping any the context
+        doesn't have.
+        '''
         steps = []
         for stepName in self.stepNames:
             _logger.debug("Creating step %s", stepName)
@@ -36,28 +95,62 @@ class Assembly(object):
                 steps.append(step)
             else:
                 _logger.info('For context %r no step was available for %s; ignoring this step', self.context, stepName)
-        _logger.debug('Executing roundup')
-        completed = []
+        return steps
+
+    def _sync(self, quietly):
+        '''Push what the steps left in the context's git transaction. If ``quietly``, because the
+        roundup is already failing, a failed push is only logged so it doesn't hide why.
+        '''
+        try:
+            self.context.transaction.sync()
+        except (Exception, RoundupError):
+            if not quietly: raise
+            _logger.exception('💥 Could not push the commits and tags of this roundup')
+
+    def _resume(self, steps):
+        '''Pick up where an earlier roundup of the same commit left off: return which of the
+        ``steps`` still need doing according to our journal.
+
+        Completed steps are skipped, and the facts they recorded are restored to the context.
+        But a completed step whose only effects are local ones—a venv, built artifacts, a
+        bumped version file—runs again if a step yet to run needs what it made, because
+        that doesn't survive into a fresh checkout.
+        '''
+        if not self.journal.load():
+            _logger.info('📓 No journal of an earlier roundup at %s, so starting from the top', self.journal.path)
+            return steps
+        pending = [step for step in steps if not self.journal.isCompleted(step)]
+        remaining = []
         for step in steps:
-            _logger.info("🏎▁▂▃▄▅▆▆▇▇██💨 EXECUTING step %s", step.__class__.__name__)
-            try:
-                step.execute()
-                completed.append(step)
-            except Exception:
-                not_run = [s for s in steps if s not in completed and s is not step]
-                _logger.critical(
-                    '💥 Roundup failed at step: %s\n'
-                    '  ✅ Completed (%d): %s\n'
-                    '  ❌ Failed:        %s\n'
-                    '  ⏭  Not run  (%d): %s',
-                    step.__class__.__name__,
-                    len(completed),
-                    ', '.join(s.__class__.__name__ for s in completed) or '(none)',
-                    step.__class__.__name__,
-                    len(not_run),
-                    ', '.join(s.__class__.__name__ for s in not_run) or '(none)',
-                )
-                raise
+            if step in pending:
+                remaining.append(step)
+            elif step.writes and step.writes <= _localResources and any(step.writes & p.reads for p in pending):
+                _logger.info('🔁 Step %s completed earlier but its work is needed again, so redoing it', step.__class__.__name__)
+                remaining.append(step)
+            else:
+                _logger.info('⏩ Skipping step %s which completed in an earlier roundup', step.__class__.__name__)
+                step.facts.update(self.journal.facts(step))
+                self.context.objects.update(step.facts)
+        return remaining
+
+    def _execute(self, step):
+        '''Execute the single ``step``; the scheduler calls this, possibly from a worker thread.'''
+        _logger.info("🏎▁▂▃▄▅▆▆▇▇██💨 EXECUTING step %s", step.__class__.__name__)
+        name, start = step.__class__.__name__, time.perf_counter()
+        timeouts = getattr(self.context.args, 'step_timeouts', None) or {}
+        stepName = step.name.value if step.name else name
+        seconds = timeouts.get(stepName, timeouts.get(None))
+        try:
+            with tracer().span(name, 'step', context=self.context.label), charging(self.ledger, name), \
+                deadline(stepName, seconds):
+                try:
+                    step.execute()
+                finally:
+                    self.ledger.close(name, time.perf_counter() - start)
+        except BaseException:
+            if self.journal is not None: self.journal.record(step, FAILED, time.perf_counter() - start)
+            raise
+        if self.journal is not None: self.journal.record(step, COMPLETED, time.perf_counter() - start)
 
     def isStable(self):
         '''By default, assemblies will always be for "unstable" or in-development releases, so this
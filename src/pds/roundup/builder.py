@@ -0,0 +1,182 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Builder. Builds a Python project's source distribution and wheel by calling
+its PEP 517 build backend's hooks ourselves, instead of the deprecated ``setup.py bdist_wheel``.
+
+Each build happens in a venv with just the project's ``build-system.requires``, as pip and
+``python -m build`` do, but rather than make a new one every time we keep them in the state
+directory by a hash of those requirements. The sdist and wheel get built at the same time, each
+from its own copy of the source tree so neither trips over the other's ``egg-info`` and ``build``
+directories, and so the tree itself stays tidy. For development versions, the copies' ``setup.cfg``
+gets ``[egg_info] tag_build = dev``, which setuptools applies as it makes the distributions.'''
+
+from . import venvcache, wheelhouse
+from .util import invoke
+from concurrent.futures import ThreadPoolExecutor
+import hashlib, json, logging, os, re, shutil, tempfile, threading
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Bump this when what goes into build environments changes so old ones don't get used
+_format = 1
+
+# Calls a hook of a build backend in the current directory and writes what it returns as JSON,
+# like ``pyproject_hooks`` does; hooks that are optional and missing give their defaults
+_callHook = '''
+import importlib, json, os, sys
+backend, backendPath, hook, args, output = json.loads(sys.argv[1])
+sys.path[:0] = [os.path.abspath(i) for i in backendPath]
+module, _, names = backend.partition(':')
+backend = importlib.import_module(module)
+for name in filter(None, names.split('.')):
+    backend = getattr(backend, name)
+result = getattr(backend, hook)(*args) if hasattr(backend, hook) or not hook.startswith('get_requires_') else []
+with open(output, 'w') as f:
+    json.dump(result, f)
+'''
+
+# What in the top of a source tree doesn't go into the copies we build from
+_notCopied = frozenset({'venv', '.tox', 'build', 'dist', '.git'})
+
+# A section header of ``setup.cfg``, and an existing ``tag_build`` option in it
+_section = re.compile(r'^\[([^\]]+)\]')
+_tagBuildOption = re.compile(r'^tag_build\s*[=:]')
+
+# The sdist and wheel builds share a build environment, so they take turns adding to it
+_installing = threading.Lock()
+
+
+# Functions
+# =========
+
+def _callBackend(python, system, tree, hook, *args):
+    '''Call the ``hook`` with ``args`` of the build ``system``'s backend using the build
+    environment's ``python`` in the source ``tree``, and return what it returns.
+    '''
+    with tempfile.TemporaryDirectory() as scratch:
+        output = os.path.join(scratch, 'output.json')
+        request = [system['build-backend'], system.get('backend-path', []), hook, list(args), output]
+        invoke([python, '-c', _callHook, json.dumps(request)], cwd=tree)
+        with open(output, 'r') as f:
+            return json.load(f)
+
+
+def environment(stateDir, wheelhouseDir, cwd, requires):
+    '''Return the path to a build environment with the ``requires`` installed, making it in
+    ``stateDir`` (with dependencies from the wheelhouse in ``wheelhouseDir``) if we haven't yet.
+    '''
+    description = f'{_format}\0{venvcache.describePython()}\0' + '\0'.join(sorted(requires))
+    env = os.path.join(stateDir, hashlib.sha256(description.encode('utf-8')).hexdigest())
+    ready = os.path.join(env, '.ready')
+    if os.path.isfile(ready):
+        os.utime(env)
+        _logger.debug('♻️ Reusing build environment %s', env)
+        return env
+    _logger.info('🏗 Making a build environment for %s', ', '.join(requires) or 'nothing')
+    shutil.rmtree(env, ignore_errors=True)
+    invoke(['python', '-m', 'venv', env])
+    if requires: wheelhouse.install(os.path.join(env, 'bin', 'pip'), wheelhouseDir, cwd, requires)
+    with open(ready, 'w'):
+        pass
+    venvcache.VenvCache(stateDir).prune()
+    return env
+
+
+def _tagBuild(text):
+    '''Return the ``setup.cfg`` ``text`` with ``[egg_info] tag_build = dev`` set. We edit it as
+    text since ``configparser`` would lowercase its keys, like ``console_scripts`` names and
+    ``data_files`` paths, and drop its comments.
+    '''
+    lines, section, done = [], None, False
+    for line in text.splitlines(keepends=True):
+        header = _section.match(line)
+        if header: section = header.group(1).strip()
+        if section == 'egg_info' and _tagBuildOption.match(line): continue
+        lines.append(line)
+        if header and section == 'egg_info' and not done:
+            lines.append('tag_build = dev\n')
+            done = True
+    if not done:
+        if lines and not lines[-1].endswith('\n'): lines.append('\n')
+        lines.append('\n[egg_info]\ntag_build = dev\n')
+    return ''.join(lines)
+
+
+def _tree(cwd, scratch, name, dev):
+    '''Copy the source tree in ``cwd`` to a directory ``name`` in ``scratch`` and return its path.
+    If ``dev``, have setuptools tag versions built from it as development ones.
+    '''
+    tree = os.path.join(scratch, name)
+
+    def ignore(directory, names):
+        ignored = {i for i in names if i.endswith('.egg-info') or i == '__pycache__'}
+        return ignored | (_notCopied.intersection(names) if directory == cwd else set())
+
+    venvcache.copyTree(cwd, tree, ignore=ignore)
+    # Version control tools like setuptools-scm still need the repository
+    if os.path.exists(os.path.join(cwd, '.git')): os.symlink(os.path.join(cwd, '.git'), os.path.join(tree, '.git'))
+    if dev:
+        setupCfg = os.path.join(tree, 'setup.cfg')
+        try:
+            with open(setupCfg, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = ''
+        # Write a new file rather than into one that might share storage with the original
+        if os.path.exists(setupCfg): os.remove(setupCfg)
+        with open(setupCfg, 'w', encoding='utf-8') as f:
+            f.write(_tagBuild(text))
+    return tree
+
+
+def _build(python, system, tree, kind, outputDir):
+    '''Build a ``kind`` ("sdist" or "wheel") from the source ``tree`` using the build
+    environment's ``python`` into ``outputDir``; return the path to what we built.
+    '''
+    extra = _callBackend(python, system, tree, f'get_requires_for_build_{kind}', {})
+    if extra:
+        # Like setuptools' wanting ``wheel`` for wheels; whatever's already there, pip leaves be
+        with _installing:
+            invoke([python, '-m', 'pip', 'install', '--quiet', *extra])
+    # Outside the tree, lest it end up in the sdist
+    scratch = f'{tree}.out'
+    os.makedirs(scratch)
+    name = _callBackend(python, system, tree, f'build_{kind}', scratch, {})
+    built = os.path.join(outputDir, name)
+    shutil.move(os.path.join(scratch, name), built)
+    return built
+
+
+def build(stateDir, wheelhouseDir, cwd, dev):
+    '''Build the sdist and wheel of the project in ``cwd`` into its ``dist`` directory, both at
+    once, in a build environment kept in ``stateDir``. If ``dev``, they're of a development
+    version. Return the paths to what we built.
+    '''
+    system = wheelhouse.buildSystem(cwd)
+    if dev and not system['build-backend'].startswith('setuptools.'):
+        _logger.warning('⚠️ Cannot tag a %s build as a development version', system['build-backend'])
+    env = environment(stateDir, wheelhouseDir, cwd, system['requires'])
+    python, outputDir = os.path.join(env, 'bin', 'python'), os.path.join(cwd, 'dist')
+    os.makedirs(outputDir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as scratch, ThreadPoolExecutor(max_workers=2, thread_name_prefix='build') as pool:
+        futures = [
+            pool.submit(_build, python, system, _tree(cwd, scratch, kind, dev), kind, outputDir) for kind in ('sdist', 'wheel')
+        ]
+        built = [future.result() for future in futures]
+    _logger.info('📦 Built %s', ', '.join(os.path.basename(i) for i in built))
+    return built
+
+
+def plan_build():
+    '''Return the command lines ``build`` would invoke, assuming it has to make a new build environment'''
+    python = os.path.join('«build environment»', 'bin', 'python')
+    return venvcache.plan_describePython() + [
+        ['python', '-m', 'venv', '«build environment»'],
+    ] + wheelhouse.plan_install(os.path.join('«build environment»', 'bin', 'pip'), '«wheelhouse»', ['«build requirements»']) + [
+        [python, '-c', '«call build_sdist»'],
+        [python, '-c', '«call build_wheel»'],
+    ]
@@ -0,0 +1,210 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Changelogs. Makes a ``CHANGELOG.md`` in the same format github_changelog_generator
+did, but without downloading every issue on every roundup: we keep the issues we've seen in a
+cache and ask GitHub's GraphQL API for just the ones updated since last time, a hundred at a
+time. Tags and their dates come from the local repository, which the roundup's fetch has already
+brought up to date.'''
+
+from .util import git_tag_dates, invokeGIT, parse_timestamp, plan_git_tag_dates
+from urllib.parse import quote
+import datetime, json, logging, os
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# What we keep of each issue, a page at a time; ``filterBy.since`` matches on ``updatedAt``
+_issuesQuery = '''
+query($owner: String!, $name: String!, $since: DateTime, $after: String) {
+  repository(owner: $owner, name: $name) {
+    url
+    issues(first: 100, after: $after, filterBy: {since: $since}, orderBy: {field: UPDATED_AT, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number title url state closedAt updatedAt
+        milestone { title }
+        labels(first: 50) { nodes { name } }
+      }
+    }
+  }
+}
+'''
+
+# Bump this when what we keep of issues changes, so old caches get synced from scratch
+_cacheVersion = 1
+
+# How often to sync every issue anyway, so ones deleted or moved to other repositories go away
+_fullSyncInterval = datetime.timedelta(days=30)
+
+# Characters in issue titles that would otherwise mean something in Markdown
+_escaped = '<>*_()[]#'
+
+# What goes at the end
+_footer = '\\* *This Changelog was automatically generated by [PDS Roundup](https://github.com/NASA-PDS/roundup-action)*'
+
+
+# Classes
+# =======
+
+class IssueCache(object):
+    '''The issues of ``owner``'s ``repo`` as of the last sync, kept in a JSON file in ``cacheDir``'''
+    def __init__(self, cacheDir, owner, repo):
+        self.owner, self.repo = owner, repo
+        self.path = os.path.join(cacheDir, f'{owner}--{repo}.json')
+        self.url, self.synced, self.fullSync, self.issues = None, None, None, {}
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(path={self.path},#issues={len(self.issues)},synced={self.synced})>'
+
+    def load(self):
+        '''Load the cache if there is a usable one; tell if there was'''
+        try:
+            with open(self.path, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get('version') != _cacheVersion: return False
+        self.url, self.synced, self.fullSync = cached['url'], cached['synced'], cached['fullSync']
+        self.issues = {int(number): issue for number, issue in cached['issues'].items()}
+        return True
+
+    def save(self):
+        '''Save the cache, atomically so a roundup running alongside never sees half of it'''
+        temporary = f'{self.path}.{os.getpid()}'
+        with open(temporary, 'w') as f:
+            json.dump({
+                'version': _cacheVersion, 'url': self.url, 'synced': self.synced, 'fullSync': self.fullSync,
+                'issues': self.issues,
+            }, f)
+        os.replace(temporary, self.path)
+
+    def sync(self, github):
+        '''Bring the cache up to date using the ``github`` client, asking only for issues
+        updated since the last sync unless it's been a while since we asked for all of them.
+        Return how many issues we got.
+        '''
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self.fullSync is None or now - datetime.datetime.fromisoformat(self.fullSync) > _fullSyncInterval:
+            self.synced, self.fullSync, self.issues = None, now.isoformat(), {}
+        since, after, count = self.synced, None, 0
+        while True:
+            data = github.graphql(_issuesQuery, owner=self.owner, name=self.repo, since=since, after=after)
+            repository = data['repository']
+            self.url, issues = repository['url'], repository['issues']
+            for node in issues['nodes']:
+                self.issues[node['number']] = {
+                    'title': node['title'], 'url': node['url'], 'state': node['state'],
+                    'closedAt': node['closedAt'], 'milestone': (node['milestone'] or {}).get('title'),
+                    'labels': [i['name'] for i in node['labels']['nodes']],
+                }
+                # ISO 8601 timestamps in UTC sort as strings
+                self.synced = max(self.synced or '', node['updatedAt'])
+                count += 1
+            if not issues['pageInfo']['hasNextPage']: break
+            after = issues['pageInfo']['endCursor']
+        return count
+
+
+# Functions
+# =========
+
+def _firstCommit():
+    '''Return the oldest commit leading to HEAD'''
+    return invokeGIT(['rev-list', '--max-parents=0', 'HEAD']).split()[-1]
+
+
+def _escape(text):
+    '''Escape Markdown in ``text`` except within `inline code`'''
+    parts = text.replace('\\', '\\\\').split('`')
+    # With an odd number of backticks there's no telling what's code, so escape it all
+    inside = range(1, len(parts), 2) if len(parts) % 2 == 1 else ()
+    for index, part in enumerate(parts):
+        if index not in inside:
+            for char in _escaped:
+                part = part.replace(char, '\\' + char)
+            parts[index] = part
+    return '`'.join(parts)
+
+
+def _line(issue, number, url, lineLabels):
+    '''Make the changelog line for the ``issue`` numbered ``number`` in the repository at ``url``,
+    noting any of its labels that are among the ``lineLabels``.
+    '''
+    labels = ''.join(f' [[{i}]({url}/labels/{quote(i)})]' for i in issue['labels'] if i in lineLabels)
+    return f'- {_escape(issue["title"])} [\\#{number}]({issue["url"]}){labels}'
+
+
+def render(cache, tagList, firstCommit, futureRelease, sections, issuesLabel, excludeLabels, lineLabels, today):
+    '''Render the changelog of the issues in the ``cache``, grouped by the tags in ``tagList``
+    (newest first) as made by ``git_tag_dates``—plus the ``futureRelease`` if there are issues closed
+    since the newest tag—and within each, by the ``sections``. Issues with none of the sections'
+    labels go under ``issuesLabel``; those with any of ``excludeLabels`` don't go anywhere.
+
+    An issue whose milestone is named after a tag goes with that tag; otherwise it goes with the
+    oldest tag made after it was closed.
+    '''
+    url, names = cache.url, {name for name, date in tagList}
+    if futureRelease: names.add(futureRelease)
+    entries = [(futureRelease, None)] if futureRelease else []
+    entries += tagList
+    grouped = {name: [] for name, date in entries}
+    for number, issue in cache.issues.items():
+        if issue['state'] != 'CLOSED' or not issue['closedAt']: continue
+        if excludeLabels.intersection(issue['labels']): continue
+        if issue['milestone'] in names:
+            grouped[issue['milestone']].append((number, issue))
+            continue
+        closed, home = parse_timestamp(issue['closedAt']), None
+        for name, date in entries:
+            if date is None or closed <= date: home = name
+        if home is not None: grouped[home].append((number, issue))
+
+    lines = ['# Changelog', '']
+    for index, (name, date) in enumerate(entries):
+        issues = sorted(grouped[name], key=lambda item: (item[1]['closedAt'], item[0]), reverse=True)
+        if date is None and not issues: continue
+        older = entries[index + 1][0] if index + 1 < len(entries) else firstCommit
+        day = (date or today).strftime('%Y-%m-%d')
+        lines += [f'## [{name}]({url}/tree/{name}) ({day})', '', f'[Full Changelog]({url}/compare/{older}...{name})', '']
+        bySection = {key: [] for key in sections}
+        other = []
+        for number, issue in issues:
+            key = next((k for k, s in sections.items() if set(s['labels']).intersection(issue['labels'])), None)
+            (bySection[key] if key else other).append(_line(issue, number, url, lineLabels))
+        for prefix, items in [(s['prefix'], bySection[k]) for k, s in sections.items()] + [(issuesLabel, other)]:
+            if items: lines += [prefix, ''] + items + ['']
+    lines += ['', '', _footer, '']
+    return '\n'.join(lines)
+
+
+def generate(github, cacheDir, owner, repo, output, futureRelease, sections, issuesLabel, excludeLabels, lineLabels):
+    '''Write the changelog of ``owner``'s ``repo`` to the file ``output``, syncing the issue cache
+    in ``cacheDir`` with the ``github`` client first. See ``render`` for the rest. Return True if
+    the file changed.
+    '''
+    cache = IssueCache(cacheDir, owner, repo)
+    cache.load()
+    count = cache.sync(github)
+    cache.save()
+    _logger.info('📇 Got %d new or updated issue(s) from GitHub; %d in all', count, len(cache.issues))
+    today = datetime.datetime.now(datetime.timezone.utc)
+    text = render(
+        cache, git_tag_dates(), _firstCommit(), futureRelease, sections, issuesLabel, frozenset(excludeLabels),
+        frozenset(lineLabels), today
+    )
+    try:
+        with open(output, 'r', encoding='utf-8') as f:
+            if f.read() == text: return False
+    except FileNotFoundError:
+        pass
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return True
+
+
+def plan_generate():
+    '''Return the command lines ``generate`` would invoke'''
+    return plan_git_tag_dates() + [['git', 'rev-list', '--max-parents=0', 'HEAD']]
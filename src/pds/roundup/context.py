@@ -2,6 +2,7 @@
 
 '''🤠 PDS Roundup: Context tells the shape of the local software surroundings'''
 
+from .transaction import GitTransaction
 import os
 
 
@@ -12,30 +13,101 @@ class Context(object):
     for use in other steps called ``objects``.
 
     N.B.: So far, ``objects`` was predicted to be a replacement for ``::set-env``
-    in a GitHub workflow but I currently have zero use for it.
+    in a GitHub workflow; these days it holds the facts steps ``record``, like the
+    resolved version number.
+
+    Steps make their commits and tags in the context's ``transaction``, which pushes
+    them to origin all at once; and talk to the GitHub API through its ``github`` client.
     '''
     def __init__(self, cwd, environ, args):
         '''Don't call this directly; instead use the ``create`` method'''
         self.cwd, self.environ, self.objects, self.args = cwd, environ, {}, args
+        self.subdir, self.transaction, self._github = os.curdir, GitTransaction(), None
 
     def __repr__(self):
         return f'<{self.__class__.__name__}(cwd={self.cwd},environ=({len(self.environ)} items))>'
 
+    def getStateDir(self, *parts):
+        '''Return the path to a directory, creating it if need be, for state that outlives a
+        single roundup, such as journals and caches. The ``parts`` name a subdirectory of it.
+        '''
+        base = getattr(self.args, 'state_dir', None) or os.path.join(
+            self.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'pds-roundup'
+        )
+        path = os.path.join(base, *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @property
+    def github(self):
+        '''The GitHub API client shared by the steps of a roundup in this context, made on first use'''
+        if self._github is None:
+            from .github import GitHubClient
+            self._github = GitHubClient(
+                self.environ.get('ADMIN_GITHUB_TOKEN'), self.getStateDir('github'),
+                self.environ.get('GITHUB_API_URL') or 'https://api.github.com', self.environ.get('GITHUB_GRAPHQL_URL')
+            )
+        return self._github
+
+    def close(self):
+        '''Let go of what the context held for a roundup, like connections to GitHub'''
+        if self._github is not None:
+            self._github.close()
+            self._github = None
+
     def createStep(self, name, assembly):
         '''Create a step fitted to the local context named ``name`` using the given
         ``assembly``. Or return None if no such step is appropriate in the context.
         '''
         stepFactory = self.steps.get(name)
-        return stepFactory(assembly) if stepFactory else None
+        if not stepFactory: return None
+        step = stepFactory(assembly)
+        step.name = name
+        return step
+
+    @property
+    def label(self):
+        '''A name for this context that tells it apart from others in the same repository, such as
+        ``PythonContext@client``; it's just the class name for a context at the top of the repository.
+        '''
+        subdir = getattr(self, 'subdir', os.curdir)
+        name = self.__class__.__name__
+        return name if subdir == os.curdir else f'{name}@{subdir}'
 
     @staticmethod
     def create(cwd, environ, args):
         '''Create a new context for given current working directory, ``cwd``, and the given
-        ``environ``ment variables, and the parsed command-line ``args``.
+        ``environ``ment variables, and the parsed command-line ``args``. Return None if nothing
+        in ``cwd`` tells what kind of context it is.
         '''
         from .util import contextFactories
-        factories, factory = contextFactories(), None
-        for entry in os.listdir(cwd):
-            factory = factories.get(entry)
-            if factory: break
-        return factory(cwd, environ, args) if factory else None
+        for fn, factory in contextFactories():
+            if os.path.exists(os.path.join(cwd, fn)):
+                return factory(cwd, environ, args)
+        return None
+
+    @staticmethod
+    def discover(cwd, environ, args):
+        '''Discover every context in the repository at ``cwd``: at its top and in the
+        subdirectories named by ``args.subdirectories``, a comma-separated list in which ``*``
+        means every immediate subdirectory. Return a list of contexts, each with a ``subdir``
+        relative to ``cwd``.
+        '''
+        # The top of the repository always gets a look, besides any subdirectories
+        subdirs = [os.curdir]
+        for subdir in (getattr(args, 'subdirectories', None) or os.curdir).split(','):
+            subdir = subdir.strip().strip('/') or os.curdir
+            if subdir == '*':
+                subdirs.extend(sorted(
+                    i.name for i in os.scandir(cwd) if i.is_dir() and not i.name.startswith('.')
+                ))
+            else:
+                subdirs.append(os.path.normpath(subdir))
+        contexts = []
+        for subdir in dict.fromkeys(subdirs):
+            path = os.path.normpath(os.path.join(cwd, subdir))
+            context = Context.create(path, environ, args) if os.path.isdir(path) else None
+            if context is not None:
+                context.subdir = subdir
+                contexts.append(context)
+        return contexts
@@ -0,0 +1,361 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Documentation archives. Makes the ``documentation.zip`` of a doc directory as a
+stream of bytes that can go straight into an upload while it's being made—no scratch file, no
+reading it all back in—or, for servers that must know the size up front, into a spooled file.
+
+Files are compressed on every core at once, except for ones that are compressed already (like
+images, fonts, and jars) which go in as they are. The same files always make the same archive,
+byte for byte: entries are in sorted order with fixed timestamps and permissions.
+
+A manifest of a doc directory lists the SHA-256 of each file plus a root hash over all of them,
+so we can tell if an archive made earlier holds the same docs, and if not, which files changed.'''
+
+from concurrent.futures import ThreadPoolExecutor
+import collections, hashlib, json, logging, os, queue, struct, tempfile, threading, zlib
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# How many bytes to hand to the upload at a time
+_chunkSize = 1024 * 1024
+
+# How many chunks may wait for the upload before the archiver waits for it in turn
+_backlog = 8
+
+# How big a spooled archive may get before it goes to disk
+_spoolSize = 64 * 1024 * 1024
+
+# Files with these suffixes are compressed already, so deflating them again is a waste of time
+_compressedSuffixes = frozenset({
+    '.7z', '.avif', '.bz2', '.ear', '.eot', '.gif', '.gz', '.heic', '.jar', '.jpeg', '.jpg', '.mov',
+    '.mp3', '.mp4', '.ogg', '.png', '.svgz', '.tgz', '.war', '.webm', '.webp', '.whl', '.woff',
+    '.woff2', '.xz', '.zip', '.zst',
+})
+
+# How hard to deflate; 6 is zlib's (and zipfile's) usual
+_level = 6
+
+# Files bigger than this get compressed as they're written rather than all at once in memory
+_bigFile = 64 * 1024 * 1024
+
+# How many bytes of files may be read and compressed ahead of the writer
+_lookahead = 256 * 1024 * 1024
+
+# zlib lets go of the GIL while it works, so threads are enough to use every core
+_workers = os.cpu_count() or 1
+
+# Every entry gets the same timestamp, 1980-01-01 00:00:00 (the earliest a ZIP file can tell),
+# and the same permissions, so the archive depends on nothing but the files' names and contents
+_dosDate, _dosTime = (1 << 5) | 1, 0
+_externalAttr = 0o100644 << 16
+
+# Sizes and offsets at or past this need the ZIP64 extensions
+_zip64Limit = 0xFFFFFFFF
+
+# ZIP structures; see https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
+_stored, _deflated = 0, 8
+_localHeader = struct.Struct('<IHHHHHIIIHH')
+_centralHeader = struct.Struct('<IHHHHHHIIIHHHHHII')
+_descriptor64 = struct.Struct('<IIQQ')
+_end = struct.Struct('<IHHHHIIH')
+_end64 = struct.Struct('<IQHHIIQQQQ')
+_locator64 = struct.Struct('<IIQI')
+
+
+# Classes
+# =======
+
+class _ZipWriter(object):
+    '''Writes a ZIP archive to ``out``, which needn't be seekable, one entry at a time'''
+    def __init__(self, out):
+        self.out, self.offset, self.central = out, 0, []
+
+    def _put(self, data):
+        self.out.write(data)
+        self.offset += len(data)
+
+    def _header(self, name, flags, method, crc, csize, usize, extra=b''):
+        encoded = name.encode('utf-8')
+        if not name.isascii(): flags |= 0x800
+        zip64 = bool(extra)
+        self._put(_localHeader.pack(
+            0x04034b50, 45 if zip64 else 20, flags, method, _dosTime, _dosDate, crc, csize, usize,
+            len(encoded), len(extra)
+        ) + encoded + extra)
+        return encoded, flags
+
+    def add(self, name, method, crc, usize, data):
+        '''Add an entry called ``name`` with the given compression ``method``, CRC, uncompressed
+        size, and (compressed) ``data``.
+        '''
+        offset, csize = self.offset, len(data)
+        if usize >= _zip64Limit or csize >= _zip64Limit:
+            extra = struct.pack('<HHQQ', 1, 16, usize, csize)
+            encoded, flags = self._header(name, 0, method, crc, _zip64Limit, _zip64Limit, extra)
+        else:
+            encoded, flags = self._header(name, 0, method, crc, csize, usize)
+        self._put(data)
+        self.central.append((encoded, flags, method, crc, csize, usize, offset))
+
+    def addFile(self, name, path, method):
+        '''Add an entry called ``name`` for the file at ``path``, compressing it with ``method`` as
+        we go. Its sizes and CRC come after its data, in a ZIP64 data descriptor.
+        '''
+        offset, crc, csize, usize = self.offset, 0, 0, 0
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+        encoded, flags = self._header(name, 0x08, method, 0, _zip64Limit, _zip64Limit, extra)
+        compressor = zlib.compressobj(_level, zlib.DEFLATED, -15) if method == _deflated else None
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(_chunkSize)
+                if not data: break
+                crc, usize = zlib.crc32(data, crc), usize + len(data)
+                if compressor: data = compressor.compress(data)
+                csize += len(data)
+                self._put(data)
+        if compressor:
+            data = compressor.flush()
+            csize += len(data)
+            self._put(data)
+        self._put(_descriptor64.pack(0x08074b50, crc, csize, usize))
+        self.central.append((encoded, flags, method, crc, csize, usize, offset))
+
+    def close(self):
+        '''Finish the archive with its central directory'''
+        start = self.offset
+        for encoded, flags, method, crc, csize, usize, offset in self.central:
+            zip64 = [i for i in (usize, csize, offset) if i >= _zip64Limit]
+            extra = struct.pack(f'<HH{len(zip64)}Q', 1, 8 * len(zip64), *zip64) if zip64 else b''
+            version = 45 if zip64 or flags & 0x08 else 20
+            self._put(_centralHeader.pack(
+                0x02014b50, (3 << 8) | version, version, flags, method, _dosTime, _dosDate, crc,
+                min(csize, _zip64Limit), min(usize, _zip64Limit), len(encoded), len(extra), 0, 0, 0,
+                _externalAttr, min(offset, _zip64Limit)
+            ) + encoded + extra)
+        count, size, end = len(self.central), self.offset - start, self.offset
+        if count >= 0xFFFF or size >= _zip64Limit or start >= _zip64Limit:
+            self._put(_end64.pack(0x06064b50, 44, (3 << 8) | 45, 45, 0, 0, count, count, size, start))
+            self._put(_locator64.pack(0x07064b50, 0, end, 1))
+            count, size, start = min(count, 0xFFFF), min(size, _zip64Limit), min(start, _zip64Limit)
+        self._put(_end.pack(0x06054b50, 0, 0, count, count, size, start, 0))
+
+
+class _Pipe(object):
+    '''A write-only, unseekable file that gathers what's written into chunks for a reader on the
+    other end of the given ``queue``.
+    '''
+    def __init__(self, queue):
+        self.queue, self.buffer, self.aborted = queue, bytearray(), threading.Event()
+
+    def write(self, data):
+        if self.aborted.is_set(): raise BrokenPipeError('Nobody is reading the documentation archive anymore')
+        self.buffer += data
+        while len(self.buffer) >= _chunkSize:
+            self._put(bytes(self.buffer[:_chunkSize]))
+            del self.buffer[:_chunkSize]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer: self._put(bytes(self.buffer))
+        self.buffer = bytearray()
+
+    def _put(self, chunk):
+        while not self.aborted.is_set():
+            try:
+                self.queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        raise BrokenPipeError('Nobody is reading the documentation archive anymore')
+
+
+# Functions
+# =========
+
+def _scan(folder, prefix=''):
+    '''Yield the path, name within the archive, and size of each regular file under ``folder``,
+    sorted by name within each directory.
+    '''
+    try:
+        with os.scandir(folder) as scanner:
+            entries = sorted(scanner, key=lambda entry: entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _scan(entry.path, prefix + entry.name + '/')
+        # Avoid things like Unix-domain sockets if they just happen to appear:
+        elif entry.is_file():
+            yield entry.path, prefix + entry.name, entry.stat().st_size
+
+
+def files(docDir):
+    '''Yield the path and name within the archive of each regular file under ``docDir``'''
+    for path, name, size in _scan(docDir):
+        yield path, name
+
+
+def _method(name):
+    '''Tell how to compress the file called ``name``: not at all if it's compressed already'''
+    return _stored if os.path.splitext(name)[1].lower() in _compressedSuffixes else _deflated
+
+
+def _compress(path, name):
+    '''Read and compress the file at ``path`` to go in the archive as ``name``. Return the
+    compression method, CRC, uncompressed size, and compressed data.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    crc, method = zlib.crc32(data), _method(name)
+    if method == _deflated and data:
+        compressor = zlib.compressobj(_level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        # Some files don't compress, whatever their names say
+        if len(deflated) < len(data): return method, crc, len(data), deflated
+    return _stored, crc, len(data), data
+
+
+def _digest(path):
+    '''Return the SHA-256 hex digest of the file at ``path``'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(_chunkSize), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def manifest(docDir):
+    '''Return the manifest of the files under ``docDir``: a dict with the SHA-256 of each file
+    by its name within the archive under ``files``, and a ``root`` hash over those names and
+    hashes that changes whenever any file is added, removed, or changed.
+    '''
+    names, paths = [], []
+    for path, name in files(docDir):
+        names.append(name)
+        paths.append(path)
+    with ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='docarchive') as pool:
+        digests = dict(zip(names, pool.map(_digest, paths)))
+    root = hashlib.sha256(''.join(f'{digests[i]} {i}\n' for i in sorted(digests)).encode('utf-8'))
+    return {'version': 1, 'root': root.hexdigest(), 'files': digests}
+
+
+def dumpManifest(manifest):
+    '''Return the given ``manifest`` as bytes of JSON'''
+    return json.dumps(manifest, indent=0, sort_keys=True).encode('utf-8')
+
+
+def loadManifest(data):
+    '''Return the manifest in the given bytes of JSON, or None if they don't hold one'''
+    try:
+        loaded = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(loaded, dict) or not isinstance(loaded.get('files'), dict) or 'root' not in loaded:
+        return None
+    return loaded
+
+
+def changes(old, new):
+    '''Return the names of files added, removed, and modified going from the ``old`` manifest to
+    the ``new`` one.
+    '''
+    old, new = old['files'], new['files']
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    modified = sorted(i for i in new.keys() & old.keys() if new[i] != old[i])
+    return added, removed, modified
+
+
+def hasFiles(docDir):
+    '''Tell if there are any files to archive under ``docDir``'''
+    return next(files(docDir), None) is not None
+
+
+def write(docDir, out):
+    '''Write a ZIP archive of the files under ``docDir`` to the file ``out``, which needn't be
+    seekable. Return how many files went in.
+
+    A pool of threads reads and compresses files ahead of the writer, which adds them in order.
+    '''
+    writer, count = _ZipWriter(out), 0
+    with ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='docarchive') as pool:
+        pending, ahead = collections.deque(), 0
+
+        def addNext():
+            nonlocal ahead
+            name, size, future = pending.popleft()
+            ahead -= size
+            writer.add(name, *future.result())
+
+        try:
+            for path, name, size in _scan(docDir):
+                count += 1
+                if size > _bigFile:
+                    while pending: addNext()
+                    writer.addFile(name, path, _method(name))
+                    continue
+                while pending and (ahead + size > _lookahead or len(pending) >= _workers * 64):
+                    addNext()
+                pending.append((name, size, pool.submit(_compress, path, name)))
+                ahead += size
+            while pending: addNext()
+        finally:
+            for name, size, future in pending: future.cancel()
+    writer.close()
+    return count
+
+
+def stream(docDir):
+    '''Yield a ZIP archive of the files under ``docDir`` as chunks of bytes, made by a thread
+    that keeps at most a few chunks ahead of whoever consumes them. Errors making the archive
+    come out of the consumer's loop; a consumer that stops early stops the archiver too.
+    '''
+    chunks, done = queue.Queue(maxsize=_backlog), object()
+    pipe, failure = _Pipe(chunks), []
+
+    def archive():
+        try:
+            write(docDir, pipe)
+            pipe.close()
+        except BaseException as ex:
+            failure.append(ex)
+        finally:
+            while not pipe.aborted.is_set():
+                try:
+                    chunks.put(done, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+
+    archiver = threading.Thread(target=archive, name='docarchive', daemon=True)
+    archiver.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done: break
+            yield chunk
+        if failure: raise failure[0]
+    finally:
+        pipe.aborted.set()
+        archiver.join()
+
+
+def spool(docDir):
+    '''Return a spooled temporary file holding a ZIP archive of the files under ``docDir``,
+    rewound and ready to read; close it when done. It stays in memory unless it gets big.
+    '''
+    spooled = tempfile.SpooledTemporaryFile(max_size=_spoolSize, suffix='.zip')
+    try:
+        write(docDir, spooled)
+        spooled.seek(0)
+    except BaseException:
+        spooled.close()
+        raise
+    return spooled
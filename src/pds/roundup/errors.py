@@ -24,3 +24,26 @@ class InvokedProcessError(RoundupError):
     def __init__(self, error):
         super(InvokedProcessError, self).__init__(f'Process %s failed with code %d', error.cmd, error.returncode)
         self.error = error
+
+
+class InvokedProcessTimeoutError(InvokedProcessError):
+    '''Error that indicates a called process was killed because it ran out of time or stalled;
+    the ``reason`` tells which.
+    '''
+    def __init__(self, error, reason):
+        super(InvokedProcessTimeoutError, self).__init__(error)
+        self.reason = reason
+
+
+class GitHubError(RoundupError):
+    '''Error that indicates the GitHub API said no; ``status`` is the HTTP status code'''
+    def __init__(self, method, url, status, message):
+        super(GitHubError, self).__init__(f'GitHub API {method} {url} failed with {status}: {message}')
+        self.status = status
+
+
+class TestFailuresError(RoundupError):
+    '''Error that indicates tests failed; ``failures`` names each one'''
+    def __init__(self, failures):
+        super(TestFailuresError, self).__init__(f'{len(failures)} test failure(s): {", ".join(failures)}')
+        self.failures = failures
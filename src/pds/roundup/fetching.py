@@ -0,0 +1,89 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Fetching. Before the steps start, works out what a roundup needs from origin
+and gets all of it in a single fetch: every tag, pruned of ones origin no longer has, and the
+whole commit history—but no file contents from the past, which the Roundup never looks at. Later
+helpers that need fresh refs, like ``delete_tags``, then needn't fetch again.'''
+
+from .errors import InvokedProcessError
+from .step import Resource
+from .util import git_lock, invokeGIT
+import logging, os
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# What every fetch gets: all tags, and forgetting branches and tags origin no longer has
+_refs = ['--prune', '--tags', '--prune-tags', '--force']
+
+
+# Functions
+# =========
+
+# Whether our refs match origin's as of our last fetch
+_fresh = False
+
+
+def needsFetch(steps):
+    '''Tell if any of the ``steps`` look at git history or refs, and so need a fetch first'''
+    return any(Resource.gitRefs in step.reads for step in steps)
+
+
+def _isShallow():
+    '''Tell if the repository at hand is a shallow clone, like the ones actions/checkout makes'''
+    try:
+        gitDir = invokeGIT(['rev-parse', '--git-common-dir']).strip()
+    except InvokedProcessError:
+        return False
+    return os.path.isfile(os.path.join(gitDir, 'shallow'))
+
+
+def _attempts(shallow):
+    '''Return the fetches to try, best first, for a ``shallow`` clone or not'''
+    if not shallow: return [['fetch'] + _refs + ['origin']]
+    return [
+        # Commits and trees only; git fetches any old file contents on demand
+        ['fetch', '--filter=blob:none', '--unshallow'] + _refs + ['origin'],
+        # Some servers don't do partial clones
+        ['fetch', '--unshallow'] + _refs + ['origin'],
+        # Let's at least get the tags
+        ['fetch'] + _refs + ['origin'],
+    ]
+
+
+def fetch():
+    '''Fetch from origin what a roundup needs and note that our refs are fresh. If every way to
+    fetch fails, raise the last exception.
+    '''
+    global _fresh
+    with git_lock():
+        attempts = _attempts(_isShallow())
+        for number, gitArgs in enumerate(attempts, 1):
+            try:
+                invokeGIT(gitArgs)
+                _fresh = True
+                return
+            except InvokedProcessError:
+                if number == len(attempts): raise
+                _logger.info('🤔 Fetch with «%s» failed, so trying something simpler', ' '.join(gitArgs))
+
+
+def ensureFresh():
+    '''Fetch from origin unless our refs are already fresh'''
+    if _fresh:
+        _logger.debug('🥬 Refs are fresh from origin, so not fetching again')
+    else:
+        fetch()
+
+
+def prefetch(steps):
+    '''Get what the ``steps`` of a roundup need from origin before they start, if anything'''
+    if needsFetch(steps): fetch()
+
+
+def plan_prefetch(steps):
+    '''Return the command lines ``prefetch`` would invoke for the ``steps`` in a shallow clone'''
+    return [['git'] + _attempts(True)[0]] if needsFetch(steps) else []
@@ -0,0 +1,170 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: GitHub Pages. Publishes a doc directory to the ``gh-pages`` branch without
+checking it out or staging every file: we hash the docs ourselves, compare them with what's on
+the branch already, and have ``git fast-import`` make a commit of just the difference on top of
+the branch's last commit. Directories that didn't change keep their trees, only new blobs and
+trees get written, and the branch goes out with the rest of the roundup's push.
+
+Docs can go into a subdirectory of the branch, such as one per version, leaving everything
+else on the branch as it was.'''
+
+from .util import git_config, git_lock, invokeGIT, plan_git_config
+from concurrent.futures import ThreadPoolExecutor
+from . import docarchive
+import hashlib, logging, os
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# The branch GitHub Pages serves
+_branch = 'gh-pages'
+
+# Where ``git fast-import`` leaves the commit it makes until it's pushed
+_scratchRef = 'refs/roundup/gh-pages'
+
+# How many bytes of file contents to read at a time when hashing
+_chunkSize = 1024 * 1024
+
+# File modes git knows for regular files
+_regular, _executable = '100644', '100755'
+
+
+# Functions
+# =========
+
+def _blobID(path, algorithm):
+    '''Return the ID git gives the contents of the file at ``path`` as a blob, hashed with the
+    named ``algorithm``.
+    '''
+    digest = hashlib.new(algorithm, f'blob {os.path.getsize(path)}\0'.encode('ascii'))
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(_chunkSize), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _hashDocs(docDir, subdir, algorithm):
+    '''Return the mode and blob ID of each file under ``docDir`` by its path on the branch,
+    under ``subdir`` if given.
+    '''
+    prefix = subdir.strip('/') + '/' if subdir.strip('/') else ''
+    names, paths = [], []
+    for path, name in docarchive.files(docDir):
+        names.append(prefix + name)
+        paths.append(path)
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='ghpages') as pool:
+        ids = pool.map(lambda path: _blobID(path, algorithm), paths)
+        return {
+            name: (_executable if os.access(path, os.X_OK) else _regular, blobID, path)
+            for name, path, blobID in zip(names, paths, ids)
+        }
+
+
+def _fetchArgs(remote):
+    '''Return the git arguments to fetch the branch from ``remote``. The refspec is a pattern so
+    that a remote without the branch isn't an error, and pruning forgets it if it's gone.
+    '''
+    return ['fetch', '--quiet', '--prune', remote, f'+refs/heads/{_branch}*:refs/remotes/{remote}/{_branch}*']
+
+
+def _previousCommit(remote):
+    '''Fetch the branch from ``remote`` and return its commit, or None if there's no such branch'''
+    invokeGIT(_fetchArgs(remote))
+    ref = f'refs/remotes/{remote}/{_branch}'
+    return invokeGIT(['for-each-ref', '--format=%(objectname)', ref]).strip() or None
+
+
+def _publishedFiles(commit, subdir):
+    '''Return the mode and blob ID of each file in the ``commit`` by its path, just those under
+    ``subdir`` if given. Only trees get read, so this works in a clone without old blobs.
+    '''
+    gitArgs = ['ls-tree', '-r', '-z', '--full-tree', commit]
+    if subdir.strip('/'): gitArgs += ['--', subdir.strip('/') + '/']
+    published = {}
+    for entry in invokeGIT(gitArgs).split('\0'):
+        if not entry: continue
+        info, path = entry.split('\t', 1)
+        mode, kind, objectID = info.split(' ')
+        if kind == 'blob': published[path] = (mode, objectID)
+    return published
+
+
+def _quote(path):
+    '''Quote ``path`` for ``git fast-import`` if it needs it'''
+    if not path.startswith('"') and '\n' not in path: return path
+    return '"' + path.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+def _stream(message, ident, parent, deletions, changes):
+    '''Yield the ``git fast-import`` input for a commit with the given ``message`` by ``ident``
+    on top of the ``parent`` commit (if any) that deletes the paths in ``deletions`` and adds or
+    replaces the ``changes``, a sequence of (path on the branch, mode, path to the contents).
+    '''
+    encoded = message.encode('utf-8')
+    header = [
+        f'commit {_scratchRef}', f'author {ident}', f'committer {ident}', f'data {len(encoded)}'
+    ]
+    yield ('\n'.join(header) + '\n').encode('utf-8') + encoded + b'\n'
+    if parent: yield f'from {parent}\n'.encode('utf-8')
+    for path in deletions:
+        yield f'D {_quote(path)}\n'.encode('utf-8')
+    for name, mode, path in changes:
+        with open(path, 'rb') as f:
+            data = f.read()
+        yield f'M {mode} inline {_quote(name)}\ndata {len(data)}\n'.encode('utf-8') + data + b'\n'
+    yield b'\n'
+
+
+def publish(docDir, transaction, subdir=''):
+    '''Publish the files under ``docDir`` to the ``gh-pages`` branch—into ``subdir`` if given,
+    leaving the rest of the branch alone; or else in place of everything on it. The new commit is
+    left in the ``transaction`` to push. Return it, or None if the branch has these docs already.
+    '''
+    remote = transaction.remote
+    algorithm = invokeGIT(['rev-parse', '--show-object-format']).strip() or 'sha1'
+    with git_lock():
+        parent = _previousCommit(remote)
+        published = _publishedFiles(parent, subdir) if parent else {}
+    docs = _hashDocs(docDir, subdir, algorithm)
+
+    deletions = sorted(published.keys() - docs.keys())
+    changes = [
+        (name, mode, path) for name, (mode, blobID, path) in sorted(docs.items())
+        if published.get(name) != (mode, blobID)
+    ]
+    if parent and not deletions and not changes:
+        _logger.info('🟰 The %d doc files on %s are up to date, so not publishing them again', len(docs), _branch)
+        return None
+    _logger.info(
+        '📑 Publishing docs to %s%s: %d file(s) added or changed, %d removed, %d unchanged',
+        _branch, f' under {subdir}' if subdir else '', len(changes), len(deletions), len(docs) - len(changes)
+    )
+
+    with git_lock():
+        git_config()
+        head, title = invokeGIT(['log', '-1', '--format=%H%n%s']).split('\n', 1)
+        message = f'publish: {title.strip()}\n\ngenerated from commit {head}'
+        ident = invokeGIT(['var', 'GIT_COMMITTER_IDENT']).strip()
+        invokeGIT(['fast-import', '--quiet', '--force'], input=_stream(message, ident, parent, deletions, changes))
+        commit = invokeGIT(['rev-parse', '--verify', _scratchRef]).strip()
+        transaction.update(f'refs/heads/{_branch}', commit, parent)
+    return commit
+
+
+def plan_publish(remote='origin'):
+    '''Return the command lines ``publish`` would invoke'''
+    return [
+        ['git', 'rev-parse', '--show-object-format'],
+        ['git'] + _fetchArgs(remote),
+        ['git', 'for-each-ref', '--format=%(objectname)', f'refs/remotes/{remote}/{_branch}'],
+        ['git', 'ls-tree', '-r', '-z', '--full-tree', f'refs/remotes/{remote}/{_branch}'],
+    ] + plan_git_config() + [
+        ['git', 'log', '-1', '--format=%H%n%s'],
+        ['git', 'var', 'GIT_COMMITTER_IDENT'],
+        ['git', 'fast-import', '--quiet', '--force'],
+        ['git', 'rev-parse', '--verify', _scratchRef],
+    ]
@@ -0,0 +1,198 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: GitHub. One client for the GitHub API per roundup, shared by every step: it
+keeps its connections alive between requests, remembers responses on disk so it can ask GitHub
+"has this changed?" instead of downloading it again, and counts what it does.'''
+
+from .errors import GitHubError
+from .tracing import tracer
+from requests.adapters import HTTPAdapter
+import collections, hashlib, json, logging, os, re, requests, threading
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Where the API is, unless told otherwise (like GitHub Enterprise's ``GITHUB_API_URL``)
+_defaultAPI = 'https://api.github.com'
+
+# GitHub Enterprise serves the REST API under ``/api/v3`` and GraphQL at ``/api/graphql``
+_restSuffix = re.compile(r'/v3/?$')
+
+# How many connections to keep alive, enough for steps running at the same time
+_poolSize = 16
+
+# How long, in seconds, to wait for GitHub to answer before giving up; uploads get longer
+_timeout = 60
+_uploadTimeout = 3600
+
+# The URI template GitHub gives for uploads ends with parameters we fill in ourselves
+_uriTemplate = re.compile(r'\{[^}]*\}$')
+
+
+# Classes
+# =======
+
+class GitHubClient(object):
+    '''A client for the GitHub API at ``api`` (and its GraphQL API at ``graphqlURL``, which by
+    default we work out from ``api``) using the given ``token``. If there's a
+    ``cacheDir``, we keep the ETag and Last-Modified of each response there along with its body
+    and make later requests for the same thing conditional; GitHub's "304 Not Modified" answers
+    are quick and don't count against the rate limit.
+
+    ``metrics`` counts requests by method, answers from the cache, and bytes sent and received.
+    '''
+    def __init__(self, token, cacheDir=None, api=_defaultAPI, graphqlURL=None):
+        self.api, self.cacheDir, self.metrics = api.rstrip('/'), cacheDir, collections.Counter()
+        self.graphqlURL = graphqlURL or (
+            _restSuffix.sub('/graphql', self.api) if _restSuffix.search(self.api) else self.api + '/graphql'
+        )
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=_poolSize, pool_maxsize=_poolSize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/vnd.github+json',
+            'User-Agent': 'pds-roundup',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+        if token: self.session.headers['Authorization'] = f'Bearer {token}'
+        # Cached responses are only good for the same token, which might see different things
+        self._scope = hashlib.sha256((token or '').encode('utf-8')).hexdigest()[:16]
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(api={self.api},#requests={self.metrics["requests"]})>'
+
+    def _count(self, **counts):
+        with self._lock:
+            self.metrics.update(counts)
+
+    def _url(self, path):
+        return path if '://' in path else self.api + path
+
+    def request(self, method, path, expect=(200, 201, 204), timeout=_timeout, **kwargs):
+        '''Make an HTTP request with the given ``method`` to the API ``path`` (or full URL) and
+        return the response, raising a ``GitHubError`` unless its status is one we ``expect``.
+        Other keyword arguments go to ``requests``.
+        '''
+        url = self._url(path)
+        with tracer().span(f'{method} {path}', 'github') as details:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            details.update(status=response.status_code)
+        self._count(**{'requests': 1, method: 1, 'received': len(response.content)})
+        if response.status_code not in expect:
+            try:
+                message = response.json().get('message', response.text)
+            except ValueError:
+                message = response.text
+            raise GitHubError(method, url, response.status_code, message)
+        return response
+
+    def _cachePath(self, url, params):
+        key = json.dumps([self._scope, url, sorted((params or {}).items())]).encode('utf-8')
+        return os.path.join(self.cacheDir, hashlib.sha256(key).hexdigest() + '.json')
+
+    def get(self, path, params=None, missing=False):
+        '''Get the JSON at the API ``path`` with the given query ``params``, asking only whether
+        it changed if we've got it cached. If ``missing``, return None for a 404 instead of
+        raising a ``GitHubError``.
+        '''
+        url, cached, headers = self._url(path), None, {}
+        cachePath = self._cachePath(url, params) if self.cacheDir else None
+        if cachePath:
+            try:
+                with open(cachePath, 'r') as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = None
+        if cached:
+            if cached.get('etag'): headers['If-None-Match'] = cached['etag']
+            if cached.get('lastModified'): headers['If-Modified-Since'] = cached['lastModified']
+        expect = (200, 304, 404) if missing else (200, 304)
+        response = self.request('GET', path, expect=expect, params=params, headers=headers)
+        if response.status_code == 404: return None
+        if response.status_code == 304:
+            self._count(notModified=1)
+            return cached['body']
+        body = response.json()
+        etag, lastModified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if cachePath and (etag or lastModified):
+            entry = {'etag': etag, 'lastModified': lastModified, 'body': body}
+            temporary = f'{cachePath}.{os.getpid()}.{threading.get_ident()}'
+            with open(temporary, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temporary, cachePath)
+        return body
+
+    def paginate(self, path, params=None):
+        '''Yield each item in the JSON list at the API ``path`` with the given query ``params``,
+        a hundred at a time, following GitHub's links from each page to the next.
+        '''
+        url, params = path, dict(params or {}, per_page=100)
+        while url:
+            response = self.request('GET', url, params=params)
+            yield from response.json()
+            # The link to the next page has the query parameters in it already
+            url, params = response.links.get('next', {}).get('url'), None
+
+    def graphql(self, query, **variables):
+        '''Run the GraphQL ``query`` with the given ``variables`` and return the data it got,
+        raising a ``GitHubError`` if GitHub reports any errors with it.
+        '''
+        response = self.request('POST', self.graphqlURL, json={'query': query, 'variables': variables})
+        body = response.json()
+        if body.get('errors'):
+            message = '; '.join(i.get('message', str(i)) for i in body['errors'])
+            raise GitHubError('POST', self.graphqlURL, response.status_code, message)
+        return body['data']
+
+    def release(self, owner, repo, tag=None):
+        '''Return the release of ``owner``'s ``repo`` for the given ``tag``; or with no ``tag``,
+        the newest release, drafts and pre-releases included. Return None if there's no such
+        release.
+        '''
+        if tag: return self.get(f'/repos/{owner}/{repo}/releases/tags/{tag}', missing=True)
+        releases = self.get(f'/repos/{owner}/{repo}/releases', params={'per_page': 1}, missing=True)
+        return releases[0] if releases else None
+
+    def assets(self, release):
+        '''Return the assets of the given ``release``'''
+        return self.get(release['assets_url'], params={'per_page': 100})
+
+    def downloadAsset(self, asset):
+        '''Return the contents of the given release ``asset`` as bytes'''
+        return self.request('GET', asset['url'], headers={'Accept': 'application/octet-stream'}).content
+
+    def deleteAsset(self, asset):
+        '''Delete the given release ``asset``'''
+        self.request('DELETE', asset['url'])
+
+    def uploadAsset(self, release, name, contentType, data, label=None):
+        '''Upload ``data`` (bytes, a file, or an iterable of bytes) as an asset called ``name``
+        with the given ``contentType`` and ``label`` to the ``release``, and return the new asset.
+        '''
+        url = _uriTemplate.sub('', release['upload_url'])
+        params = {'name': name}
+        if label: params['label'] = label
+        response = self.request(
+            'POST', url, params=params, data=data, headers={'Content-Type': contentType}, timeout=_uploadTimeout
+        )
+        asset = response.json()
+        self._count(sent=asset.get('size', 0))
+        return asset
+
+    def close(self):
+        '''Close our connections and log what we did'''
+        self.session.close()
+        if self.metrics['requests']:
+            _logger.info(
+                '🐙 GitHub API: %d request(s) (%s), %d answered from the cache, %d bytes received, %d sent',
+                self.metrics['requests'],
+                ', '.join(f'{self.metrics[m]} {m}' for m in ('GET', 'POST', 'PATCH', 'PUT', 'DELETE') if self.metrics[m]),
+                self.metrics['notModified'],
+                self.metrics['received'],
+                self.metrics['sent'],
+            )
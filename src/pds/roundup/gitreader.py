@@ -0,0 +1,535 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Git reader. Answers read-only questions about a git repository—what tags
+there are, where a symbolic ref points, which tag describes ``HEAD``—by reading refs, packed
+refs, loose objects, and pack files directly instead of forking ``git`` for each one.
+
+It only answers what it's sure of. Whenever the repository has something it doesn't understand
+(reftables, SHA-256 objects, grafts, replacement objects), ``GitReader.discover`` gives None,
+and whenever a question goes beyond what it can tell, the methods return None, so callers can
+fall back to the ``git`` command.'''
+
+from fnmatch import translate
+import heapq, logging, mmap, os, re, struct, zlib
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Object types as numbered in pack files
+_types = {1: b'commit', 2: b'tree', 3: b'blob', 4: b'tag'}
+_ofsDelta, _refDelta = 6, 7
+
+# Like ``git describe``, consider at most this many candidate tags
+_maxCandidates = 10
+
+# Tag priorities from ``git describe``: annotated tags beat lightweight ones
+_annotated, _lightweight = 2, 1
+
+# How many inflated pack objects to keep around, mostly to speed up chains of deltas
+_cacheSize = 1024
+
+# How many parsed commits to keep around between questions
+_commitCacheSize = 200000
+
+# A ref in a packed-refs file, possibly followed by its peeled SHA
+_packedRefRE = re.compile(rb'^([0-9a-f]{40}) ([^\n]+)\n(?:\^([0-9a-f]{40})\n)?', re.MULTILINE)
+
+
+# Caches
+# ======
+#
+# Roundups ask the same questions several times, so we keep what we learn from one to the next.
+# Objects never change; packed-refs files and tags can, so their caches note what they're based on.
+
+_packedRefsCache, _packCache, _namesCache, _listCache, _commitCache = {}, {}, {}, {}, {}
+
+
+# Functions
+# =========
+
+def _inflate(buffer, offset):
+    '''Inflate the zlib stream starting at ``offset`` in ``buffer``'''
+    inflater, chunks, size = zlib.decompressobj(), [], 64 * 1024
+    while not inflater.eof:
+        chunk = buffer[offset:offset + size]
+        if not chunk: raise ValueError('Truncated zlib stream in pack')
+        chunks.append(inflater.decompress(chunk))
+        offset += size
+    return b''.join(chunks)
+
+
+def _varint(data, pos):
+    '''Read a delta header size from ``data`` at ``pos``; return it and the position after it'''
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80: return value, pos
+
+
+def _applyDelta(base, delta):
+    '''Apply the git ``delta`` to the ``base`` object data'''
+    size, pos = _varint(delta, 0)
+    if size != len(base): raise ValueError('Delta base size mismatch')
+    size, pos = _varint(delta, pos)
+    out, end = bytearray(), len(delta)
+    while pos < end:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = length = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    length |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset:offset + (length or 0x10000)]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError('Unexpected delta opcode 0')
+    if len(out) != size: raise ValueError('Delta result size mismatch')
+    return bytes(out)
+
+
+def _headers(data):
+    '''Return the header lines of a commit or tag object's ``data`` as (key, value) pairs'''
+    headers = []
+    for line in data.split(b'\n\n', 1)[0].split(b'\n'):
+        if line.startswith(b' '): continue  # Continuation of a multi-line header, like a signature
+        key, _, value = line.partition(b' ')
+        headers.append((key, value))
+    return headers
+
+
+def _matcher(pattern):
+    '''Return a function that tells if a name matches the glob ``pattern``, like git's wildmatch
+    without special treatment of slashes; no ``pattern`` matches everything
+    '''
+    if pattern is None: return lambda name: True
+    return re.compile(translate(pattern)).match
+
+
+def _timestamp(identity):
+    '''Return the Unix time from a ``committer`` or ``tagger`` ``identity`` like ``Name <email> 1700000000 +0000``'''
+    try:
+        return int(identity.rsplit(b'>', 1)[1].split()[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+# Classes
+# =======
+
+class _PackedRefs(object):
+    '''The parsed contents ``data`` of a packed-refs file whose ``key`` identifies the version of
+    it we read: ``refs`` maps ref names to SHAs, ``peeled`` maps ref names to their peeled SHAs,
+    and ``tags`` maps tag names (sans ``refs/tags/``) to their SHAs. ``fullyPeeled`` tells if
+    peeled SHAs are known for all annotated tags, and ``replaced`` if there are any replace refs.
+    '''
+    def __init__(self, key, data):
+        self.key, self.refs, self.peeled, self.tags = key, {}, {}, {}
+        header = data.split(b'\n', 1)[0] if data.startswith(b'#') else b''
+        traits = header.split(b':', 1)[-1].split()
+        self.fullyPeeled = b'peeled' in traits or b'fully-peeled' in traits
+        self.replaced = b' refs/replace/' in data
+        for sha, name, peel in _packedRefRE.findall(data):
+            name, sha = name.decode('utf-8'), sha.decode('ascii')
+            self.refs[name] = sha
+            if name.startswith('refs/tags/'): self.tags[name[10:]] = sha
+            if peel: self.peeled[name] = peel.decode('ascii')
+
+
+class _Pack(object):
+    '''A pack file and its version 2 index, both memory-mapped'''
+    def __init__(self, path):
+        self.path = path
+        with open(path[:-5] + '.idx', 'rb') as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.idx[:8] != b'\377tOc\x00\x00\x00\x02': raise ValueError(f'Unsupported pack index for {path}')
+        self.fanout = struct.unpack_from('>256I', self.idx, 8)
+        self.count = self.fanout[255]
+        self.shas = 8 + 256 * 4
+        self.offsets = self.shas + self.count * 20 + self.count * 4
+        self.largeOffsets = self.offsets + self.count * 4
+        with open(path, 'rb') as f:
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(path={self.path},#objects={self.count})>'
+
+    def find(self, sha):
+        '''Return the offset in this pack of the object with binary ``sha``, or None'''
+        first = sha[0]
+        lo, hi = (self.fanout[first - 1] if first else 0), self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.shas + mid * 20
+            candidate = self.idx[start:start + 20]
+            if candidate < sha:
+                lo = mid + 1
+            elif candidate > sha:
+                hi = mid
+            else:
+                offset = struct.unpack_from('>I', self.idx, self.offsets + mid * 4)[0]
+                if offset & 0x80000000:
+                    offset = struct.unpack_from('>Q', self.idx, self.largeOffsets + (offset & 0x7fffffff) * 8)[0]
+                return offset
+        return None
+
+
+class GitReader(object):
+    '''A reader of the git repository whose git directory is ``gitDir`` and whose shared
+    (common) directory is ``commonDir``; these differ only for linked worktrees.
+    '''
+    def __init__(self, gitDir, commonDir):
+        self.gitDir, self.commonDir = gitDir, commonDir
+        self.objectDirs = [os.path.join(commonDir, 'objects')]
+        alternates = os.path.join(self.objectDirs[0], 'info', 'alternates')
+        if os.path.isfile(alternates):
+            with open(alternates, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        self.objectDirs.append(os.path.join(self.objectDirs[0], line))
+        self._packs, self._cache = None, {}
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(gitDir={self.gitDir})>'
+
+    @classmethod
+    def discover(cls, cwd):
+        '''Find the git repository holding ``cwd`` and return a reader for it, or None if there
+        isn't one or it uses features we can't read.
+        '''
+        # Let git handle repositories whose whereabouts come from the environment
+        if any(os.environ.get(var) for var in ('GIT_DIR', 'GIT_COMMON_DIR', 'GIT_OBJECT_DIRECTORY')): return None
+        path = os.path.abspath(cwd)
+        while True:
+            dotGit = os.path.join(path, '.git')
+            if os.path.isdir(dotGit):
+                gitDir = dotGit
+                break
+            if os.path.isfile(dotGit):
+                with open(dotGit, 'r') as f:
+                    line = f.readline().strip()
+                if not line.startswith('gitdir:'): return None
+                gitDir = os.path.normpath(os.path.join(path, line[len('gitdir:'):].strip()))
+                break
+            parent = os.path.dirname(path)
+            if parent == path: return None
+            path = parent
+        commonDir = gitDir
+        if os.path.isfile(os.path.join(gitDir, 'commondir')):
+            with open(os.path.join(gitDir, 'commondir'), 'r') as f:
+                commonDir = os.path.normpath(os.path.join(gitDir, f.read().strip()))
+        reader = cls(gitDir, commonDir)
+        return reader if reader._supported() else None
+
+    def _supported(self):
+        '''Tell if this repository uses only features we can read'''
+        try:
+            with open(os.path.join(self.commonDir, 'config'), 'r') as f:
+                config = f.read().lower().replace(' ', '').replace('\t', '')
+        except OSError:
+            return False
+        if 'objectformat=sha256' in config or 'refstorage=' in config: return False
+        if os.path.exists(os.path.join(self.commonDir, 'info', 'grafts')): return False
+        if self._looseRefs('refs/replace/') or self._packedRefs().replaced: return False
+        return True
+
+    # Refs
+    # ----
+
+    def _packedRefs(self):
+        '''Return the ``_PackedRefs`` of this repository, parsing its packed-refs file only if it
+        changed since we last looked
+        '''
+        path = os.path.join(self.commonDir, 'packed-refs')
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                key = stat.st_ino, stat.st_size, stat.st_mtime_ns
+                cached = _packedRefsCache.get(path)
+                if cached and cached.key == key: return cached
+                data = f.read()
+        except FileNotFoundError:
+            return _PackedRefs(None, b'')
+        _packedRefsCache[path] = packedRefs = _PackedRefs(key, data)
+        return packedRefs
+
+    def _looseRefs(self, prefix):
+        '''Return a mapping of loose ref names under ``prefix`` (like ``refs/tags/``) to their
+        contents, which may be a SHA or a ``ref: …`` symbolic ref
+        '''
+        refs, top = {}, os.path.join(self.commonDir, prefix)
+        for folder, subdirs, filenames in os.walk(top):
+            for fn in filenames:
+                if fn.endswith('.lock'): continue
+                path = os.path.join(folder, fn)
+                try:
+                    with open(path, 'r') as f:
+                        content = f.read().strip()
+                except OSError:
+                    continue
+                refs[os.path.relpath(path, self.commonDir).replace(os.sep, '/')] = content
+        return refs
+
+    def _readRef(self, name):
+        '''Return the contents of the ref ``name``: a SHA, a ``ref: …`` line, or None'''
+        # HEAD and other top-level pseudo-refs live in each worktree's own git directory
+        directory = self.gitDir if '/' not in name else self.commonDir
+        try:
+            with open(os.path.join(directory, name), 'r') as f:
+                return f.read().strip()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return self._packedRefs().refs.get(name)
+
+    def symbolicRef(self, name):
+        '''Return the ref that the symbolic ref ``name`` points to, or None if it isn't one'''
+        content = self._readRef(name)
+        return content[4:].strip() if content and content.startswith('ref:') else None
+
+    def resolve(self, name):
+        '''Return the SHA that the ref ``name`` (like ``HEAD``) ultimately points to, or None'''
+        for _ in range(10):
+            content = self._readRef(name)
+            if content is None: return None
+            if not content.startswith('ref:'): return content
+            name = content[4:].strip()
+        return None
+
+    def tags(self):
+        '''Return a mapping of tag names (sans ``refs/tags/``) to their SHAs'''
+        tags = dict(self._packedRefs().tags)
+        for name, content in self._looseRefs('refs/tags/').items():
+            sha = self.resolve(name) if content.startswith('ref:') else content
+            if sha:
+                tags[name[len('refs/tags/'):]] = sha
+            else:
+                tags.pop(name[len('refs/tags/'):], None)
+        return tags
+
+    def listTags(self, pattern=None):
+        '''Return the names of the tags matching the glob ``pattern``, sorted like ``git tag --list``'''
+        key = self._packedRefs().key, tuple(sorted(self._looseRefs('refs/tags/').items()))
+        cached = _listCache.get((self.commonDir, pattern))
+        if cached and cached[0] == key: return list(cached[1])
+        # Sorting by code point is the same as git's sorting by UTF-8 bytes
+        matches = _matcher(pattern)
+        names = sorted(name for name in self.tags() if matches(name))
+        _listCache[(self.commonDir, pattern)] = key, names
+        return list(names)
+
+    # Objects
+    # -------
+
+    def _loadPacks(self):
+        packs = []
+        for objectDir in self.objectDirs:
+            packDir = os.path.join(objectDir, 'pack')
+            try:
+                names = sorted(os.listdir(packDir))
+            except FileNotFoundError:
+                continue
+            for fn in names:
+                path = os.path.join(packDir, fn)
+                if fn.endswith('.pack') and os.path.exists(path[:-5] + '.idx'):
+                    # Packs never change once written, so we can share them between readers
+                    if path not in _packCache: _packCache[path] = _Pack(path)
+                    packs.append(_packCache[path])
+        return packs
+
+    def read(self, sha):
+        '''Return the type (like ``b'commit'``) and data of the object ``sha``, or None if we
+        don't have it.
+        '''
+        for objectDir in self.objectDirs:
+            path = os.path.join(objectDir, sha[:2], sha[2:])
+            try:
+                with open(path, 'rb') as f:
+                    raw = zlib.decompress(f.read())
+            except FileNotFoundError:
+                continue
+            header, _, data = raw.partition(b'\x00')
+            return header.split(b' ', 1)[0], data
+        binary = bytes.fromhex(sha)
+        for attempt in range(2):
+            if self._packs is None: self._packs = self._loadPacks()
+            for pack in self._packs:
+                offset = pack.find(binary)
+                if offset is not None: return self._unpack(pack, offset)
+            # Maybe git packed more objects since we first looked
+            self._packs = None
+        return None
+
+    def _unpack(self, pack, offset):
+        '''Return the type and data of the object at ``offset`` in ``pack``'''
+        key = (pack.path, offset)
+        if key in self._cache: return self._cache[key]
+        data, pos = pack.pack, offset
+        byte = data[pos]
+        kind, pos = (byte >> 4) & 7, pos + 1
+        while byte & 0x80:
+            byte, pos = data[pos], pos + 1
+        if kind in _types:
+            result = _types[kind], _inflate(data, pos)
+        elif kind == _ofsDelta:
+            byte, pos = data[pos], pos + 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte, pos = data[pos], pos + 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            baseType, base = self._unpack(pack, offset - distance)
+            result = baseType, _applyDelta(base, _inflate(data, pos))
+        elif kind == _refDelta:
+            baseObject = self.read(data[pos:pos + 20].hex())
+            if baseObject is None: raise ValueError(f'Missing delta base in {pack.path}')
+            result = baseObject[0], _applyDelta(baseObject[1], _inflate(data, pos + 20))
+        else:
+            raise ValueError(f'Unknown object type {kind} in {pack.path}')
+        if len(self._cache) >= _cacheSize: self._cache.clear()
+        self._cache[key] = result
+        return result
+
+    def commit(self, sha):
+        '''Return the parent SHAs and commit time of commit ``sha``, or None if we don't have it'''
+        cached = _commitCache.get(sha)
+        if cached is not None: return cached
+        obj = self.read(sha)
+        if obj is None or obj[0] != b'commit': return None
+        parents, when = [], 0
+        for key, value in _headers(obj[1]):
+            if key == b'parent':
+                parents.append(value.decode('ascii'))
+            elif key == b'committer':
+                when = _timestamp(value)
+        if len(_commitCache) >= _commitCacheSize: _commitCache.clear()
+        _commitCache[sha] = parents, when
+        return parents, when
+
+    def _peelTag(self, sha):
+        '''Follow the annotated tag ``sha`` to what it tags; return that SHA and the (first) tag's
+        date, or None if we can't read it.
+        '''
+        date = None
+        for _ in range(10):
+            obj = self.read(sha)
+            if obj is None: return None
+            if obj[0] != b'tag': return sha, date
+            headers = dict(_headers(obj[1]))
+            if date is None: date = _timestamp(headers.get(b'tagger', b''))
+            sha = headers.get(b'object', b'').decode('ascii')
+        return None
+
+    def _shallow(self):
+        try:
+            with open(os.path.join(self.commonDir, 'shallow'), 'r') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    # Describe
+    # --------
+
+    def _names(self, pattern):
+        '''Return a mapping of commit SHAs to the name that ``git describe --tags`` would give
+        each, considering only tags matching ``pattern``; or None if we can't tell.
+        '''
+        packedRefs, loose = self._packedRefs(), self._looseRefs('refs/tags/')
+        peeled, fullyPeeled = packedRefs.peeled, packedRefs.fullyPeeled
+        key = packedRefs.key, tuple(sorted(loose.items()))
+        cached = _namesCache.get((self.commonDir, pattern))
+        if cached and cached[0] == key: return cached[1]
+        names, dates, matches = {}, {}, _matcher(pattern)
+        for name, sha in sorted(self.tags().items()):
+            if not matches(name): continue
+            ref = 'refs/tags/' + name
+            if ref not in loose and ref in peeled:
+                commit, prio = peeled[ref], _annotated
+            elif ref not in loose and fullyPeeled:
+                commit, prio = sha, _lightweight
+            else:
+                result = self._peelTag(sha)
+                if result is None: return None
+                commit, prio = result[0], (_lightweight if result[0] == sha else _annotated)
+                if prio == _annotated: dates[name] = result[1]
+            current = names.get(commit)
+            if current is None or current[0] < prio:
+                names[commit] = (prio, name, sha)
+            elif current[0] == prio == _annotated:
+                # Several annotated tags on one commit; like git, prefer the newer one
+                for tagName, tagSHA in ((current[1], current[2]), (name, sha)):
+                    if tagName not in dates:
+                        result = self._peelTag(tagSHA)
+                        if result is None: return None
+                        dates[tagName] = result[1]
+                if dates[current[1]] < dates[name]: names[commit] = (prio, name, sha)
+        names = {commit: name for commit, (prio, name, sha) in names.items()}
+        _namesCache[(self.commonDir, pattern)] = key, names
+        return names
+
+    def describe(self, pattern=None, rev='HEAD'):
+        '''Return the name of the tag that ``git describe --tags --abbrev=0 [--match pattern]``
+        would give for ``rev``, or None if we can't tell—including when no tag describes it, in
+        which case ``git`` can explain why.
+
+        This follows git's own algorithm: walk the history newest commit first, note the first
+        ten tagged commits as candidates, count for each how many commits it doesn't reach, and
+        pick the one with the fewest. Versions of git differ on whether they keep walking after
+        finding all the candidates they could; we keep going only until it can't matter, and
+        if it does, we let ``git`` decide.
+        '''
+        head = self.resolve(rev) if rev == 'HEAD' or rev.startswith('refs/') else rev
+        if head is None: return None
+        names = self._names(pattern)
+        if not names: return None
+        if head in names: return names[head]
+        info = self.commit(head)
+        if info is None: return None
+
+        def best():
+            return min(matches, key=lambda match: (match[1], match[2]))
+
+        shallow, flagsOf, counter, queue = self._shallow(), {head: 0}, 0, [(-info[1], 0, head, info[0])]
+        matches, seenCommits, enough, snapshot = [], 0, min(_maxCandidates, len(names)), None
+        while queue:
+            _, _, sha, parents = heapq.heappop(queue)
+            seenCommits += 1
+            flags = flagsOf[sha]
+            if sha in names:
+                if len(matches) == _maxCandidates: break
+                # Each match is its name, depth (commits seen it doesn't reach), and found order
+                matches.append([names[sha], seenCommits - 1, len(matches) + 1])
+                flags |= 1 << len(matches)
+                flagsOf[sha] = flags
+            for match in matches:
+                if not flags & (1 << match[2]): match[1] += 1
+            if snapshot is None and len(matches) == enough: snapshot = best()
+            if sha in shallow: parents = []
+            for parent in parents:
+                if parent not in flagsOf:
+                    parentInfo = self.commit(parent)
+                    if parentInfo is None: return None
+                    flagsOf[parent] = 0
+                    counter += 1
+                    heapq.heappush(queue, (-parentInfo[1], counter, parent, parentInfo[0]))
+                flagsOf[parent] |= flags
+            if snapshot is not None:
+                # Once every commit left to walk descends from the best candidate, its depth can't
+                # grow while the others' can only grow, so walking further can't change the answer
+                current = best()
+                if current is not snapshot: return None
+                if all(flagsOf[entry[2]] & (1 << current[2]) for entry in queue): break
+        if not matches: return None
+        if snapshot is not None and best() is not snapshot: return None
+        return best()[0]
@@ -0,0 +1,129 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Journal. A journal is an on-disk checkpoint of the steps a roundup has
+completed and the facts they produced, so a later roundup of the same commit can pick up where
+an earlier one left off.'''
+
+from .errors import InvokedProcessError
+from .util import git_rev_parse
+import json, logging, os, threading, time
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+COMPLETED = 'completed'
+FAILED    = 'failed'
+
+
+# Functions
+# =========
+
+def currentCommit(environ):
+    '''Return the SHA of the commit being rounded up. GitHub Actions tells us this in the
+    environment; otherwise we ask git. Return None if we can't tell.
+    '''
+    sha = environ.get('GITHUB_SHA')
+    if sha: return sha
+    try:
+        return git_rev_parse('HEAD') or None
+    except InvokedProcessError:
+        return None
+
+
+# Classes
+# =======
+
+class Journal(object):
+    '''A journal of steps for one commit, assembly, and context, kept as a JSON file in
+    ``directory``. Each entry maps a step's class name to its status, duration in seconds,
+    and facts.
+    '''
+    def __init__(self, directory, sha, assembly, context):
+        self.sha, self.assembly, self.context = sha, assembly, context
+        self.path = os.path.join(directory, f'{sha}-{assembly}-{context.replace(os.sep, "_")}.json')
+        self.entries, self._lock = {}, threading.Lock()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(path={self.path},#entries={len(self.entries)})>'
+
+    @classmethod
+    def forAssembly(cls, assembly):
+        '''Make a journal for the given ``assembly``, or return None if we can't tell what
+        commit we're on.
+        '''
+        context = assembly.context
+        sha = currentCommit(context.environ)
+        if not sha:
+            _logger.info('📓 Cannot tell what commit this is, so not keeping a journal of steps')
+            return None
+        directory = context.getStateDir('journal')
+        return cls(directory, sha, assembly.__class__.__name__, context.label)
+
+    @staticmethod
+    def history(directory, assembly, context):
+        '''Return the durations of steps that completed in earlier roundups using journals in
+        ``directory``: a mapping of step class names to a list of seconds. Durations from the
+        named ``assembly`` are preferred; if there are none for a step, those from any assembly
+        with the same ``context`` will do.
+        '''
+        same, similar = {}, {}
+        for fn in os.listdir(directory):
+            if not fn.endswith(f'-{context.replace(os.sep, "_")}.json'): continue
+            try:
+                with open(os.path.join(directory, fn), 'r') as f:
+                    document = json.load(f)
+            except (OSError, ValueError):
+                continue
+            durations = same if document.get('assembly') == assembly else similar
+            for name, entry in document.get('steps', {}).items():
+                if entry.get('status') == COMPLETED:
+                    durations.setdefault(name, []).append(entry.get('duration', 0.0))
+        return {**similar, **same}
+
+    def load(self):
+        '''Load the entries from an earlier roundup, if any, and return how many there were'''
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f).get('steps', {})
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as ex:
+            _logger.warning('📓 Cannot read journal %s (%s); starting afresh', self.path, ex)
+            self.entries = {}
+        return len(self.entries)
+
+    def isCompleted(self, step):
+        '''Tell if the given ``step`` completed according to this journal'''
+        return self.entries.get(step.__class__.__name__, {}).get('status') == COMPLETED
+
+    def facts(self, step):
+        '''Return the facts the given ``step`` recorded'''
+        return self.entries.get(step.__class__.__name__, {}).get('facts', {})
+
+    def record(self, step, status, duration):
+        '''Record that the ``step`` ended with the given ``status`` after ``duration`` seconds,
+        along with its facts, and save the journal.
+        '''
+        with self._lock:
+            self.entries[step.__class__.__name__] = {
+                'status': status,
+                'duration': duration,
+                'finished': time.time(),
+                'facts': step.facts,
+            }
+            self._save()
+
+    def _save(self):
+        document = {
+            'sha': self.sha,
+            'assembly': self.assembly,
+            'context': self.context,
+            'steps': self.entries,
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(document, f, indent=2, default=str)
+        os.replace(tmp, self.path)
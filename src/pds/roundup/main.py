@@ -7,10 +7,12 @@
 from .context import Context
 from .errors import InvokedProcessError
 from .util import populateEnvVars, invoke
+from .planning import plan
+from . import tracing, watchdog
 from .assembly import (
     StablePDSAssembly, UnstablePDSAssembly, IntegrativePDSAssembly, NoOpAssembly, EnvironmentalAssembly
 )
-import os, logging, argparse, sys
+import os, logging, argparse, hashlib, multiprocessing, sys
 
 _logger = logging.getLogger(__name__)
 
@@ -24,6 +26,13 @@ _assemblies = {
 _defaultAssembly = 'unstable'
 
 
+def _flag(value):
+    '''Interpret a command-line ``value`` as a boolean flag, which lets the GitHub action pass
+    ``true`` or ``false`` through from its inputs.
+    '''
+    return value.strip().lower() in ('true', '1', 'yes')
+
+
 def _parseArgs():
     '''Parse the command line arguments and return a namespace'''
     parser = argparse.ArgumentParser(
@@ -38,16 +47,64 @@ def _parseArgs():
         '-a', '--assembly', default=_defaultAssembly, choices=_assemblies.keys(),
         help=f'🤪 Mode of assembly; default %(default)s'
     )
+    parser.add_argument(
+        '-s', '--subdirectories',
+        help='🗂 Subdirectories (separated with a comma) that may hold more contexts to round up besides the '
+             'top of the repository; use * for every immediate subdirectory'
+    )
     parser.add_argument(
         '-p', '--packages',
         help='📦 Additional pacakges (separated with a comma) to install prior to assembly'
     )
 
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='🏇 How many independent steps may run at the same time; default %(default)s'
+    )
+
     parser.add_argument(
         '-D', '--documentation-dir',
         help='📄 Directory where the online documentation is generated; '
              'default values are docs/build for Python and target/staging for Maven'
     )
+    parser.add_argument(
+        '--pages-subdir',
+        help='📑 Subdirectory of GitHub Pages for stable docs, like v/{version} (or {tag}), leaving other '
+             'versions there alone; default is to replace everything on GitHub Pages'
+    )
+
+    parser.add_argument(
+        '-r', '--resume', nargs='?', const='true', default='false', type=_flag,
+        help='⏯ Skip steps that completed in an earlier roundup of the same commit and pick up from there'
+    )
+    parser.add_argument(
+        '-S', '--state-dir',
+        help='🗄 Directory for state kept between roundups, like journals; default ~/.cache/pds-roundup'
+    )
+
+    parser.add_argument(
+        '-n', '--plan', action='store_true',
+        help="🗺 Don't do anything; just tell what steps and commands the roundup would run and how long they might take"
+    )
+
+    parser.add_argument(
+        '--step-timeouts', type=watchdog.parseTimeouts, default={},
+        help='⏰ Seconds each step may spend running commands, like 3600,unitTest=1800 where a bare number is '
+             'for every step'
+    )
+    parser.add_argument(
+        '--command-timeouts', type=watchdog.parseTimeouts, default={},
+        help='⏰ Seconds each command may run, like 1800,git=300,twine=900 where a bare number is for every command'
+    )
+    parser.add_argument(
+        '--stall-timeout', type=float, default=0.0,
+        help='💤 Kill a command that writes no output and uses no CPU for this many seconds; default never'
+    )
+
+    parser.add_argument(
+        '-t', '--trace',
+        help='⏱ Write a Chrome-trace-compatible JSON timing trace of every step and command to this file'
+    )
 
     # Maven 😩
     group = parser.add_argument_group('Maven phases (or goals), comma-separated')
@@ -77,13 +134,51 @@ def _parseArgs():
     return parser.parse_args()
 
 
+def _traceFile(path, context):
+    '''Return a trace file path for the given ``context`` based on ``path``; contexts in
+    subdirectories get their own trace files since they run in their own processes.
+    '''
+    if context.subdir == os.curdir: return path
+    root, ext = os.path.splitext(path)
+    return f'{root}-{context.subdir.replace(os.sep, "_")}{ext}'
+
+
+def _roundup(context, args):
+    '''Round up the given ``context`` using the assembly named in ``args``; return True if it
+    went well.
+    '''
+    if args.trace:
+        tracing.enable(_traceFile(args.trace, context))
+    watchdog.configure(args.command_timeouts, args.stall_timeout)
+    try:
+        _assemblies[args.assembly](context).roundup()
+        return True
+    except Exception:
+        _logger.exception('💀 Fatal error during roundup of %s', context.label)
+        return False
+    finally:
+        tracing.tracer().write()
+
+
+def _roundupSubdir(cwd, subdir, environ, args):
+    '''Round up the context in ``subdir`` of ``cwd``; this is the entrypoint of the process for
+    each context when there's more than one.
+    '''
+    logging.basicConfig(level=args.loglevel, format=f'[{subdir}] %(levelname)s:%(name)s:%(message)s')
+    path = os.path.join(cwd, subdir)
+    os.chdir(path)
+    context = Context.create(path, environ, args)
+    context.subdir = subdir
+    sys.exit(0 if _roundup(context, args) else 1)
+
+
 def main():
     '''Main entrypoint'''
     args = _parseArgs()
     logging.basicConfig(level=args.loglevel)
-    cwd = os.getcwd()
-    context = Context.create(cwd, populateEnvVars(os.environ), args)
-    if context is None:
+    cwd, environ = os.getcwd(), populateEnvVars(os.environ)
+    contexts = Context.discover(cwd, environ, args)
+    if not contexts:
         contents = ', '.join(os.listdir(cwd))
         _logger.critical(
             "💥 No usable context in «%s»; note I can only handle Python, Maven, and Node.js projects so far", cwd
@@ -94,6 +189,11 @@ def main():
             _logger.critical("🔎 Here's what's in that directory: %s", contents)
         sys.exit(1)
 
+    # Just planning? Then say what we'd do and stop before anything gets invoked
+    if args.plan:
+        print('\n\n'.join(plan(_assemblies[args.assembly](context)) for context in contexts))
+        sys.exit(0)
+
     # Bonus package time
     if args.packages:
         invoke(['apk', 'update'])
@@ -114,14 +214,30 @@ def main():
 
     # Sanity check in GitHub Acions logs: show the version of ``pds-github-util`` by calling
     # ``--version`` on any one of its programs.
-    version = invoke(['pds-issues', '--version']).strip()
+    version = invoke(['pds-issues', '--version'], capture=True).strip()
     _logger.info('🗺 The version of ``lasso-issues`` I shall be using: %s', version)
 
     # Here we go daddy
-    try:
-        _assemblies[args.assembly](context).roundup()
-    except Exception:
-        _logger.exception('💀 Fatal error during roundup')
+    if len(contexts) == 1:
+        # The steps work with paths relative to their project, which needn't be at the top
+        if contexts[0].subdir != os.curdir: os.chdir(os.path.join(cwd, contexts[0].subdir))
+        sys.exit(0 if _roundup(contexts[0], args) else 1)
+
+    # More than one context? Round each one up in its own process, with a lock file so they
+    # take turns with the repository's shared git state
+    _logger.info('🗂 Rounding up %d contexts: %s', len(contexts), ', '.join(i.label for i in contexts))
+    digest = hashlib.sha1(cwd.encode('utf-8')).hexdigest()[:12]
+    os.environ['ROUNDUP_GIT_LOCK'] = os.path.join(contexts[0].getStateDir('locks'), f'{digest}.lock')
+    spawner = multiprocessing.get_context('spawn')
+    processes = [
+        spawner.Process(target=_roundupSubdir, args=(cwd, i.subdir, environ, args), name=i.label)
+        for i in contexts
+    ]
+    for process in processes: process.start()
+    for process in processes: process.join()
+    failed = [i.name for i in processes if i.exitcode != 0]
+    if failed:
+        _logger.critical('💀 Roundup failed for %s', ', '.join(failed))
         sys.exit(1)
     sys.exit(0)
 
@@ -0,0 +1,71 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Planning. A plan tells what a roundup would do—which steps, which commands,
+and about how long—without doing any of it.'''
+
+from .fetching import plan_prefetch
+from .journal import Journal
+from .scheduler import dependencies
+import shlex, statistics
+
+
+def _duration(seconds):
+    '''Format ``seconds`` for humans'''
+    if seconds is None: return '?'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f'{minutes}m {seconds:02d}s' if minutes else f'{seconds}s'
+
+
+def plan(assembly):
+    '''Return a human-readable plan of the roundup the given ``assembly`` would do: its steps in
+    order, what each one waits for, the command lines each would invoke, and an estimate of each
+    step's duration based on the journals of earlier roundups.
+    '''
+    context, steps = assembly.context, assembly.createSteps()
+    history = Journal.history(
+        context.getStateDir('journal'), assembly.__class__.__name__, context.label
+    )
+    graph = dependencies(steps)
+    lines, estimates = [], []
+    prefetch = plan_prefetch(steps)
+    if prefetch:
+        lines.append('  Before the steps start, everything they need from origin:')
+        lines.extend(f'       $ {shlex.join(argv)}' for argv in prefetch)
+    for number, step in enumerate(steps, 1):
+        name = step.__class__.__name__
+        durations = history.get(name)
+        estimate = statistics.median(durations) if durations else None
+        estimates.append(estimate)
+        lane = ', in the background' if step.background else ''
+        lines.append(f'{number:>3}. {name} (~{_duration(estimate)}{lane})')
+        # Only mention the steps this one waits on directly, not the ones they in turn wait on
+        direct = {i for i in graph[step] if not any(i in graph[j] for j in graph[step])}
+        waits = sorted(steps.index(i) + 1 for i in direct)
+        if waits:
+            lines.append(f'       waits for: {", ".join(str(i) for i in waits)}')
+        try:
+            commands = step.plan()
+        except Exception as ex:
+            lines.append(f'       «cannot plan this step: {ex}»')
+            continue
+        for argv in commands:
+            lines.append(f'       $ {shlex.join(argv)}')
+    if steps:
+        lines.append('  At the end, whatever was committed or tagged but not yet pushed:')
+        for argv in context.transaction.plan_sync('«branch»'):
+            lines.append(f'       $ {shlex.join(argv)}')
+
+    known = [i for i in estimates if i is not None]
+    total = _duration(sum(known)) if known else '?'
+    caveat = '' if len(known) == len(estimates) else f', not counting {len(estimates) - len(known)} unknown step(s)'
+    header = (
+        f'🗺 Plan for {assembly.__class__.__name__} in {context.label} at {context.cwd}: '
+        f'{len(steps)} step(s), ~{total} one after another{caveat}'
+    )
+    if known and getattr(context.args, 'jobs', 1) > 1:
+        # The critical path through the graph is the best we could do with enough jobs
+        finish = {}
+        for step, estimate in zip(steps, estimates):
+            finish[step] = (estimate or 0.0) + max((finish[i] for i in graph[step]), default=0.0)
+        header += f', or ~{_duration(max(finish.values()))} at best with --jobs {context.args.jobs}'
+    return '\n'.join([header] + lines)
@@ -0,0 +1,208 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Requirements. Makes the ``REQUIREMENTS.md`` report of which requirements the
+current version implements or impacts, in the same format the ``requirement-report`` command
+did. Instead of walking every issue through the GitHub API each time, we keep an index of the
+repository's issues—their labels, when they closed, and which requirements they name—and ask
+GitHub only for the issues updated since the last roundup.'''
+
+from .util import git_tag_dates, parse_timestamp, plan_git_tag_dates
+from packaging.version import InvalidVersion, Version
+import datetime, json, logging, os, re
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Issues with this label are requirements
+_requirementLabel = 'requirement'
+
+# Labels like ``requirement-topic:Something`` put requirements under the topic ``Something``
+_topicPrefix = 'requirement-topic'
+
+# Issues name the requirements they impact after this in their bodies
+_applicable = '**Applicable requirements'
+_reference = re.compile(r'#([0-9]+)')
+
+# Kinds of issues that impact requirements, in the order they appear in the report
+_issueTypes = ('bug', 'enhancement')
+
+# Tags with these suffixes are for development versions
+_devSuffixes = ('-dev', '-SNAPSHOT')
+
+# Bump this when what we keep of issues changes, so old indexes get synced from scratch
+_indexVersion = 1
+
+# How often to sync every issue anyway, so ones deleted or moved to other repositories go away
+_fullSyncInterval = datetime.timedelta(days=30)
+
+
+# Classes
+# =======
+
+class IssueIndex(object):
+    '''What the report needs to know about the issues of ``owner``'s ``repo`` as of the last sync,
+    kept in a JSON file in ``indexDir``.
+    '''
+    def __init__(self, indexDir, owner, repo):
+        self.owner, self.repo = owner, repo
+        self.path = os.path.join(indexDir, f'{owner}--{repo}.json')
+        self.synced, self.fullSync, self.issues = None, None, {}
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(path={self.path},#issues={len(self.issues)},synced={self.synced})>'
+
+    def load(self):
+        '''Load the index if there is a usable one; tell if there was'''
+        try:
+            with open(self.path, 'r') as f:
+                indexed = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if indexed.get('version') != _indexVersion: return False
+        self.synced, self.fullSync = indexed['synced'], indexed['fullSync']
+        self.issues = {int(number): issue for number, issue in indexed['issues'].items()}
+        return True
+
+    def save(self):
+        '''Save the index, atomically so a roundup running alongside never sees half of it'''
+        temporary = f'{self.path}.{os.getpid()}'
+        with open(temporary, 'w') as f:
+            json.dump({
+                'version': _indexVersion, 'synced': self.synced, 'fullSync': self.fullSync, 'issues': self.issues
+            }, f)
+        os.replace(temporary, self.path)
+
+    def sync(self, github):
+        '''Bring the index up to date using the ``github`` client, asking only for issues (and,
+        like ``requirement-report``, pull requests) updated since the last sync unless it's been
+        a while since we asked for all of them. Return how many issues we got.
+        '''
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self.fullSync is None or now - datetime.datetime.fromisoformat(self.fullSync) > _fullSyncInterval:
+            self.synced, self.fullSync, self.issues = None, now.isoformat(), {}
+        params, count = {'state': 'all', 'sort': 'updated', 'direction': 'asc'}, 0
+        if self.synced: params['since'] = self.synced
+        for issue in github.paginate(f'/repos/{self.owner}/{self.repo}/issues', params):
+            body = (issue.get('body') or '').split(_applicable)
+            self.issues[issue['number']] = {
+                'title': issue['title'], 'state': issue['state'], 'closedAt': issue['closed_at'],
+                'labels': [i['name'] for i in issue['labels']],
+                'requirements': [int(i) for i in _reference.findall(body[1])] if len(body) > 1 else [],
+            }
+            # ISO 8601 timestamps in UTC sort as strings
+            self.synced = max(self.synced or '', issue['updated_at'])
+            count += 1
+        return count
+
+
+# Functions
+# =========
+
+def _isDev(tag):
+    return tag.endswith(_devSuffixes)
+
+
+def currentTag(tagNames, dev):
+    '''Return the tag among ``tagNames`` with the highest version, among development versions if
+    ``dev`` or else among the others; or None if there isn't one.
+    '''
+    candidates = []
+    for name in tagNames:
+        if _isDev(name) != dev: continue
+        try:
+            candidates.append((Version(name.replace('-SNAPSHOT', '.dev0')), name))
+        except InvalidVersion:
+            pass
+    return max(candidates)[1] if candidates else None
+
+
+def _topic(issue):
+    '''Tell the topic of the requirement ``issue``; the last topic label wins'''
+    topic = None
+    for label in issue['labels']:
+        if label.startswith(_topicPrefix): topic = label.split(':')[1]
+    return topic or 'default'
+
+
+def render(index, tagDates, tag):
+    '''Render the requirements report for ``tag`` from the issues in the ``index``, using the
+    (name, date) pairs of ``tagDates`` to tell which tag each closed issue went into.
+    '''
+    oldestFirst = sorted(tagDates, key=lambda item: item[1])
+
+    def earliestTagAfter(closedAt):
+        closed = parse_timestamp(closedAt)
+        return next((name for name, date in oldestFirst if date > closed), None)
+
+    # Which issues impact which requirements, and which tags those issues went into
+    impacts = {}
+    for number, issue in sorted(index.issues.items()):
+        if issue['state'] != 'closed' or not issue['closedAt']: continue
+        for requirement in issue['requirements']:
+            issues, tags = impacts.setdefault(requirement, (set(), set()))
+            issues.add(number)
+            tags.add(earliestTagAfter(issue['closedAt']))
+
+    topics = {}
+    for number, issue in sorted(index.issues.items()):
+        if _requirementLabel in issue['labels']: topics.setdefault(_topic(issue), []).append(number)
+
+    base = f'https://github.com/{index.owner}/{index.repo}/issues'
+    text = 'Requirements Summary\n====================\n'
+    for topic, numbers in topics.items():
+        text += f'\n# {topic}\n'
+        for number in numbers:
+            issues, tags = impacts.get(number, (set(), set()))
+            impacted = tag in tags
+            icon = ':boom:' if impacted else ''
+            text += f'\n## {index.issues[number]["title"]} ([#{number}]({base}/{number})) {icon}\n'
+            if not impacted:
+                text += '\n\nThis requirement is not impacted by the current version'
+                continue
+            lines = {kind: [] for kind in _issueTypes}
+            for other in sorted(issues):
+                kind = next((i for i in index.issues[other]['labels'] if i in lines), None)
+                if kind: lines[kind].append(f'{index.issues[other]["title"]} ([#{other}]({base}/{other}))')
+            for kind, items in lines.items():
+                if items:
+                    text += f'\n\nThe {kind}s which impact this requirements are:\n'
+                    text += ''.join(f'- {i}\n' for i in items)
+    return text
+
+
+def generate(github, indexDir, owner, repo, outputDir, dev):
+    '''Write the requirements report of ``owner``'s ``repo`` for its current version (a
+    development version if ``dev``) to ``outputDir``, syncing the issue index in ``indexDir``
+    with the ``github`` client first. Return the path to the report and whether it changed; or
+    None and False if there's no suitable version to report on.
+    '''
+    tagDates = git_tag_dates('authordate')
+    tag = currentTag([name for name, date in tagDates], dev)
+    if not tag:
+        _logger.info('🤷‍♀️ No suitable tag for a %s requirements report', 'development' if dev else 'stable')
+        return None, False
+    index = IssueIndex(indexDir, owner, repo)
+    index.load()
+    count = index.sync(github)
+    index.save()
+    _logger.info('📇 Got %d new or updated issue(s) from GitHub; %d in all', count, len(index.issues))
+
+    text = render(index, tagDates, tag)
+    path = os.path.join(outputDir, tag, 'REQUIREMENTS.md')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text: return path, False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path, True
+
+
+def plan_generate():
+    '''Return the command lines ``generate`` would invoke'''
+    return plan_git_tag_dates('authordate')
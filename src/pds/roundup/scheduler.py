@@ -0,0 +1,75 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Scheduler. A scheduler runs the steps of an assembly, overlapping the ones
+that don't depend on each other.'''
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def dependencies(steps):
+    '''Work out the directed acyclic graph of the given ``steps``: return a mapping from each step
+    to the set of earlier steps it must wait for.
+
+    A step depends on an earlier one if the earlier one writes a ``Resource`` the later one reads
+    or writes, or if the later one writes a ``Resource`` the earlier one reads. Steps that share
+    nothing but reads are independent. Since dependencies only ever point backwards in ``steps``,
+    the order of ``steps`` is always a valid order in which to run them.
+    '''
+    graph = {}
+    for index, step in enumerate(steps):
+        graph[step] = {
+            earlier for earlier in steps[:index]
+            if earlier.writes & (step.reads | step.writes) or step.writes & earlier.reads
+        }
+    return graph
+
+
+class Scheduler(object):
+    '''Run steps on a bounded pool of ``jobs`` worker threads, starting each step as soon as all
+    the steps it depends on have completed. With a single job, steps run one after another in
+    their given order, just like they always have.
+
+    Steps marked ``background`` (like artifact uploads) run in a separate publication lane that
+    doesn't count against ``jobs``, so even with a single job they overlap with the steps that
+    don't depend on them.
+
+    Once any step fails, no further steps are started; steps already running are allowed to
+    finish so we can tell how they fared.
+    '''
+    def __init__(self, steps, jobs=1):
+        self.steps, self.jobs = list(steps), max(1, jobs)
+        self.graph = dependencies(self.steps)
+        self.lanes = self.jobs + sum(1 for step in self.steps if step.background)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(#steps={len(self.steps)},jobs={self.jobs})>'
+
+    def run(self, execute):
+        '''Run each step by calling ``execute`` with it. Return a triple of the steps that
+        completed (in completion order), a sequence of ``(step, exception)`` pairs for those that
+        failed, and the steps that were never started.
+        '''
+        pending, running, completed, failed = list(self.steps), {}, [], []
+        with ThreadPoolExecutor(max_workers=self.lanes, thread_name_prefix='roundup') as pool:
+            while pending or running:
+                if not failed:
+                    for step in list(pending):
+                        busy = sum(1 for i in running.values() if not i.background)
+                        if busy >= self.jobs and not step.background: continue
+                        if self.graph[step].issubset(completed):
+                            pending.remove(step)
+                            if step.background:
+                                _logger.info('📤 Starting %s in the background', step.__class__.__name__)
+                            running[pool.submit(execute, step)] = step
+                if not running: break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step, ex = running.pop(future), future.exception()
+                    if ex is None:
+                        completed.append(step)
+                    else:
+                        failed.append((step, ex))
+        return completed, failed, pending
@@ -3,18 +3,55 @@
 '''🤠 PDS Roundup: A step takes you further towards a complete roundup'''
 
 from enum import Enum
-from .errors import InvokedProcessError
-from .util import git_pull, commit, invoke, invokeGIT, findNextMicro, TAG_RE, VERSION_RE, get_default_branch
-import logging, github3, tempfile, zipfile, os
+from .errors import GitHubError, InvokedProcessError
+from .util import git_pull, invoke, findNextMicro, TAG_RE, VERSION_RE, get_default_branch
+from .util import git_describe_tag, git_lock, plan_git_pull
+from . import changelog, docarchive, ghpages, requirements
+import json, logging, os
 
 _logger = logging.getLogger(__name__)
 
+# Release assets for documentation: the archive of it, and the manifest of what's in that
+_archiveName = 'documentation.zip'
+_manifestName = 'documentation.manifest.json'
+
+# How many changed doc files to name in the log before leaving the rest to debug output
+_changesShown = 20
+
+
+class Resource(Enum):
+    '''Enumerated things in the roundup's surroundings that a step may read or write. The
+    assembly uses these to tell which steps depend on each other and which may run at the same
+    time.
+    '''
+    dist        = 'dist'         # Built artifacts, such as ``dist/`` or ``target/``
+    docs        = 'docs'         # Generated documentation
+    environment = 'environment'  # Toolchain and process environment: venv, PATH, settings, git config
+    gitRefs     = 'gitRefs'      # Local and remote git commits, branches, and tags
+    release     = 'release'      # Published artifacts and GitHub releases
+    workspace   = 'workspace'    # The checked-out source tree
+
 
 class Step(object):
     '''An abstract step; executing steps comprises a roundup'''
+
+    # What ``Resource``s this step reads and writes. By default a step claims all of them,
+    # which makes it a barrier that runs only after everything before it and before anything
+    # after it. Subclasses should narrow these down so they can run alongside other steps.
+    reads  = frozenset(Resource)
+    writes = frozenset(Resource)
+
+    # Background steps spend most of their time waiting on the network, like uploads. They run
+    # in their own lane that doesn't count against ``--jobs``, so local steps keep going meanwhile;
+    # steps that depend on them still wait for them to finish—and to succeed.
+    background = False
+
+    # The ``StepName`` this step fills in its assembly; set by the context that creates it
+    name = None
+
     def __init__(self, assembly):
         '''Initialize a step with the given ``assembly``'''
-        self.assembly = assembly
+        self.assembly, self.facts = assembly, {}
 
     def __repr__(self):
         return f'<{self.__class__.__name__}()>'
@@ -22,6 +59,25 @@ class Step(object):
     def execute(self):
         raise NotImplementedError('Subclasses must implement ``execute``')
 
+    def plan(self):
+        '''Return the command lines (each a list of strings) this step would invoke, without
+        invoking or changing anything. Secrets and values known only at run time appear as
+        «placeholders». Steps that invoke commands override this.
+        '''
+        return []
+
+    def record(self, **facts):
+        '''Utility: note ``facts`` this step learned or produced (like a version number or the
+        files it built). They're kept in the context's ``objects`` for later steps, and in the
+        journal so a resumed roundup that skips this step still knows them.
+        '''
+        self.facts.update(facts)
+        self.assembly.context.objects.update(facts)
+
+    def getTransaction(self):
+        '''Utility: get the git transaction in which to commit and tag; see ``pds.roundup.transaction``'''
+        return self.assembly.context.transaction
+
     def getRepository(self):
         '''Utility: get the name of the GitHub repository'''
         return self.assembly.context.environ.get('GITHUB_REPOSITORY').split('/')[1]
@@ -47,6 +103,11 @@ class Step(object):
             return default_branch
         return ref_name
 
+    def plan_branch_ref(self):
+        '''Utility: like ``get_branch_ref`` but for planning, so it never asks the remote anything'''
+        ref_name = self.assembly.context.environ.get('GITHUB_REF_NAME', 'main')
+        return '«default branch»' if TAG_RE.match(ref_name) or VERSION_RE.match(ref_name) else ref_name
+
 
 class StepName(Enum):
     '''Enumerated identifiers for each of the possible steps of a roundup'''
@@ -75,6 +136,8 @@ class StepName(Enum):
 
 class NullStep(Step):
     '''This is a "null" or "no-op" step that does nothing.'''
+    reads = writes = frozenset()
+
     def execute(self):
         pass
         # But for development, this sure is handy:
@@ -85,6 +148,8 @@ class NullStep(Step):
 
 class ChangeLogStep(Step):
     '''This step generates a PDS-style changelog'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
 
     # NASA-PDS/roundup-action#29: do not use these _sections anymore
     # _sections = '{"requirements":{"prefix":"**Requirements:**","labels":["requirement"]},' \
@@ -102,7 +167,7 @@ class ChangeLogStep(Step):
         '''
         _logger.debug('🏷 For changelog generation, figuring out the future release')
         try:
-            tag = invokeGIT(['describe', '--tags', '--abbrev=0', '--match', 'release/*']).strip()
+            tag = git_describe_tag('release/*')
             if not tag:
                 raise RuntimeError
         except (RuntimeError, InvokedProcessError):
@@ -122,72 +187,80 @@ class ChangeLogStep(Step):
         _logger.debug('🆕 Future release will be %s', tag)
         return tag
 
+    # Issues with these labels stay out of the changelog
+    _excludeLabels = ('wontfix', 'duplicate', 'invalid', 'theme')
+
+    # Where issues with none of the ``_sections`` labels go
+    _issuesLabel = '**Other closed issues:**'
+
+    # Labels to show on each issue's line. NASA-PDS/roundup-action#29, change these labels from this:
+    # ('s.low', 's.medium', 's.high', 's.critical')
+    # to this:
+    _lineLabels = ('s.critical', 's.high', 's.low', 's.medium')
+
     def execute(self):
         token = self.getToken()
         if not token:
             _logger.info('🤷‍♀️ No GitHub administrative token; cannot generate changelog')
             return
-        git_pull(self.get_branch_ref())
-        invoke([
-            'github_changelog_generator',
-            '--user',
-            self.getOwner(),
-            '--project',
-            self.getRepository(),
-            '--output',
-            'CHANGELOG.md',
-            '--token',
-            token,
-            # NASA-PDS/roundup-action#29, include the next release in the changelog:
-            '--future-release',
-            self._determineFutureRelease(),
-            '--configure-sections',
-            self._sections,
-            '--no-pull-requests',
-            '--exclude-labels',
-            'wontfix,duplicate,invalid,theme',
-            '--issues-label',
-            '**Other closed issues:**',
-            '--issue-line-labels',
-            # NASA-PDS/roundup-action#29, change these labels from this:
-            # 's.low,s.medium,s.high,s.critical'
-            # to this:
-            's.critical,s.high,s.low,s.medium'
-        ])
-        commit('CHANGELOG.md', 'Update changelog', self.get_branch_ref())
+        context = self.assembly.context
+        # The changelog comes from the whole repository's history, so keep other roundups of
+        # this repository from changing it in the middle
+        with git_lock():
+            git_pull(self.get_branch_ref())
+            changelog.generate(
+                context.github, context.getStateDir('changelog'), self.getOwner(), self.getRepository(),
+                'CHANGELOG.md', self._determineFutureRelease(), json.loads(self._sections), self._issuesLabel,
+                self._excludeLabels, self._lineLabels
+            )
+            self.getTransaction().commit_file('CHANGELOG.md', 'Update changelog', self.get_branch_ref())
+
+    def plan(self):
+        if not self.getToken(): return []
+        branch = self.plan_branch_ref()
+        return plan_git_pull(branch) + [
+            ['git', 'describe', '--tags', '--abbrev=0', '--match', 'release/*'],
+        ] + changelog.plan_generate() + self.getTransaction().plan_commit_file('CHANGELOG.md', 'Update changelog', branch)
 
 
 class RequirementsStep(Step):
     '''This step generates a PDS-style requirements file'''
+    reads  = frozenset({Resource.environment, Resource.gitRefs, Resource.workspace})
+    writes = frozenset({Resource.gitRefs, Resource.workspace})
+
     def execute(self):
         token = self.getToken()
         if not token:
             _logger.info('🤷‍♀️ No GitHub administrative token; cannot generate requirements')
             return
-        git_pull(self.get_branch_ref())
-        argv = [
-            'requirement-report',
-            '--format',
-            'md',
-            '--organization',
-            self.getOwner(),
-            '--repository',
-            self.getRepository(),
-            '--output',
-            'docs/requirements/',
-            '--token',
-            token
-        ]
-        if not self.assembly.isStable():
-            argv.append('--dev')
-        generatedFile = invoke(argv).strip()
-        if not generatedFile:
-            _logger.warn('🤨 Did not get a requirements file from the requirement-report; will skip it')
-            return
-        commit(generatedFile, 'Update requirements', self.get_branch_ref())
+        context = self.assembly.context
+        with git_lock():
+            git_pull(self.get_branch_ref())
+            generatedFile, changed = requirements.generate(
+                context.github, context.getStateDir('requirements'), self.getOwner(), self.getRepository(),
+                'docs/requirements/', not self.assembly.isStable()
+            )
+            if not generatedFile:
+                _logger.warn('🤨 Did not get a requirements file; will skip it')
+                return
+            if not changed:
+                _logger.info('🟰 The requirements in %s are unchanged, so not committing them', generatedFile)
+                return
+            self.getTransaction().commit_file(generatedFile, 'Update requirements', self.get_branch_ref())
+
+    def plan(self):
+        if not self.getToken(): return []
+        branch = self.plan_branch_ref()
+        return plan_git_pull(branch) + requirements.plan_generate() + self.getTransaction().plan_commit_file(
+            '«requirements file»', 'Update requirements', branch
+        )
 
 
 class DocPublicationStep(Step):
+    '''This step sends the generated documentation to the GitHub release and GitHub Pages'''
+    reads  = frozenset({Resource.docs, Resource.environment, Resource.gitRefs, Resource.release})
+    writes = frozenset({Resource.gitRefs, Resource.release})
+
     def getDocDir(self):
         if self.assembly.context.args.documentation_dir:
             return self.assembly.context.args.documentation_dir
@@ -199,67 +272,95 @@ class DocPublicationStep(Step):
         if not token:
             _logger.info('🤷‍♀️ No GitHub administrative token; cannot send doc artifacts to GitHub')
             return
-        github = github3.login(token=token)
-        repo = github.repository(self.getOwner(), self.getRepository())
-
-        # 😮 TODO: There's a race here. This code is looking for the *latest* release, which
-        # we assume was made by the earlier ``StepName.githubRelease`` step. It's possible someone
-        # could create another release in between these steps! It'd be better if we fetched the
-        # release being worked on directly.
-        tmpFileName, docDir = None, self.getDocDir()
-        try:
-            release = repo.releases().next()  # ← here
-        except StopIteration:
-            _logger.info('🧐 No releases found at all, so I cannot publish documentation assets to them')
+        github, owner, repository = self.assembly.context.github, self.getOwner(), self.getRepository()
+
+        # The ``StepName.githubRelease`` step records the tag it released, so we can get that very
+        # release. Without one (like for snapshots) we fall back on the latest release, which is
+        # racy: someone could make another release in between these steps.
+        docDir, tag = self.getDocDir(), self.assembly.context.objects.get('githubTag')
+        release = github.release(owner, repository, tag)
+        if release is None:
+            if tag:
+                _logger.info('🧐 No release for tag %s, so I cannot publish documentation assets to it', tag)
+            else:
+                _logger.info('🧐 No releases found at all, so I cannot publish documentation assets to them')
             return
 
-        try:
-            # Make a ZIP archive of the docs
-            fd, tmpFileName = tempfile.mkstemp('.zip')
-            foundFiles = False
-            with zipfile.ZipFile(os.fdopen(fd, 'wb'), 'w') as zf:
-                for folder, subdirs, filenames in os.walk(docDir):
-                    for fn in filenames:
-                        path = os.path.join(folder, fn)
-                        # Avoid things like Unix-domain sockets if they just happen to appear:
-                        if os.path.isfile(path):
-                            foundFiles = True
-                            zf.write(path, path[len(docDir) + 1:])
-
-            if not foundFiles:
-                _logger.info('🧐 No doc files in %s, so I am not updating the `documentation.zip` asset', docDir)
-                parent = os.path.abspath(os.path.join(docDir, '..'))
-                _logger.debug('🙁 Here is what is in the doc dir parent %s:', parent)
-                invoke(['/bin/ls', '-lR', parent])
+        if not docarchive.hasFiles(docDir):
+            _logger.info('🧐 No doc files in %s, so I am not updating the `documentation.zip` asset', docDir)
+            parent = os.path.abspath(os.path.join(docDir, '..'))
+            _logger.debug('🙁 Here is what is in the doc dir parent %s:', parent)
+            invoke(['/bin/ls', '-lR', parent])
+            return
+
+        # Skip the upload if the docs are the same as those in the ``documentation.zip`` already
+        # there, according to the manifest we put next to it last time
+        manifest, assets = docarchive.manifest(docDir), {i['name']: i for i in github.assets(release)}
+        previous = self._previousManifest(github, assets)
+        if previous and previous['root'] == manifest['root'] and _archiveName in assets:
+            _logger.info('🟰 The %d doc files are unchanged, so leaving `%s` as it is', len(manifest['files']), _archiveName)
+        else:
+            if previous: self._logChanges(previous, manifest)
+
+            # Remove any existing ``documentation.zip`` and its manifest; the manifest goes first
+            # so it never describes an archive that isn't there
+            for name in (_manifestName, _archiveName):
+                if name in assets: github.deleteAsset(assets[name])
+
+            # Add a ZIP archive of the docs as a downloadable asset, then its manifest
+            self._uploadArchive(github, release, docDir)
+            github.uploadAsset(
+                release, _manifestName, 'application/json', docarchive.dumpManifest(manifest), 'Documentation manifest'
+            )
+
+        # Per NASA-PDS/roundup-action#28 we also publish the documentation to GitHub pages—but for
+        # stable releases only.
+        if self.assembly.isStable():
+            # https://github.com/NASA-PDS/roundup-action/issues/49
+            # Warn if there isn't a doc dir but don't fail catastrophically
+            if not os.path.isdir(docDir):
+                _logger.warning("🧐 The doc dir «%s» doesn't exist, so skipping doc publication", docDir)
                 return
+            ghpages.publish(docDir, self.assembly.context.transaction, self._pagesSubdir(tag))
+
+    def _previousManifest(self, github, assets):
+        '''Return the manifest among the release ``assets``, or None if there isn't a usable one'''
+        if _manifestName not in assets: return None
+        try:
+            return docarchive.loadManifest(github.downloadAsset(assets[_manifestName]))
+        except GitHubError as ex:
+            _logger.info('🤷‍♀️ Cannot get the previous doc manifest (%s), so uploading docs regardless', ex)
+            return None
+
+    def _logChanges(self, previous, manifest):
+        '''Log which doc files changed going from the ``previous`` manifest to this one'''
+        for verb, names in zip(('added', 'removed', 'modified'), docarchive.changes(previous, manifest)):
+            if not names: continue
+            _logger.info('📝 %d doc file(s) %s: %s', len(names), verb, ', '.join(names[:_changesShown]))
+            if len(names) > _changesShown: _logger.debug('📝 And also: %s', ', '.join(names[_changesShown:]))
+
+    def _uploadArchive(self, github, release, docDir):
+        '''Upload a ZIP archive of ``docDir`` to the ``release`` as ``documentation.zip``, sending
+        it as it's made. Only if the server insists on knowing its size first do we make it
+        ahead of time, in a spooled file.
+        '''
+        args = (release, _archiveName, 'application/zip')
+        try:
+            github.uploadAsset(*args, docarchive.stream(docDir), 'Documentation (zip)')
+        except GitHubError as ex:
+            if ex.status != 411: raise
+            _logger.info('📏 GitHub needs the size of documentation.zip up front, so making it ahead of time')
+            with docarchive.spool(docDir) as spooled:
+                github.uploadAsset(*args, spooled, 'Documentation (zip)')
+
+    def _pagesSubdir(self, tag):
+        '''Return the subdirectory of GitHub Pages for the docs, if any, filling in the release's
+        ``tag`` and its version (the tag without any leading ``v``).
+        '''
+        template = getattr(self.assembly.context.args, 'pages_subdir', None) or ''
+        tag = tag or ''
+        return template.format(tag=tag, version=tag[1:] if tag.startswith('v') else tag)
 
-            # Remove any existing ``documentation.zip``
-            for asset in release.assets():
-                if asset.name == 'documentation.zip':
-                    asset.delete()
-                    break
-
-            # Add the new ZIP file as a downloadable asset
-            with open(tmpFileName, 'rb') as tmpFile:
-                release.upload_asset('application/zip', 'documentation.zip', tmpFile, 'Documentation (zip)')
-
-            # Per NASA-PDS/roundup-action#28 we also publish the documentation to GitHub pages—but for
-            # stable releases only.
-            if self.assembly.isStable():
-                # https://github.com/NASA-PDS/roundup-action/issues/49
-                # Warn if there isn't a doc dir but don't fail catastrophically
-                if not os.path.isdir(docDir):
-                    _logger.warning("🧐 The doc dir «%s» doesn't exist, so skipping doc publication", docDir)
-                    return
-                # See https://github.com/X1011/git-directory-deploy for details on ``deploy.sh``
-                # which is now part of the ``github-actions-base``.
-                invoke([
-                    'env',
-                    'GIT_DEPLOY_DIR=' + docDir,
-                    'GIT_DEPLOY_BRANCH=gh-pages',
-                    'GIT_DEPLOY_REPO=origin',
-                    '/usr/local/bin/deploy.sh',
-                    '--allow-empty',
-                ])
-        finally:
-            if tmpFileName is not None: os.remove(tmpFileName)
+    def plan(self):
+        if not self.getToken() or not self.assembly.isStable(): return []
+        return ghpages.plan_publish(self.assembly.context.transaction.remote)
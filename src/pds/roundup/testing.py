@@ -0,0 +1,194 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Testing. Runs a Python project's tests on all the cores we've got instead of
+one. With tox, its environments run side by side (``tox --parallel``), and on tox 4 the cores
+left over go to pytest-xdist within each one. Without tox but with pytest, the tests run under
+pytest-xdist if it's there, or else we share the test files out among several pytest processes
+ourselves. Either way, the failures from every environment or process end up in one report.'''
+
+from .errors import InvokedProcessError, TestFailuresError
+from .util import invoke
+from concurrent.futures import ThreadPoolExecutor
+import json, logging, os, tempfile
+import xml.etree.ElementTree as ET
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Tells if a module is importable without importing it
+_findModule = 'import importlib.util, sys; print(importlib.util.find_spec(sys.argv[1]) is not None)'
+
+# What pytest says when it's told ``-n`` but hasn't got pytest-xdist
+_noXdist = 'unrecognized arguments: -n'
+
+# pytest's exit status when it found no tests
+_noTests = 5
+
+# How many lines of each failure's output go into the report
+_reportLines = 20
+
+
+# Functions
+# =========
+
+def cores():
+    '''Tell how many cores we may use'''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def hasModule(python, module):
+    '''Tell if the ``python`` executable can import ``module``'''
+    return invoke([python, '-c', _findModule, module], capture=True).strip() == 'True'
+
+
+def _tail(text):
+    return '\n'.join(text.rstrip().splitlines()[-_reportLines:])
+
+
+def report(failures):
+    '''Log the ``failures``—(name, output) pairs—together, and raise ``TestFailuresError``'''
+    for name, output in failures:
+        _logger.error('💔 %s failed:\n%s', name, _tail(output))
+    _logger.error('💔 %d failure(s) in all: %s', len(failures), ', '.join(name for name, output in failures))
+    raise TestFailuresError([name for name, output in failures])
+
+
+def _toxFailures(results):
+    '''Get the failed commands, as (name, output) pairs, from tox's ``--result-json`` ``results``'''
+    failures = []
+    for env, result in results.get('testenvs', {}).items():
+        if not isinstance(result, dict): continue
+        for command in result.get('setup', []) + result.get('test', []):
+            if int(command.get('retcode', 0)) != 0:
+                argv = command.get('command', [])
+                failures.append((f'{env}: {" ".join(argv) if isinstance(argv, list) else argv}', command.get('output', '')))
+    return failures
+
+
+def _runTox(tox, major, envs, resultsFile, parallel, environ):
+    argv = [tox, '-e', ','.join(envs), '--result-json', resultsFile]
+    if parallel > 1: argv += ['--parallel', str(parallel)]
+    # Only tox 4 has ``--override``; tox 3 would refuse to run at all
+    if major >= 4 and 'PYTEST_ADDOPTS' in environ: argv += ['--override', 'testenv.pass_env+=PYTEST_ADDOPTS']
+    try:
+        invoke(argv, env=environ)
+        return []
+    except InvokedProcessError:
+        try:
+            with open(resultsFile, 'r') as f:
+                failures = _toxFailures(json.load(f))
+        except (OSError, ValueError):
+            failures = []
+        # If tox couldn't even get as far as running things, there's nothing better to report
+        if not failures: raise
+        return failures
+
+
+def runTox(tox, python, workers):
+    '''Run the project's tox environments using ``tox`` with up to ``workers`` processes, and
+    pytest-xdist in them if the project's ``python`` has it and there are cores to spare.
+    '''
+    listed = invoke([tox, '-l'], capture=True).splitlines()
+    envs = [i.strip() for i in listed if i.strip() and ' ' not in i.strip() and not i.strip().endswith(':')]
+    if not envs:
+        # No envlist, so just tox's default environment
+        invoke([tox])
+        return
+    parallel = max(1, min(len(envs), workers))
+    perEnv, environ = workers // parallel, dict(os.environ, TOX_PARALLEL_NO_SPINNER='1')
+    major = int(invoke([tox, '--version'], capture=True).split()[0].split('.')[0])
+    # Only tox 4 can be told to let PYTEST_ADDOPTS through to the environments
+    xdist, original = perEnv > 1 and major >= 4 and hasModule(python, 'xdist'), environ.get('PYTEST_ADDOPTS')
+    if xdist: environ['PYTEST_ADDOPTS'] = f'{original or ""} -n {perEnv}'.strip()
+    _logger.info(
+        '🧪 Running %d tox environment(s), %d at a time%s', len(envs), parallel,
+        f', with {perEnv} pytest-xdist workers each' if xdist else ''
+    )
+    with tempfile.TemporaryDirectory() as scratch:
+        failures = _runTox(tox, major, envs, os.path.join(scratch, 'results.json'), parallel, environ)
+        # Environments whose pytest lacks pytest-xdist get another go without it
+        retry = sorted({name.split(':')[0] for name, output in failures if _noXdist in output})
+        if retry and xdist:
+            _logger.info('🧪 Running %s again without pytest-xdist', ', '.join(retry))
+            failures = [(name, output) for name, output in failures if name.split(':')[0] not in retry]
+            if original is None:
+                del environ['PYTEST_ADDOPTS']
+            else:
+                environ['PYTEST_ADDOPTS'] = original
+            failures += _runTox(tox, major, retry, os.path.join(scratch, 'retry.json'), min(len(retry), workers), environ)
+    if failures: report(failures)
+
+
+def _junitFailures(path):
+    '''Get the failed tests, as (name, output) pairs, from the JUnit XML report at ``path``'''
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return []
+    failures = []
+    for case in root.iter('testcase'):
+        for problem in list(case.findall('failure')) + list(case.findall('error')):
+            name = '::'.join(i for i in (case.get('classname'), case.get('name')) if i)
+            failures.append((name, problem.text or problem.get('message') or ''))
+    return failures
+
+
+def collect(python):
+    '''Tell the test files pytest finds with the ``python`` and how many tests are in each'''
+    counts = {}
+    for line in invoke([python, '-m', 'pytest', '--collect-only', '--quiet', '-p', 'no:cacheprovider'], capture=True).splitlines():
+        if '::' in line:
+            path = line.split('::')[0]
+            counts[path] = counts.get(path, 0) + 1
+    return counts
+
+
+def shard(counts, shards):
+    '''Share out the test files of ``counts`` among at most ``shards`` lists with about as many
+    tests in each, largest files first.
+    '''
+    lists = [[] for i in range(min(shards, len(counts)))]
+    sizes = [0] * len(lists)
+    for path, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        smallest = sizes.index(min(sizes))
+        lists[smallest].append(path)
+        sizes[smallest] += count
+    return [sorted(i) for i in lists]
+
+
+def _runPytest(python, args, junit):
+    '''Run pytest with the ``python`` and ``args``, reporting to ``junit``; tell how it went'''
+    try:
+        invoke([python, '-m', 'pytest', '-p', 'no:cacheprovider', '--junitxml', junit, *args])
+        return 0
+    except InvokedProcessError as ex:
+        return ex.error.returncode
+
+
+def runPytest(python, workers):
+    '''Run the project's tests with the ``python``'s pytest using up to ``workers`` processes'''
+    if workers > 1 and hasModule(python, 'xdist'):
+        _logger.info('🧪 Running tests with %d pytest-xdist workers', workers)
+        shards = [['-n', str(workers)]]
+    elif workers > 1:
+        try:
+            shards = shard(collect(python), workers) or [[]]
+        except InvokedProcessError:
+            # pytest will say what's wrong with the tests when it runs them all at once
+            shards = [[]]
+        _logger.info('🧪 Running tests in %d process(es)', len(shards))
+    else:
+        shards = [[]]
+    with tempfile.TemporaryDirectory() as scratch, ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        junits = [os.path.join(scratch, f'shard-{index}.xml') for index in range(len(shards))]
+        statuses = list(pool.map(lambda job: _runPytest(python, *job), zip(shards, junits)))
+        failures = [failure for junit in junits for failure in _junitFailures(junit)]
+    if failures: report(failures)
+    broken = [status for status in statuses if status not in (0, _noTests)]
+    if broken: report([(f'pytest (status {status})', 'See its output above') for status in broken])
@@ -0,0 +1,124 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Tracing. An opt-in record of where a roundup spends its time, written in the
+Chrome trace event format so you can open it in ``chrome://tracing`` or https://ui.perfetto.dev/.
+'''
+
+from contextlib import contextmanager
+import json, logging, os, threading, time
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Command-line options whose following argument is a secret
+_secretOptions = frozenset(('--password', '--token'))
+
+# Environment variables whose values are secrets wherever they appear in an argv
+_secretVars = (
+    'ADMIN_GITHUB_TOKEN', 'CODE_SIGNING_KEY', 'GITHUB_TOKEN', 'NPMJS_COM_TOKEN', 'central_portal_token',
+    'pypi_password',
+)
+
+_redacted = '«redacted»'
+
+
+# Functions
+# =========
+
+def redact(argv):
+    '''Return a copy of the command line ``argv`` with anything that looks like a secret
+    replaced with a placeholder.
+    '''
+    secrets = [os.environ[var] for var in _secretVars if os.environ.get(var)]
+    redacted, hideNext = [], False
+    for arg in argv:
+        arg = str(arg)
+        if hideNext:
+            redacted.append(_redacted)
+        else:
+            for secret in secrets:
+                arg = arg.replace(secret, _redacted)
+            redacted.append(arg)
+        hideNext = arg in _secretOptions
+    return redacted
+
+
+# Classes
+# =======
+
+class Tracer(object):
+    '''A tracer collects timed spans and writes them as a Chrome trace JSON file at ``path``.
+    Spans may come from any thread.
+    '''
+    def __init__(self, path):
+        self.path, self.events, self._lock, self._origin = path, [], threading.Lock(), time.perf_counter()
+        self._threads = set()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(path={self.path},#events={len(self.events)})>'
+
+    @contextmanager
+    def span(self, name, category, **args):
+        '''Record a span called ``name`` in the given ``category`` around the body of a ``with``
+        statement. The ``with`` statement gets the ``args`` dict, to which you may add more
+        details as they become known.
+        '''
+        thread, start = threading.current_thread(), time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': thread.ident,
+                'args': args,
+            }
+            with self._lock:
+                self.events.append(event)
+                if thread.ident not in self._threads:
+                    self._threads.add(thread.ident)
+                    self.events.append({
+                        'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident,
+                        'args': {'name': thread.name},
+                    })
+
+    def write(self):
+        '''Write the spans collected so far to our ``path``'''
+        with self._lock:
+            trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+        with open(self.path, 'w') as out:
+            json.dump(trace, out)
+        _logger.info('⏱ Wrote %d trace events to %s', len(trace['traceEvents']), self.path)
+
+
+class _NullTracer(object):
+    '''A tracer that records nothing; used when tracing isn't enabled'''
+    @contextmanager
+    def span(self, name, category, **args):
+        yield args
+
+    def write(self):
+        pass
+
+
+_tracer = _NullTracer()
+
+
+def enable(path):
+    '''Start tracing, eventually writing the trace to ``path``'''
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def tracer():
+    '''Return the current tracer, which does nothing if tracing isn't enabled'''
+    return _tracer
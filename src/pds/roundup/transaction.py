@@ -0,0 +1,137 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Git transactions. Instead of pushing to origin after every commit and tag, steps
+make them locally in their context's transaction, which pushes everything in one atomic push at
+a few sync points: before a release tool looks at the remote, and at the end of the roundup.'''
+
+from .errors import InvokedProcessError
+from .util import git_config, git_lock, invokeGIT, plan_git_config, _pushStatuses
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class GitTransaction(object):
+    '''Commits, tags, tag deletions, and other ref updates made locally and waiting to be pushed
+    to ``remote``.
+
+    Pushing once means one network round trip instead of one per commit or tag, and with
+    ``--atomic`` either all of it lands on the remote or none of it does.
+    '''
+    def __init__(self, remote='origin'):
+        self.remote, self.branch, self.force, self.tags, self.deletions = remote, None, False, [], []
+        self.updates, self._configured = {}, False
+
+    def __repr__(self):
+        return (
+            f'<{self.__class__.__name__}(branch={self.branch},#tags={len(self.tags)},'
+            f'#deletions={len(self.deletions)},#updates={len(self.updates)})>'
+        )
+
+    def __bool__(self):
+        '''A transaction is true if it has anything waiting to be pushed'''
+        return bool(self.branch or self.tags or self.deletions or self.updates)
+
+    def _configure(self):
+        if not self._configured:
+            git_config()
+            self._configured = True
+
+    def add(self, path):
+        '''Stage the file at ``path`` for the next commit'''
+        with git_lock():
+            self._configure()
+            invokeGIT(['add', path])
+
+    def commit(self, message, branch, force=False):
+        '''Commit what's staged with the given ``message`` for the ``branch`` on the remote; if
+        ``force``, the push may overwrite whatever is on that branch—unless another commit waiting
+        to go with it mustn't, like the pom commits of roundup-action#76.
+        '''
+        with git_lock():
+            self._configure()
+            # Commits for another branch can't ride along with these, so get them out of the way
+            if self.branch not in (None, branch): self.sync()
+            invokeGIT(['commit', '--allow-empty', '--message', message])
+            # One push carries every pending commit, so it may force only if they all may
+            self.force = force if self.branch is None else self.force and force
+            self.branch = branch
+
+    def commit_file(self, filename, message, branch, force=True):
+        '''Commit the file named ``filename`` with the given ``message`` for the ``branch``. As the
+        Roundup always has, the push will overwrite the branch if need be, unless not ``force``.
+        '''
+        _logger.debug('🥼 Committing file %s with message «%s»', filename, message)
+        with git_lock():
+            self.add(filename)
+            self.commit(message, branch, force)
+
+    def tag(self, name, message):
+        '''Make (or remake) the annotated tag ``name`` at HEAD with the given ``message``'''
+        with git_lock():
+            invokeGIT(['tag', '--annotate', '--force', '--message', message, name])
+            if name not in self.tags: self.tags.append(name)
+
+    def delete_tag(self, name):
+        '''Delete the tag ``name`` from the remote'''
+        with git_lock():
+            if name not in self.deletions: self.deletions.append(name)
+
+    def update(self, ref, commit, expected):
+        '''Set the remote's ``ref`` to the given ``commit``, which needn't be on any local branch,
+        but only if the remote's ``ref`` is still at the ``expected`` commit—or, if ``expected`` is
+        None, doesn't exist yet.
+        '''
+        with git_lock():
+            self.updates[ref] = (commit, expected)
+
+    def leases(self):
+        '''Return the options that keep the next push from clobbering refs that moved meanwhile'''
+        return [f'--force-with-lease={ref}:{expected or ""}' for ref, (commit, expected) in self.updates.items()]
+
+    def refspecs(self):
+        '''Return the refspecs the next push would carry'''
+        refspecs = [f'{commit}:{ref}' for ref, (commit, expected) in self.updates.items()]
+        if self.branch: refspecs.append(f'{"+" if self.force else ""}HEAD:refs/heads/{self.branch}')
+        refspecs.extend(f'refs/tags/{tag}:refs/tags/{tag}' for tag in self.tags)
+        refspecs.extend(f':refs/tags/{tag}' for tag in self.deletions)
+        return refspecs
+
+    def sync(self):
+        '''Push everything waiting in this transaction to the remote at once, then start afresh.
+        On failure, raise an exception and keep everything waiting.
+        '''
+        with git_lock():
+            refspecs = self.refspecs()
+            if not refspecs: return
+            _logger.info('📤 Pushing %d ref update(s) to %s at once', len(refspecs), self.remote)
+            if self.branch:
+                # NASA-PDS/roundup-action#98: pull before pushing in case someone else pushed meanwhile
+                try:
+                    invokeGIT(['pull', '--quiet', '--no-edit', '--no-stat', self.remote, self.branch])
+                except InvokedProcessError:
+                    _logger.info('🔁 Pull before push to HEAD:%s failed but pressing on', self.branch)
+            try:
+                output = invokeGIT(['push', '--atomic', '--porcelain'] + self.leases() + [self.remote] + refspecs)
+            except InvokedProcessError as ex:
+                if b'support --atomic' not in ex.error.stderr: raise
+                # Some remotes can't do atomic pushes; all we can do then is push it all anyway
+                _logger.info('🤷 %s cannot push atomically, so pushing everything non-atomically', self.remote)
+                output = invokeGIT(['push', '--porcelain'] + self.leases() + [self.remote] + refspecs)
+            for refspec, (flag, summary) in _pushStatuses(output).items():
+                _logger.debug('📤 %s %s %s', flag, refspec, summary)
+            self.branch, self.force, self.tags, self.deletions, self.updates = None, False, [], [], {}
+
+    def plan_commit_file(self, filename, message, branch):
+        '''Return the command lines ``commit_file`` would invoke'''
+        return plan_git_config() + [
+            ['git', 'add', filename],
+            ['git', 'commit', '--allow-empty', '--message', message],
+        ]
+
+    def plan_sync(self, branch):
+        '''Return the command lines ``sync`` would invoke with commits for ``branch``'''
+        return [
+            ['git', 'pull', '--quiet', '--no-edit', '--no-stat', self.remote, branch],
+            ['git', 'push', '--atomic', '--porcelain', self.remote, '«commits, tags, and tag deletions so far»'],
+        ]
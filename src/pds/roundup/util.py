@@ -2,16 +2,33 @@
 
 '''🤠 PDS Roundup — Utilities'''
 
-from .errors import InvokedProcessError
-import subprocess, logging, re, os
+from .accounting import Meter
+from .errors import InvokedProcessError, InvokedProcessTimeoutError
+from .tracing import tracer, redact
+from .watchdog import Watchdog
+from contextlib import contextmanager
+import subprocess, logging, re, os, fcntl, threading, collections, datetime, time
 
 
 _logger = logging.getLogger(__name__)
 
+# Serializes access to shared git state; see ``git_lock``
+_gitLock, _gitLockDepth = threading.RLock(), 0
+
 
 # Constants
 # =========
 
+# How many of the last lines of a process's output we keep to report when it fails
+_tailLines = 200
+
+# Longest line we read in one go from a process; longer ones come in pieces
+_maxLineLength = 64 * 1024
+
+# Most bytes of arguments to put on one command line when doing things in bulk; well under the
+# argument limits of any system we run on
+_maxArgBytes = 96 * 1024
+
 TAG_RE = re.compile(r'^release/(\d+)\.(\d+)(\.(\d+))?')
 VERSION_RE = re.compile(r'^v(\d+)\.(\d+)\.(\d+)')
 
@@ -61,27 +78,131 @@ def add_version_label_to_open_bugs(version):
     # ])
 
 
-def invoke(argv):
-    '''Execute a command within the operating system, returning its output. On any error,
-    raise ane exception. The command is the first element of ``argv``, with remaining elements
-    being arguments to the command.
+class _Output(object):
+    '''The output from one stream of an invoked process. Each line we ``add`` is logged with the
+    given ``prefix``; we keep just the last few lines for reporting failures, unless told to
+    ``keep`` them all.
     '''
-    _logger.debug('🏃‍♀️ Running «%r»', argv)
-    try:
-        cp = subprocess.run(argv, stdin=subprocess.DEVNULL, capture_output=True, check=True)
-        _logger.debug('🏁 Run complete, rc=%d', cp.returncode)
-        _logger.debug('Stdout = «%s»', cp.stdout.decode('utf-8'))
-        _logger.debug('Stderr = «%s»', cp.stderr.decode('utf-8'))
-        return cp.stdout.decode('utf-8')
-    except subprocess.CalledProcessError as ex:
-        _logger.critical('💥 Process with command line %r failed with status %d', argv, ex.returncode)
-        _logger.critical('🪵 Stdout = «%s»', ex.stdout.decode('utf-8'))
-        _logger.critical('📚 Stderr = «%s»', ex.stderr.decode('utf-8'))
-        raise InvokedProcessError(ex)
+    def __init__(self, prefix, keep):
+        self.prefix, self.size, self.last = prefix, 0, time.monotonic()
+        self.tail, self.lines = collections.deque(maxlen=_tailLines), [] if keep else None
+
+    def add(self, line):
+        self.size, self.last = self.size + len(line), time.monotonic()
+        self.tail.append(line)
+        if self.lines is not None: self.lines.append(line)
+        _logger.debug('%s %s', self.prefix, line.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+    def output(self):
+        '''Return everything we kept: all of it if we were told to keep it, else the tail'''
+        return b''.join(self.lines if self.lines is not None else self.tail)
 
 
-def invokeGIT(gitArgs):
-    '''Execute the ``git`` command with the given ``gitArgs``.'''
+class _Pump(threading.Thread):
+    '''A thread that reads a process's output ``stream`` line by line as it comes and adds each
+    line to the given ``_Output``.
+    '''
+    def __init__(self, stream, output):
+        super(_Pump, self).__init__(name=f'{threading.current_thread().name}-pump', daemon=True)
+        self.stream, self.output = stream, output
+
+    def run(self):
+        for line in iter(lambda: self.stream.readline(_maxLineLength), b''):
+            self.output.add(line)
+        self.stream.close()
+
+
+class _Feeder(threading.Thread):
+    '''A thread that writes each chunk of bytes from ``chunks`` to a process's input ``stream``
+    and then closes it, noting any exception from making the chunks in ``failure``.
+    '''
+    def __init__(self, stream, chunks):
+        super(_Feeder, self).__init__(name=f'{threading.current_thread().name}-feeder', daemon=True)
+        self.stream, self.chunks, self.failure = stream, chunks, None
+
+    def run(self):
+        try:
+            for chunk in self.chunks:
+                self.stream.write(chunk)
+        except BrokenPipeError:
+            pass  # The process quit early; its exit status tells why
+        except BaseException as ex:
+            self.failure = ex
+        finally:
+            try:
+                self.stream.close()
+            except BrokenPipeError:
+                pass
+
+
+def _outputs(name, capture):
+    '''Make the ``_Output``s for the standard output and error of a process called ``name``'''
+    return _Output(f'🪵 {name}›', capture), _Output(f'📚 {name}›', False)
+
+
+def _finish(argv, rc, stdout, stderr, details, capture, reason=None):
+    '''Wrap up the process invoked with ``argv`` that exited with status ``rc`` and wrote the
+    ``_Output``s ``stdout`` and ``stderr``: note the trace ``details``, and either raise an
+    ``InvokedProcessError`` or return the output if we were to ``capture`` it. If the watchdog
+    killed the process, the ``reason`` tells why and we raise ``InvokedProcessTimeoutError``.
+    '''
+    details.update(exitCode=rc, stdoutBytes=stdout.size, stderrBytes=stderr.size)
+    if reason:
+        details.update(killed=reason)
+        _logger.critical('⏰ Process with command line %r was killed because %s', redact(argv), reason)
+    elif rc != 0:
+        _logger.critical('💥 Process with command line %r failed with status %d', argv, rc)
+    if reason or rc != 0:
+        for label, output in (('🪵 Stdout', stdout), ('📚 Stderr', stderr)):
+            tail = b''.join(output.tail).decode('utf-8', errors='replace')
+            _logger.critical('%s (last %d lines) = «%s»', label, len(output.tail), tail)
+        error = subprocess.CalledProcessError(rc, argv, stdout.output(), stderr.output())
+        raise InvokedProcessTimeoutError(error, reason) if reason else InvokedProcessError(error)
+    _logger.debug('🏁 Run complete, rc=%d', rc)
+    return stdout.output().decode('utf-8') if capture else None
+
+
+def invoke(argv, capture=False, input=None, env=None, cwd=None):
+    '''Execute a command within the operating system. On any error, raise ane exception. The
+    command is the first element of ``argv``, with remaining elements being arguments to the
+    command.
+
+    The command's output is logged line by line as it happens, and only the last few lines are
+    kept to report in case it fails. If you need the output, set ``capture`` and you'll get all
+    of its standard output back as a string; otherwise you get None.
+
+    If the command runs out of time or stalls (see ``pds.roundup.watchdog``), it and all its
+    descendants get killed and you get an ``InvokedProcessTimeoutError``.
+
+    Give an ``input`` iterable of bytes to write them to the command's standard input as it runs,
+    and an ``env`` mapping to run it with those environment variables instead of ours. Give a
+    ``cwd`` to run it in that directory instead of the current one.
+    '''
+    _logger.debug('🏃‍♀️ Running «%r»', argv)
+    name = os.path.basename(str(argv[0]))
+    category = 'git' if argv and argv[0] == 'git' else 'process'
+    with tracer().span(name, category, argv=redact(argv)) as details:
+        stdout, stderr = _outputs(name, capture)
+        watchdog = Watchdog(name, (stdout, stderr))
+        process = subprocess.Popen(
+            argv, stdin=subprocess.DEVNULL if input is None else subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, start_new_session=bool(watchdog), env=env, cwd=cwd
+        )
+        meter = Meter(process.pid)
+        pumps = _Pump(process.stdout, stdout), _Pump(process.stderr, stderr)
+        if input is not None: pumps += (_Feeder(process.stdin, input),)
+        for pump in pumps: pump.start()
+        watchdog.watch(process.pid)
+        rc = meter.wait(process)
+        watchdog.stop()
+        for pump in pumps: pump.join()
+        meter.finish(details)
+        if input is not None and pumps[-1].failure: raise pumps[-1].failure
+        return _finish(argv, rc, stdout, stderr, details, capture, watchdog.reason)
+
+
+def invokeGIT(gitArgs, input=None):
+    '''Execute the ``git`` command with the given ``gitArgs``, feeding it any ``input`` bytes.'''
 
     # 😬 The code below is to avoid making ``git`` ask ``ssh`` for a host key
     # verification. This should only happen with repositories that use ssh as
@@ -107,18 +228,108 @@ def invokeGIT(gitArgs):
     # ↑↑↑ End disabled code above these arrows ↑↑↑
 
     argv = ['git'] + gitArgs
-    return invoke(argv)
+    return invoke(argv, capture=True, input=input)
+
+
+# Git configuration we need or else things might fail
+_gitConfigs = (
+    # Starting with git 2.36, we need to tell git our directory is safe to use
+    ['config', '--global', '--add', 'safe.directory', '/github/workspace'],
+    # And give the bot its credit
+    ['config', '--local', 'user.email', 'pdsen-ci@jpl.nasa.gov'],
+    ['config', '--local', 'user.name', 'PDSEN CI Bot'],
+)
+
+
+def _readGit(question, **details):
+    '''Answer the ``question``—a function of a ``GitReader``—by reading the repository in-process.
+    Return None if we can't, so the caller can ask the ``git`` command instead.
+    '''
+    from .gitreader import GitReader
+    try:
+        with tracer().span(question.__name__, 'gitreader', **details) as span:
+            reader = GitReader.discover(os.getcwd())
+            answer = question(reader) if reader else None
+            span.update(answered=answer is not None)
+    except Exception as ex:
+        _logger.debug('🐙 Cannot read the repository in-process (%s); asking git instead', ex)
+        answer = None
+    return answer
+
+
+def git_describe_tag(pattern=None):
+    '''Return the name of the tag nearest to HEAD—just like ``git describe --tags --abbrev=0``—
+    considering only tags matching the glob ``pattern`` if given. On any error, raise an
+    exception.
+    '''
+    def describe(reader): return reader.describe(pattern)
+    tag = _readGit(describe, pattern=pattern)
+    if tag: return tag
+    return invokeGIT(['describe', '--tags', '--abbrev=0'] + (['--match', pattern] if pattern else [])).strip()
+
+
+def git_list_tags(pattern):
+    '''Return the names of tags matching the glob ``pattern`` like ``git tag --list``'''
+    def listTags(reader): return reader.listTags(pattern)
+    tags = _readGit(listTags, pattern=pattern)
+    if tags is not None: return tags
+    return [tag.strip() for tag in invokeGIT(['tag', '--list', pattern]).split('\n') if tag.strip()]
+
+
+def git_symbolic_ref(name):
+    '''Return the ref that the symbolic ref ``name`` points to like ``git symbolic-ref``'''
+    def symbolicRef(reader): return reader.symbolicRef(name)
+    ref = _readGit(symbolicRef, ref=name)
+    if ref: return ref
+    return invokeGIT(['symbolic-ref', name]).strip()
+
+
+def git_rev_parse(name):
+    '''Return the SHA that ``name`` (like ``HEAD``) points to like ``git rev-parse``'''
+    def resolve(reader): return reader.resolve(name)
+    sha = _readGit(resolve, ref=name)
+    if sha: return sha
+    return invokeGIT(['rev-parse', name]).strip()
+
+
+def parse_timestamp(timestamp):
+    '''Parse the ISO 8601 ``timestamp``, like those from git or GitHub, into a datetime in UTC'''
+    parsed = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def _tagDatesArgs(field):
+    return ['for-each-ref', f'--format=%(refname:strip=2)%00%({field}:iso-strict)%00%(*{field}:iso-strict)', 'refs/tags']
+
+
+def git_tag_dates(field='committerdate'):
+    '''Return the local tags, newest first, as (name, datetime) pairs, where the datetime is the
+    given ``field`` (like ``committerdate`` or ``authordate``) of the commit each tag points to.
+    '''
+    found = []
+    for line in invokeGIT(_tagDatesArgs(field)).splitlines():
+        name, date, peeledDate = line.split('\0')
+        # Annotated tags get the date of the commit they point to; lightweight ones are commits
+        date = peeledDate or date
+        if date: found.append((name, parse_timestamp(date)))
+    found.sort(key=lambda tag: (tag[1], tag[0]), reverse=True)
+    return found
+
+
+def plan_git_tag_dates(field='committerdate'):
+    '''Return the command lines ``git_tag_dates`` would invoke'''
+    return [['git'] + _tagDatesArgs(field)]
 
 
 def git_config():
     '''Prepare necessary git configuration or else things might fail'''
+    for gitArgs in _gitConfigs:
+        invokeGIT(gitArgs)
 
-    # Starting with git 2.36, we need to tell git our directory is safe to use
-    invokeGIT(['config', '--global', '--add', 'safe.directory', '/github/workspace'])
 
-    # And give the bot its credit
-    invokeGIT(['config', '--local', 'user.email', 'pdsen-ci@jpl.nasa.gov'])
-    invokeGIT(['config', '--local', 'user.name', 'PDSEN CI Bot'])
+def plan_git_config():
+    '''Return the command lines ``git_config`` would invoke'''
+    return [['git'] + gitArgs for gitArgs in _gitConfigs]
 
 
 def get_default_branch():
@@ -144,7 +355,7 @@ def get_default_branch():
 
     # Try to get the default branch from local origin/HEAD (if already fetched)
     try:
-        result = invokeGIT(['symbolic-ref', 'refs/remotes/origin/HEAD'])
+        result = git_symbolic_ref('refs/remotes/origin/HEAD')
         # Result will be like "refs/remotes/origin/main" or "refs/remotes/origin/develop"
         branch = result.strip().replace('refs/remotes/origin/', '')
         if branch:
@@ -179,41 +390,23 @@ def get_default_branch():
 def git_pull(branch_ref_name='main'):
     # 😮 TODO: Use Python GitHub API
     # But I'm in a rush:
-    git_config()
-    # NASA-PDS/roundup-action#160 — pull from the named branch reference
-    invokeGIT(['pull', 'origin', branch_ref_name])
+    with git_lock():
+        git_config()
+        # NASA-PDS/roundup-action#160 — pull from the named branch reference
+        invokeGIT(['pull', 'origin', branch_ref_name])
 
 
-def commit(filename, message, branch_ref_name='main'):
-    '''Commit the file named ``filename`` to the local Git repository with the given ``message``.
-    '''
-    _logger.debug('🥼 Committing file %s with message «%s»', filename, message)
-    git_config()
-    invokeGIT(['add', filename])
-    invokeGIT(['commit', '--allow-empty', '--message', message])
-    # TODO: understand why a simple push does not work and make it work
-    # see bug https://github.com/actions/checkout/issues/317
-    #
-    # NASA-PDS/roundup-action#98 … @jimmie suggests putting a `git pull` before the push.
-    # @jordanpadams says that he did see an issue where a push occurred during a Roundup.
-    # @nutjob4life maintains that a `git pull` at this point would result in `Already up
-    # to date` but we all guess it wouldn't hurt.
-
-    try:
-        _logger.info('WTF')
-        invokeGIT(['branch'])
-        invokeGIT(['pull', '--quiet', '--no-edit', '--no-stat', branch_ref_name])
-    except InvokedProcessError:
-        _logger.info('🔁 Pull before push to HEAD:%s failed but pressing on', branch_ref_name)
-        pass
-    invokeGIT(['push', 'origin',  f'HEAD:{branch_ref_name}', '--force'])
+def plan_git_pull(branch_ref_name='main'):
+    '''Return the command lines ``git_pull`` would invoke'''
+    return plan_git_config() + [['git', 'pull', 'origin', branch_ref_name]]
 
 
 def findNextMicro():
     '''Find the next micro release number from the current repository'''
     _logger.debug('🔍 Finding next micro release')
     try:
-        tag = invokeGIT(['describe', '--tags']).strip()
+        # ``git describe --tags`` would add "-N-gSHA" after the tag but we only need the tag
+        tag = git_describe_tag()
         match = VERSION_RE.match(tag)
         if not match or not match.group(3):
             _logger.debug('🚭 No match for «%s» as a version tag or missing micro version number; assume 0', tag)
@@ -223,49 +416,136 @@ def findNextMicro():
     except InvokedProcessError as ex:
         _logger.info(
             '🧐 Error trying to get a git description, probably means there are no tags so using 0; stderr=«%s»',
-            ex.error.stderr.decode('utf-8')
+            ex.error.stderr.decode('utf-8', errors='replace')
         )
         return 0
 
 
 def contextFactories():
-    # ☑️ TODO: Think about a priority list instead of a dictionary.
-    #
-    # For example, we could have a PythonBuildoutContext which has setup.cfg, setup.py, but also
-    # buildout.cfg and bootstrap.py; if we detect those, we can do a builout-based context instead
-    # of a plain Python context.
+    '''Return a priority-ordered sequence of pairs of file names and the ``Context`` classes that
+    handle directories containing them. When a directory has more than one of these files, the
+    earliest pair wins.
+    '''
+    # Other specialized contexts go ahead of the general ones. For example, we could have a
+    # PythonBuildoutContext which has setup.cfg, setup.py, but also buildout.cfg and bootstrap.py;
+    # if we detect those, we can do a builout-based context instead of a plain Python context.
     from ._python import PythonContext
     from ._maven import MavenContext
     from ._nodejs import NodeJSContext
-    return {
-        'setup.cfg':         PythonContext,
-        'setup.py':          PythonContext,
-        'pom.xml':           MavenContext,
-        'project.xml':       MavenContext,
-        'package.json':      NodeJSContext,
-        'package-lock.json': NodeJSContext
-    }
+    return (
+        ('pom.xml',           MavenContext),
+        ('project.xml',       MavenContext),
+        ('setup.cfg',         PythonContext),
+        ('setup.py',          PythonContext),
+        ('package.json',      NodeJSContext),
+        ('package-lock.json', NodeJSContext),
+    )
+
+
+@contextmanager
+def git_lock():
+    '''Hold the lock on the repository's shared git state (tags, commits, pushes) for the body of
+    a ``with`` statement. The lock is re-entrant within a thread. Threads in this process take
+    turns; and if ``ROUNDUP_GIT_LOCK`` names a lock file in the environment, so do all the
+    roundup processes sharing it, like those rounding up several contexts of one repository.
+    '''
+    with _gitLock:
+        global _gitLockDepth
+        lockFile = os.environ.get('ROUNDUP_GIT_LOCK') if _gitLockDepth == 0 else None
+        fd = None
+        if lockFile:
+            fd = os.open(lockFile, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        _gitLockDepth += 1
+        try:
+            yield
+        finally:
+            _gitLockDepth -= 1
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
 
 
 def delete_tags(pattern):
     '''Delete tags matching ``pattern``.'''
-    try:
-        invokeGIT(['fetch', '--prune', '--unshallow', '--tags', '--prune-tags', '--force'])
-    except InvokedProcessError:
-        _logger.info('🤔 Unshallow prune fetch tags failed, so trying without unshallow')
-        invokeGIT(['fetch', '--prune', '--tags', '--prune-tags', '--force'])
-    tags = invokeGIT(['tag', '--list', pattern]).split('\n')
-    for tag in tags:
-        tag = tag.strip()
-        if not tag: continue
-        try:
-            _logger.debug('␡ Attempting to delete tag %s', tag)
-            invokeGIT(['tag', '--delete', tag])
-            invokeGIT(['push', '--delete', 'origin', tag])
-        except InvokedProcessError as ex:
-            _logger.info(
-                '🧐 Cannot delete tag %s, stdout=«%s», stderr=«%s»; but pressing on',
-                tag,
-                ex.error.stdout.decode('utf-8'),
-                ex.error.stderr.decode('utf-8'),
-            )
+    from .fetching import ensureFresh
+    with git_lock():
+        # Usually the roundup fetched everything before its steps started
+        ensureFresh()
+        tags = git_list_tags(pattern)
+        if not tags: return
+        _logger.debug('␡ Attempting to delete %d tags matching %s', len(tags), pattern)
+
+        # One ``git tag --delete`` per chunk of tags updates the refs in bulk. It deletes what it
+        # can and complains about the rest, so afterwards we see which tags are really gone.
+        errors = []
+        for chunk in _chunks(tags):
+            try:
+                invokeGIT(['tag', '--delete'] + chunk)
+            except InvokedProcessError as ex:
+                errors.extend(ex.error.stderr.decode('utf-8', errors='replace').splitlines())
+        remaining = set(git_list_tags(pattern))
+        for tag in tags:
+            if tag in remaining: _cannotDeleteTag(tag, _mentioning(errors, tag))
+        deleted = [tag for tag in tags if tag not in remaining]
+
+        # Each push waits on the network, so one push carries a whole chunk of deletions. The
+        # chunks go one after another: concurrent pushes fight over the remote's packed refs.
+        for chunk in _chunks([f':refs/tags/{tag}' for tag in deleted]):
+            try:
+                stdout, errors = invokeGIT(['push', '--porcelain', 'origin'] + chunk), []
+            except InvokedProcessError as ex:
+                stdout = ex.error.stdout.decode('utf-8', errors='replace')
+                errors = ex.error.stderr.decode('utf-8', errors='replace').splitlines()
+            statuses = _pushStatuses(stdout)
+            for refspec in chunk:
+                tag = refspec[len(':refs/tags/'):]
+                flag, summary = statuses.get(refspec, (None, None))
+                if flag == '!':
+                    _cannotDeleteTag(tag, summary)
+                elif flag is None:
+                    _cannotDeleteTag(tag, _mentioning(errors, tag) or 'the push failed')
+
+
+def _chunks(args):
+    '''Split the list of command-line ``args`` into lists short enough for one command line each'''
+    chunks, chunk, size = [], [], 0
+    for arg in args:
+        length = len(arg.encode('utf-8')) + 1
+        if chunk and size + length > _maxArgBytes:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(arg)
+        size += length
+    if chunk: chunks.append(chunk)
+    return chunks
+
+
+def _mentioning(lines, tag):
+    '''Return the first of the error ``lines`` that mentions ``tag``, if any'''
+    return next((line for line in lines if f"'{tag}'" in line or tag in line.split()), None)
+
+
+def _pushStatuses(output):
+    '''Parse the ``output`` of ``git push --porcelain`` into a mapping from refspec to the flag
+    (like ``-`` for a deletion or ``!`` for a rejection) and summary git gave for it.
+    '''
+    statuses = {}
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if len(fields) >= 3:
+            statuses[fields[1]] = (fields[0].strip(), fields[2])
+    return statuses
+
+
+def _cannotDeleteTag(tag, reason):
+    _logger.info('🧐 Cannot delete tag %s (%s); but pressing on', tag, reason or 'no reason given')
+
+
+def plan_delete_tags(pattern):
+    '''Return the command lines ``delete_tags`` would invoke for the given ``pattern``'''
+    return [
+        ['git', 'tag', '--list', pattern],
+        ['git', 'tag', '--delete', f'«tags matching {pattern}, in chunks»'],
+        ['git', 'push', '--porcelain', 'origin', f'«:refs/tags/… for each tag deleted, in chunks»'],
+    ]
@@ -0,0 +1,164 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Venv cache. Building a Python project's venv—and the tox envs its tests run
+in—is often the slowest part of a roundup, yet it comes out the same as last time unless the
+project's dependencies, the Python, or the extra packages changed. So we keep finished venvs in
+the state directory by a hash of those things and, when nothing changed, clone one back in place
+instead of building it again.
+
+Venvs have their own paths written into them, so they're cached from and restored to the same
+place, which is part of the hash. Restoring shares the files' storage with the cache where the
+filesystem can—by a copy-on-write reflink, or else a hardlink—and copies them otherwise. Sharing
+by hardlink is safe because pip deletes files before it replaces them rather than writing over
+them.'''
+
+from .util import invoke
+import errno, fcntl, hashlib, logging, os, shutil
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# Tells which Python makes a venv
+_describePython = 'import platform, sys; print(sys.version, platform.machine())'
+
+# Files whose contents decide what goes into the venv and tox envs
+_keyFiles = ('setup.cfg', 'setup.py', 'pyproject.toml', 'tox.ini')
+
+# Bump this when what's cached changes so old entries don't get used
+_format = 1
+
+# How many venvs to keep; the least recently used ones go first
+_keep = 3
+
+# The Linux ioctl that makes ``dst`` share the blocks of ``src``, from <linux/fs.h>
+_FICLONE = 0x40049409
+
+# Errors that mean a kind of cloning isn't possible here, as opposed to something going wrong
+_unsupported = frozenset({errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.EPERM, errno.EMLINK})
+
+
+# Functions
+# =========
+
+def describePython():
+    '''Tell which Python ``python -m venv`` would make a venv with'''
+    return invoke(['python', '-c', _describePython], capture=True)
+
+
+def plan_describePython():
+    '''Return the command lines ``describePython`` would invoke'''
+    return [['python', '-c', _describePython]]
+
+
+def key(cwd, python, packages):
+    '''Return the cache key for the venv of the project in ``cwd`` made with the ``python``
+    described by the given string and with the extra ``packages`` installed.
+    '''
+    digest = hashlib.sha256(f'{_format}\0{os.path.abspath(cwd)}\0{python}\0{packages or ""}\0'.encode('utf-8'))
+    for name in _keyFiles:
+        try:
+            with open(os.path.join(cwd, name), 'rb') as f:
+                contents = f.read()
+            digest.update(f'{name}\0{len(contents)}\0'.encode('utf-8') + contents)
+        except FileNotFoundError:
+            digest.update(f'{name}\0missing\0'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _reflink(src, dst):
+    '''Copy the file ``src`` to ``dst`` sharing its storage, or raise ``OSError`` if we can't'''
+    with open(src, 'rb') as source, open(dst, 'wb') as destination:
+        fcntl.ioctl(destination.fileno(), _FICLONE, source.fileno())
+    shutil.copystat(src, dst)
+
+
+class _Unsupported(Exception):
+    '''A way of copying isn't supported here. Not an ``OSError``, so ``shutil.copytree`` doesn't
+    just note it and carry on with the next file.
+    '''
+
+
+def _strictly(copy):
+    '''Wrap the ``copy`` function so it raises ``_Unsupported`` if it can't work here'''
+    def strict(src, dst):
+        try:
+            return copy(src, dst)
+        except OSError as ex:
+            if ex.errno in _unsupported: raise _Unsupported(ex) from ex
+            raise
+    return strict
+
+
+def copyTree(src, dst, link=False, ignore=None):
+    '''Copy the directory ``src`` to ``dst``, sharing the files' storage by reflink where the
+    filesystem can, or else by hardlink if ``link``, and otherwise copying them. ``ignore`` is as
+    for ``shutil.copytree``. Return the name of the way that worked.
+    '''
+    ways = [('reflink', _reflink)] + ([('hardlink', os.link)] if link else []) + [('copy', shutil.copy2)]
+    for name, copy in ways:
+        try:
+            shutil.copytree(src, dst, symlinks=True, ignore=ignore, copy_function=_strictly(copy))
+            return name
+        except _Unsupported:
+            shutil.rmtree(dst, ignore_errors=True)
+    raise RuntimeError(f'Cannot copy {src} to {dst} in any way')
+
+
+class VenvCache(object):
+    '''Venvs and tox envs kept in ``directory``, each entry in a subdirectory named by its key'''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}(directory={self.directory})>'
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def restore(self, key, cwd, names=('venv', '.tox')):
+        '''Put the directories with the given ``names`` cached under ``key`` in ``cwd``, replacing
+        any already there. Tell if there was a venv to restore.
+        '''
+        entry = self._entry(key)
+        if not os.path.isdir(os.path.join(entry, 'venv')): return False
+        for name in names:
+            cached, target = os.path.join(entry, name), os.path.join(cwd, name)
+            if not os.path.isdir(cached): continue
+            shutil.rmtree(target, ignore_errors=True)
+            way = copyTree(cached, target, link=True)
+            _logger.debug('♻️ Restored %s from the venv cache by %s', name, way)
+        os.utime(entry)
+        return True
+
+    def save(self, key, cwd, name):
+        '''Cache the directory ``name`` in ``cwd`` under ``key`` unless it's already cached.
+        It's copied rather than linked so that changes to it after this don't reach the cache.
+        '''
+        entry = self._entry(key)
+        cached, source = os.path.join(entry, name), os.path.join(cwd, name)
+        if os.path.isdir(cached) or not os.path.isdir(source): return
+        os.makedirs(entry, exist_ok=True)
+        temporary = f'{cached}.{os.getpid()}'
+        shutil.rmtree(temporary, ignore_errors=True)
+        copyTree(source, temporary)
+        try:
+            os.rename(temporary, cached)
+        except OSError:
+            # Another roundup cached it first
+            shutil.rmtree(temporary, ignore_errors=True)
+        os.utime(entry)
+        _logger.info('♻️ Saved %s to the venv cache', name)
+        self.prune()
+
+    def prune(self):
+        '''Forget all but the most recently used few entries'''
+        try:
+            entries = [os.path.join(self.directory, i) for i in os.listdir(self.directory)]
+        except FileNotFoundError:
+            return
+        entries = sorted((i for i in entries if os.path.isdir(i)), key=os.path.getmtime, reverse=True)
+        for stale in entries[_keep:]:
+            shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,153 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Watchdog. Keeps invoked processes from hanging a roundup: each may get a time
+limit, each step may get a deadline, and a process that neither writes output nor uses any CPU
+for too long is deemed stalled. Either way, the watchdog kills the process's whole tree.'''
+
+from .accounting import _tree
+from contextlib import contextmanager
+import logging, os, signal, threading, time
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# How long, in seconds, to give a process tree between SIGTERM and SIGKILL
+_gracePeriod = 10.0
+
+# Longest we ever wait between checks on a process
+_maxCheckInterval = 5.0
+
+
+# Functions
+# =========
+
+_commandTimeouts, _stallTimeout = {}, None
+_current = threading.local()
+
+
+def parseTimeouts(value):
+    '''Parse a timeout specification ``value`` like ``600,build=1800,artifactPublication=3600``
+    into a mapping from names to seconds. A bare number is the default for every name and is
+    keyed by None. An empty ``value`` means no timeouts at all.
+    '''
+    timeouts = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item: continue
+        name, sep, seconds = item.rpartition('=')
+        timeouts[name.strip() if sep else None] = float(seconds)
+    return {name: seconds for name, seconds in timeouts.items() if seconds > 0}
+
+
+def configure(commandTimeouts=None, stallTimeout=None):
+    '''Set the ``commandTimeouts``, a mapping from program names (like ``mvn`` or ``git``) to
+    seconds, with None for the default; and the ``stallTimeout`` in seconds after which a
+    process that makes no progress gets killed.
+    '''
+    global _commandTimeouts, _stallTimeout
+    _commandTimeouts, _stallTimeout = dict(commandTimeouts or {}), stallTimeout or None
+
+
+@contextmanager
+def deadline(name, seconds):
+    '''Give the step called ``name`` that runs in this thread in the body of a ``with`` statement
+    ``seconds`` to finish its commands. With no ``seconds``, there's no deadline.
+    '''
+    previous = getattr(_current, 'deadline', None)
+    _current.deadline = (name, time.monotonic() + seconds) if seconds else None
+    try:
+        yield
+    finally:
+        _current.deadline = previous
+
+
+def limits(program):
+    '''Return a pair of how many seconds a command running ``program`` may take (or None for no
+    limit) and what to blame if it runs out; taking into account both its own timeout and the
+    deadline of the step running it.
+    '''
+    timeout = _commandTimeouts.get(program, _commandTimeouts.get(None))
+    reason = f'the {timeout:g}-second timeout for {program}' if timeout else None
+    current = getattr(_current, 'deadline', None)
+    if current:
+        step, when = current
+        remaining = when - time.monotonic()
+        if timeout is None or remaining < timeout:
+            timeout, reason = max(0.0, remaining), f'the deadline of step {step}'
+    return timeout, reason
+
+
+def kill(pid):
+    '''Kill the process ``pid`` along with its process group and any other descendants: first
+    politely, then not.
+    '''
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        tree = _tree(pid)
+        if not tree: return
+        try:
+            os.killpg(pid, sig)
+        except OSError:
+            pass
+        for descendant in tree:
+            try:
+                os.kill(descendant, sig)
+            except OSError:
+                pass
+        if sig == signal.SIGTERM:
+            end = time.monotonic() + _gracePeriod
+            while time.monotonic() < end and _tree(pid):
+                time.sleep(0.2)
+
+
+# Classes
+# =======
+
+class Watchdog(threading.Thread):
+    '''A watchdog for a process running ``program`` whose output goes to the ``_Output``s in
+    ``outputs``. Once told to ``watch`` the process, if it runs past its time limit or stalls, we
+    kill it and note why in ``reason``. Call ``stop`` once the process exits.
+
+    A watchdog is false if there's nothing to watch for; such processes needn't get a session of
+    their own, which we otherwise need to kill them along with their children.
+    '''
+    def __init__(self, program, outputs):
+        super(Watchdog, self).__init__(name=f'watchdog-{program}', daemon=True)
+        self.pid, self.outputs, self.reason = None, outputs, None
+        self.timeout, self.blame = limits(program)
+        self.stall = _stallTimeout
+        self._stopped = threading.Event()
+
+    def __bool__(self):
+        return bool(self.timeout is not None or self.stall)
+
+    def watch(self, pid):
+        '''Start watching the process ``pid``, if there's anything to watch for'''
+        self.pid = pid
+        if self: self.start()
+
+    def run(self):
+        start = time.monotonic()
+        interval = min(i for i in (self.timeout, self.stall and self.stall / 4, _maxCheckInterval) if i is not None)
+        cpu, progress = 0.0, start
+        while not self._stopped.wait(max(0.1, interval)):
+            now = time.monotonic()
+            if self.timeout is not None and now - start >= self.timeout:
+                self.reason = f'it ran past {self.blame}'
+                break
+            if self.stall:
+                used = sum(i[1] for i in _tree(self.pid).values())
+                if used > cpu: cpu, progress = used, now
+                progress = max([progress] + [output.last for output in self.outputs])
+                if now - progress >= self.stall:
+                    self.reason = f'it stalled, with no output and no CPU used for {self.stall:g} seconds'
+                    break
+        if self.reason:
+            _logger.critical('⏰ Killing process %d because %s', self.pid, self.reason)
+            kill(self.pid)
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive(): self.join()
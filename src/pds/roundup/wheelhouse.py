@@ -0,0 +1,213 @@
+# encoding: utf-8
+
+'''🤠 PDS Roundup: Wheelhouse. Rather than have pip find and download a project's dependencies
+one after another every time, we ask pip what it would install (``--dry-run --report``), fetch
+the wheels we don't already have into a wheelhouse in the state directory several at a time,
+building wheels from any source distributions as we go, and then install from the wheelhouse
+alone (``--no-index --find-links``) pinned to what pip chose.
+
+If pip can't reach the package index to work out what to install, we install from whatever's in
+the wheelhouse, so a roundup can go ahead offline once the wheelhouse has what it needs.
+
+Requirements that come straight from version control or a local directory aren't kept in the
+wheelhouse; pip gets those itself.'''
+
+from .errors import InvokedProcessError, RoundupError
+from .util import invoke
+from concurrent.futures import ThreadPoolExecutor
+from packaging.utils import canonicalize_name, parse_sdist_filename, parse_wheel_filename
+from requests.adapters import HTTPAdapter
+from urllib.parse import unquote, urlsplit
+import hashlib, json, logging, os, requests, tempfile, time
+
+try:
+    import tomllib
+except ImportError:  # Before Python 3.11
+    tomllib = None
+
+_logger = logging.getLogger(__name__)
+
+
+# Constants
+# =========
+
+# How many wheels to download or build at the same time
+_workers = 8
+
+# What builds a project that doesn't say, per PEP 517
+_defaultBuildRequires = ['setuptools>=40.8.0', 'wheel']
+_defaultBuildBackend = 'setuptools.build_meta:__legacy__'
+
+# How long, in seconds, to wait for the package index before giving up
+_timeout = 60
+
+# Wheels nobody's installed in this long go
+_unused = 90 * 24 * 60 * 60
+
+
+# Functions
+# =========
+
+def buildSystem(cwd):
+    '''Tell the PEP 517 build system of the project in ``cwd``, from its ``pyproject.toml``: a
+    dict with its ``requires``, ``build-backend``, and ``backend-path``.
+    '''
+    try:
+        with open(os.path.join(cwd, 'pyproject.toml'), 'rb') as f:
+            system = tomllib.load(f).get('build-system', {}) if tomllib else {}
+    except FileNotFoundError:
+        system = {}
+    if 'build-backend' not in system:
+        return {'requires': system.get('requires', _defaultBuildRequires), 'build-backend': _defaultBuildBackend}
+    return system
+
+
+def buildRequires(cwd):
+    '''Tell what it takes to build the project in ``cwd``'''
+    return buildSystem(cwd)['requires']
+
+
+def _resolving(pip, wheelhouse, report, requirements, isolated):
+    argv = [pip, 'install', '--quiet', '--dry-run', '--find-links', wheelhouse, '--report', report]
+    return argv + (['--ignore-installed'] if isolated else []) + list(requirements)
+
+
+def resolve(pip, wheelhouse, requirements, isolated=False):
+    '''Ask ``pip`` what it'd install to satisfy the ``requirements`` (pip arguments), preferring
+    what's already in the ``wheelhouse``. If ``isolated``, leave out nothing already installed, as
+    for an isolated build environment. Return the "install" part of pip's report.
+    '''
+    with tempfile.TemporaryDirectory() as scratch:
+        report = os.path.join(scratch, 'report.json')
+        invoke(_resolving(pip, wheelhouse, report, requirements, isolated))
+        with open(report, 'r') as f:
+            return json.load(f)['install']
+
+
+def _filename(url):
+    return unquote(os.path.basename(urlsplit(url).path))
+
+
+def _sha256(info):
+    '''Get the SHA-256 digest the index gave for an archive, if any, from its ``info``'''
+    hashes = info.get('hashes') or {}
+    if 'sha256' in hashes: return hashes['sha256']
+    algorithm, _, digest = (info.get('hash') or '').partition('=')
+    return digest if algorithm == 'sha256' else None
+
+
+def _have(wheelhouse):
+    '''Tell the (name, version) of every wheel in the ``wheelhouse``'''
+    have = set()
+    for name in os.listdir(wheelhouse):
+        try:
+            project, version, build, tags = parse_wheel_filename(name)
+            have.add((project, version))
+        except ValueError:
+            pass
+    return have
+
+
+def _download(session, url, digest, path):
+    '''Download ``url`` to ``path``, checking its SHA-256 ``digest`` if there is one'''
+    partial, sha256 = f'{path}.{os.getpid()}.part', hashlib.sha256()
+    try:
+        with session.get(url, stream=True, timeout=_timeout) as response, open(partial, 'wb') as f:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                sha256.update(chunk)
+                f.write(chunk)
+        if digest and sha256.hexdigest() != digest:
+            raise RoundupError(f'💔 {url} should have SHA-256 {digest} but has {sha256.hexdigest()}')
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial): os.remove(partial)
+
+
+def prefetch(pip, wheelhouse, items):
+    '''Get a wheel into the ``wheelhouse`` for each of the ``items`` of a pip report that comes
+    from a package index and isn't already there, downloading or building (with ``pip``) several
+    at a time. Return how many we got.
+    '''
+    have, downloads, builds = _have(wheelhouse), [], []
+    for item in items:
+        info = item['download_info']
+        if 'archive_info' not in info: continue
+        url, name = info['url'], _filename(info['url'])
+        path = os.path.join(wheelhouse, name)
+        if os.path.isfile(path):
+            os.utime(path)
+            continue
+        digest = _sha256(info['archive_info'])
+        if name.endswith('.whl'):
+            downloads.append((url, digest, path))
+            continue
+        try:
+            project, version = parse_sdist_filename(name)
+            if (project, version) in have: continue
+        except ValueError:
+            pass
+        builds.append(f'{url}#sha256={digest}' if digest else url)
+
+    if not downloads and not builds: return 0
+    _logger.info('🛞 Fetching %d wheel(s) and building %d more for the wheelhouse', len(downloads), len(builds))
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='wheelhouse') as pool:
+        adapter = HTTPAdapter(pool_connections=_workers, pool_maxsize=_workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = 'pds-roundup'
+        futures = [pool.submit(_download, session, *i) for i in downloads]
+        futures += [
+            pool.submit(invoke, [pip, 'wheel', '--quiet', '--no-deps', '--wheel-dir', wheelhouse, i]) for i in builds
+        ]
+        for future in futures:
+            future.result()
+    return len(futures)
+
+
+def prune(wheelhouse):
+    '''Get rid of wheels in the ``wheelhouse`` no roundup's installed in a long while'''
+    cutoff = time.time() - _unused
+    for entry in os.scandir(wheelhouse):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+def install(pip, wheelhouse, cwd, requirements):
+    '''Install the ``requirements`` (pip arguments) with ``pip`` from the ``wheelhouse`` only,
+    first fetching into it whatever they—and building the project in ``cwd``—need.
+    '''
+    try:
+        items = resolve(pip, wheelhouse, requirements)
+        prefetch(pip, wheelhouse, items + resolve(pip, wheelhouse, buildRequires(cwd), isolated=True))
+    except (InvokedProcessError, requests.RequestException):
+        # Maybe we're offline; what's in the wheelhouse may do
+        _logger.warning('⚠️ Cannot work out what to install; trying with just what is in the wheelhouse')
+        invoke([pip, 'install', '--verbose', '--no-index', '--find-links', wheelhouse, *requirements])
+        return
+    with tempfile.TemporaryDirectory() as scratch:
+        # Pin what pip chose so we get exactly that even if the wheelhouse has other versions
+        constraints = os.path.join(scratch, 'constraints.txt')
+        with open(constraints, 'w') as f:
+            for item in items:
+                if 'archive_info' in item['download_info']:
+                    metadata = item['metadata']
+                    f.write(f'{canonicalize_name(metadata["name"])}=={metadata["version"]}\n')
+        invoke([
+            pip, 'install', '--verbose', '--no-index', '--find-links', wheelhouse, '--constraint', constraints,
+            *requirements
+        ])
+    prune(wheelhouse)
+
+
+def plan_install(pip, wheelhouse, requirements):
+    '''Return the command lines ``install`` would invoke, assuming it can reach the package index'''
+    return [
+        _resolving(pip, wheelhouse, '«report»', requirements, False),
+        _resolving(pip, wheelhouse, '«report»', ['«build requirements»'], True),
+        [pip, 'wheel', '--quiet', '--no-deps', '--wheel-dir', wheelhouse, '«each source distribution not yet built»'],
+        [
+            pip, 'install', '--verbose', '--no-index', '--find-links', wheelhouse, '--constraint', '«constraints»',
+            *requirements
+        ],
+    ]
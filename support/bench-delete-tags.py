@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Benchmark for deleting tags in bulk: how long does ``pds.roundup.util.delete_tags`` take to get
+# rid of thousands of snapshot tags, both locally and on the remote, compared to deleting them one
+# at a time like the Roundup used to?
+#
+# This makes a throwaway bare repository with lots of tags, and for each way of deleting them
+# copies it to a fresh "origin", clones that, deletes the tags from the clone, then checks that
+# the origin ended up with none of them. A local bare remote has no network latency, so real
+# remotes favor bulk deletion even more. Typical usage:
+#
+#     venv/bin/python support/bench-delete-tags.py --tags 2000
+
+from pds.roundup.util import delete_tags
+import argparse, os, subprocess, tempfile, time
+
+
+def _git(repo, *args, stdin=None):
+    env = dict(
+        os.environ, GIT_AUTHOR_NAME='Bench', GIT_AUTHOR_EMAIL='bench@example.com',
+        GIT_COMMITTER_NAME='Bench', GIT_COMMITTER_EMAIL='bench@example.com',
+    )
+    return subprocess.run(
+        ['git', *args], cwd=repo, env=env, input=stdin, check=True, capture_output=True
+    ).stdout.decode('utf-8')
+
+
+def _makeOrigin(origin, tags):
+    '''Make a bare repository at ``origin`` with a few commits and ``tags`` snapshot tags'''
+    _git(origin, 'init', '--quiet', '--bare', '--initial-branch', 'main')
+    stream, when = [], 1_600_000_000
+    for number in range(1, tags + 1):
+        when += 60
+        message = f'Commit {number}'.encode('utf-8')
+        stream.append(f'commit refs/heads/main\nmark :{number}\n'.encode('utf-8'))
+        stream.append(f'committer Bench <bench@example.com> {when} +0000\n'.encode('utf-8'))
+        stream.append(f'data {len(message)}\n'.encode('utf-8') + message + b'\n')
+        if number > 1: stream.append(f'from :{number - 1}\n'.encode('utf-8'))
+        stream.append(f'reset refs/tags/v1.{number}.0-SNAPSHOT\nfrom :{number}\n\n'.encode('utf-8'))
+    # A release tag that must survive
+    stream.append(f'reset refs/tags/v1.0.0\nfrom :1\n\n'.encode('utf-8'))
+    _git(origin, 'fast-import', '--quiet', stdin=b''.join(stream))
+
+
+def _oneAtATime(pattern):
+    '''Delete the tags matching ``pattern`` the old way: two commands per tag'''
+    for tag in _git(os.getcwd(), 'tag', '--list', pattern).split():
+        _git(os.getcwd(), 'tag', '--delete', tag)
+        _git(os.getcwd(), 'push', '--delete', 'origin', tag)
+
+
+def _timeDeletion(pristine, scratch, function, pattern, tags):
+    origin, clone = os.path.join(scratch, f'{function.__name__}.git'), os.path.join(scratch, function.__name__)
+    subprocess.run(['git', 'clone', '--quiet', '--bare', pristine, origin], check=True)
+    subprocess.run(['git', 'clone', '--quiet', origin, clone], check=True)
+    cwd = os.getcwd()
+    os.chdir(clone)
+    try:
+        start = time.perf_counter()
+        function(pattern)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    left = len(_git(origin, 'tag', '--list', pattern).split())
+    kept = len(_git(origin, 'tag', '--list', 'v1.0.0').split())
+    print(f'{function.__name__:<14}{tags:>8}{elapsed:>10.2f}s{left:>8}{"yes" if kept else "NO":>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk tag deletion against one tag at a time')
+    parser.add_argument('--tags', type=int, default=2000, help='Snapshot tags to delete (%(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        pristine = os.path.join(scratch, 'pristine.git')
+        os.mkdir(pristine)
+        print(f'Making a repository with {args.tags} snapshot tags…')
+        _makeOrigin(pristine, args.tags)
+        print(f'{"method":<14}{"tags":>8}{"time":>11}{"left":>8}{"kept":>8}')
+        for function in (_oneAtATime, delete_tags):
+            _timeDeletion(pristine, scratch, function, '*SNAPSHOT*', args.tags)
+
+
+if __name__ == '__main__':
+    main()
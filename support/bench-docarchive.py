@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Benchmark for the Roundup's documentation archiver: how long does it take to make the
+# ``documentation.zip`` of a big site, compared to deflating every file one at a time with
+# ``zipfile``, and how big is the result?
+#
+# This makes a throwaway directory that looks like a Maven site—lots of small HTML reports, some
+# CSS and JavaScript, PNG and GIF images, web fonts, and a few jars—then archives it both ways,
+# checks that our archive holds the same files with the same contents, and that making it again
+# gives exactly the same bytes. Typical usage:
+#
+#     venv/bin/python support/bench-docarchive.py --files 50000
+
+from pds.roundup import docarchive
+import argparse, hashlib, io, os, random, tempfile, time, zipfile
+
+
+_words = (
+    'class method field package interface returns parameter throws deprecated since version '
+    'product label collection bundle schema attribute element value description'
+).split()
+
+
+def _html(rng, size):
+    body = []
+    while sum(len(i) for i in body) < size:
+        body.append(f'<tr><td class="colFirst"><a href="#{rng.choice(_words)}">{rng.choice(_words)}</a></td>'
+                    f'<td>{" ".join(rng.choice(_words) for _ in range(12))}</td></tr>\n')
+    return (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><link rel="stylesheet" href="../css/site.css">'
+        f'</head><body><table>{"".join(body)}</table></body></html>\n'
+    ).encode('utf-8')
+
+
+def _makeSite(root, count):
+    '''Make a Maven-site-like tree of about ``count`` files under ``root``'''
+    rng, made = random.Random(42), 0
+    kinds = [
+        # suffix, share of files, (smallest, largest) size, compressible?
+        ('.html', 0.80, (2000, 40000), True),
+        ('.css', 0.03, (1000, 20000), True),
+        ('.js', 0.04, (1000, 60000), True),
+        ('.png', 0.08, (500, 30000), False),
+        ('.gif', 0.03, (100, 5000), False),
+        ('.woff2', 0.019, (20000, 80000), False),
+        ('.jar', 0.001, (1000000, 5000000), False),
+    ]
+    for suffix, share, (low, high), compressible in kinds:
+        for number in range(max(1, int(count * share))):
+            folder = os.path.join(root, 'apidocs', f'gov{number % 40}', f'nasa{number % 13}', suffix[1:])
+            os.makedirs(folder, exist_ok=True)
+            size = rng.randint(low, high)
+            data = _html(rng, size) if compressible else rng.randbytes(size)
+            with open(os.path.join(folder, f'page{number}{suffix}'), 'wb') as f:
+                f.write(data)
+            made += 1
+    return made
+
+
+def _zipfileOneAtATime(docDir, out):
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for folder, subdirs, filenames in os.walk(docDir):
+            for fn in filenames:
+                path = os.path.join(folder, fn)
+                if os.path.isfile(path): zf.write(path, os.path.relpath(path, docDir))
+
+
+def _time(function, docDir):
+    out = io.BytesIO()
+    start = time.perf_counter()
+    function(docDir, out)
+    return time.perf_counter() - start, out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=50000, help='About how many files in the site [%(default)s]')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        made = _makeSite(root, args.files)
+        total = sum(os.path.getsize(os.path.join(f, n)) for f, d, ns in os.walk(root) for n in ns)
+        print(f'Site: {made} files, {total / 1e6:.1f} MB, {docarchive._workers} worker(s)')
+
+        before, old = _time(_zipfileOneAtATime, root)
+        print(f'zipfile, one at a time: {before:7.2f}s, {len(old) / 1e6:.1f} MB')
+        after, new = _time(docarchive.write, root)
+        print(f'docarchive:             {after:7.2f}s, {len(new) / 1e6:.1f} MB ({before / after:.1f}× faster)')
+
+        again = b''.join(docarchive.stream(root))
+        assert again == new, 'archive is not deterministic'
+        with zipfile.ZipFile(io.BytesIO(new)) as ours, zipfile.ZipFile(io.BytesIO(old)) as theirs:
+            assert ours.testzip() is None, 'bad CRC'
+            assert sorted(ours.namelist()) == sorted(theirs.namelist()), 'different files'
+            for name in ours.namelist():
+                assert ours.read(name) == theirs.read(name), f'different contents for {name}'
+        print(f'Same files and contents; streaming again gave identical bytes (sha256 {hashlib.sha256(new).hexdigest()[:16]})')
+
+
+if __name__ == '__main__':
+    main()
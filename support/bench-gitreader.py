@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Benchmark for the Roundup's in-process git reader: how long do the read-only git queries a
+# roundup makes take when we read the repository ourselves versus forking ``git``?
+#
+# This makes a throwaway repository with lots of commits (including merges) and tags (both
+# annotated and lightweight), packs most of it like a real clone would be, adds a few loose
+# objects and refs on top, and then times each query both ways—checking that they agree. The
+# reader's first answer includes parsing packed refs and such; later answers reuse that work, like
+# the repeated questions a roundup asks.
+# Typical usage:
+#
+#     venv/bin/python support/bench-gitreader.py --commits 50000 --tags 20000
+
+from pds.roundup.gitreader import GitReader
+import argparse, os, subprocess, tempfile, time
+
+
+def _git(repo, *args, stdin=None):
+    env = dict(
+        os.environ, GIT_AUTHOR_NAME='Bench', GIT_AUTHOR_EMAIL='bench@example.com',
+        GIT_COMMITTER_NAME='Bench', GIT_COMMITTER_EMAIL='bench@example.com',
+    )
+    return subprocess.run(
+        ['git', *args], cwd=repo, env=env, input=stdin, check=True, capture_output=True
+    ).stdout.decode('utf-8')
+
+
+def _makeRepository(repo, commits, tags):
+    '''Make a repository in ``repo`` with the given number of ``commits`` and ``tags``'''
+    _git(repo, 'init', '--quiet', '--initial-branch', 'main')
+    stream, when, every = [], 1_600_000_000, max(1, commits // tags)
+    for number in range(1, commits + 1):
+        when += 60
+        message = f'Commit {number}'.encode('utf-8')
+        stream.append(f'commit refs/heads/{"main" if number % 50 else "side"}\nmark :{number}\n'.encode('utf-8'))
+        stream.append(f'committer Bench <bench@example.com> {when} +0000\n'.encode('utf-8'))
+        stream.append(f'data {len(message)}\n'.encode('utf-8') + message + b'\n')
+        if number > 1: stream.append(f'from :{number - 1}\n'.encode('utf-8'))
+        # Every so often, merge in a commit from a bit further back
+        if number > 100 and number % 37 == 0: stream.append(f'merge :{number - 90}\n'.encode('utf-8'))
+        stream.append(f'M 644 inline file{number % 100}.txt\ndata {len(message)}\n'.encode('utf-8') + message + b'\n\n')
+        if number % every == 0:
+            name = f'release/{number // 10000}.{number // 100 % 100}.{number % 100}' if number % (every * 3) else f'v{number}'
+            if number % 2:
+                stream.append(f'reset refs/tags/{name}\nfrom :{number}\n\n'.encode('utf-8'))
+            else:
+                stream.append(f'tag {name}\nfrom :{number}\ntagger Bench <bench@example.com> {when} +0000\n'.encode('utf-8'))
+                stream.append(f'data {len(name)}\n{name}\n'.encode('utf-8'))
+    _git(repo, 'fast-import', '--quiet', stdin=b''.join(stream))
+    _git(repo, 'checkout', '--quiet', 'main')
+    _git(repo, 'gc', '--quiet')
+    for number in range(3):
+        _git(repo, 'commit', '--quiet', '--allow-empty', '--message', f'Loose {number}')
+    _git(repo, 'tag', '--annotate', '--message', 'Loose tag', 'release/99.0.0')
+    _git(repo, 'symbolic-ref', 'refs/remotes/origin/HEAD', 'refs/remotes/origin/main')
+
+
+def _time(function, rounds):
+    '''Return how long the first call to ``function`` took, the average of ``rounds`` more, and
+    what it returned
+    '''
+    start = time.perf_counter()
+    result = function()
+    first, start = time.perf_counter() - start, time.perf_counter()
+    for _ in range(rounds):
+        result = function()
+    return first, (time.perf_counter() - start) / rounds, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the in-process git reader against the git command')
+    parser.add_argument('--commits', type=int, default=20000, help='Commits in the repository (%(default)s)')
+    parser.add_argument('--tags', type=int, default=5000, help='Tags in the repository (%(default)s)')
+    parser.add_argument('--rounds', type=int, default=5, help='Times to run each query (%(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repo:
+        print(f'Making a repository with {args.commits} commits and {args.tags} tags…')
+        _makeRepository(repo, args.commits, args.tags)
+        queries = (
+            (
+                'describe --match release/*',
+                lambda: _git(repo, 'describe', '--tags', '--abbrev=0', '--match', 'release/*').strip(),
+                lambda: GitReader.discover(repo).describe('release/*'),
+            ),
+            (
+                'describe',
+                lambda: _git(repo, 'describe', '--tags', '--abbrev=0').strip(),
+                lambda: GitReader.discover(repo).describe(),
+            ),
+            (
+                'tag --list release/*',
+                lambda: _git(repo, 'tag', '--list', 'release/*').split(),
+                lambda: GitReader.discover(repo).listTags('release/*'),
+            ),
+            (
+                'symbolic-ref',
+                lambda: _git(repo, 'symbolic-ref', 'refs/remotes/origin/HEAD').strip(),
+                lambda: GitReader.discover(repo).symbolicRef('refs/remotes/origin/HEAD'),
+            ),
+            (
+                'rev-parse HEAD',
+                lambda: _git(repo, 'rev-parse', 'HEAD').strip(),
+                lambda: GitReader.discover(repo).resolve('HEAD'),
+            ),
+        )
+        print(f'{"query":<28}{"git":>10}{"1st read":>10}{"reader":>10}{"speedup":>10}  agree')
+        for name, viaGit, viaReader in queries:
+            gitFirst, gitTime, expected = _time(viaGit, args.rounds)
+            readerFirst, readerTime, actual = _time(viaReader, args.rounds)
+            print(
+                f'{name:<28}{gitTime * 1000:>8.1f}ms{readerFirst * 1000:>8.1f}ms{readerTime * 1000:>8.1f}ms'
+                f'{gitTime / readerTime:>9.1f}×  '
+                f'{"yes" if expected == actual else f"NO: {expected!r} vs {actual!r}"}'
+            )
+
+
+if __name__ == '__main__':
+    main()
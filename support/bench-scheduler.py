@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Benchmark for the Roundup's step scheduler: how much wall-clock time do we save by running
+# independent steps at the same time?
+#
+# This runs the Python, Maven, and Node.js PDS assemblies with every step replaced by a stubbed
+# tool that just sleeps. The stubs keep the real step classes' ``reads`` and ``writes``, so the
+# dependency graph is the same one a real roundup uses. Typical usage:
+#
+#     venv/bin/python support/bench-scheduler.py --jobs 4 --scale 0.01
+#
+# The durations below are rough per-step times in seconds from real stable roundups; ``--scale``
+# shrinks them so the benchmark finishes quickly.
+
+from pds.roundup.assembly import StablePDSAssembly
+from pds.roundup.step import StepName
+from pds.roundup.util import invoke
+from pds.roundup._maven import MavenContext
+from pds.roundup._nodejs import NodeJSContext
+from pds.roundup._python import PythonContext
+import argparse, os, stat, tempfile, time, types
+
+
+_durations = {
+    StepName.preparation:         90,
+    StepName.unitTest:            240,
+    StepName.integrationTest:     1,
+    StepName.docs:                120,
+    StepName.versionBump:         5,
+    StepName.build:               60,
+    StepName.artifactPublication: 150,
+    StepName.requirements:        90,
+    StepName.changeLog:           180,
+    StepName.githubRelease:       60,
+    StepName.docPublication:      45,
+    StepName.versionCommit:       10,
+    StepName.cleanup:             15,
+}
+
+
+def _stubbedContext(contextClass, stub, scale, jobs):
+    '''Make a context of ``contextClass`` whose steps run the ``stub`` tool instead of doing work'''
+    args = types.SimpleNamespace(jobs=jobs)
+    context = contextClass(os.getcwd(), {}, args)
+    steps = {}
+    for name, stepClass in context.steps.items():
+        seconds = str(_durations.get(name, 0) * scale)
+        steps[name] = type(stepClass.__name__, (stepClass,), {
+            'execute': lambda self, seconds=seconds: invoke([stub, seconds])
+        })
+    context.steps = steps
+    return context
+
+
+def _time(contextClass, stub, scale, jobs):
+    start = time.perf_counter()
+    StablePDSAssembly(_stubbedContext(contextClass, stub, scale, jobs)).roundup()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Roundup step scheduler with stubbed tools')
+    parser.add_argument('--jobs', type=int, default=4, help='Concurrent steps to compare against 1 (%(default)s)')
+    parser.add_argument('--scale', type=float, default=0.01, help='Multiplier for step durations (%(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stub = os.path.join(tmp, 'stub-tool')
+        with open(stub, 'w') as f:
+            f.write('#!/bin/sh\nexec sleep "$1"\n')
+        os.chmod(stub, stat.S_IRWXU)
+
+        print(f'{"context":<16}{"jobs=1":>10}{f"jobs={args.jobs}":>10}{"saved":>10}')
+        for contextClass in (PythonContext, MavenContext, NodeJSContext):
+            serial = _time(contextClass, stub, args.scale, 1)
+            parallel = _time(contextClass, stub, args.scale, args.jobs)
+            saved = 100.0 * (serial - parallel) / serial
+            print(f'{contextClass.__name__:<16}{serial:>9.2f}s{parallel:>9.2f}s{saved:>9.1f}%')
+
+
+if __name__ == '__main__':
+    main()
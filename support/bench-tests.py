@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Benchmark for the Roundup's Python test runner: how much sooner do a project's tests finish
+# when the test files are shared out among several pytest processes (or pytest-xdist workers, if
+# it's installed) than when one pytest runs them all?
+#
+# This makes a sample project with many test files, each with a few tests that do a little
+# computing and a little waiting (as tests that touch files, subprocesses, or sockets do), then
+# times the runner with one worker and with more. Last, it breaks two tests in different files to
+# check their failures come back in one report. Typical usage:
+#
+#     venv/bin/python support/bench-tests.py --files 60 --workers 4
+
+from pds.roundup import testing
+from pds.roundup.errors import TestFailuresError
+import argparse, logging, os, sys, tempfile, time
+
+
+_testFile = '''import hashlib, time
+
+def _work():
+    hashlib.sha256(b'x' * {size}).hexdigest()
+    time.sleep({wait})
+
+'''
+
+
+def _project(directory, files, tests, size, wait):
+    os.makedirs(os.path.join(directory, 'tests'))
+    with open(os.path.join(directory, 'setup.cfg'), 'w') as f:
+        f.write('[tool:pytest]\ntestpaths = tests\n')
+    for index in range(files):
+        with open(os.path.join(directory, 'tests', f'test_sample_{index:03d}.py'), 'w') as f:
+            f.write(_testFile.format(size=size, wait=wait))
+            for test in range(tests):
+                f.write(f'def test_{test}():\n    _work()\n\n')
+
+
+def _time(workers):
+    started = time.perf_counter()
+    testing.runPytest(sys.executable, workers)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parallel Python test runner')
+    parser.add_argument('--files', type=int, default=60, help='Test files; default %(default)s')
+    parser.add_argument('--tests', type=int, default=5, help='Tests in each file; default %(default)s')
+    parser.add_argument('--size', type=int, default=4 * 1024 * 1024, help='Bytes each test hashes; default %(default)s')
+    parser.add_argument('--wait', type=float, default=0.02, help='Seconds each test waits; default %(default)s')
+    parser.add_argument('--workers', type=int, default=max(4, testing.cores()), help='Workers; default %(default)s')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        _project(directory, args.files, args.tests, args.size, args.wait)
+        os.chdir(directory)
+        xdist = testing.hasModule(sys.executable, 'xdist')
+        print(f'{args.files} files × {args.tests} tests on {testing.cores()} core(s); pytest-xdist {"is" if xdist else "not"} installed')
+        serial = _time(1)
+        print(f'1 worker: {serial:.1f}s')
+        parallel = _time(args.workers)
+        print(f'{args.workers} workers ({"pytest-xdist" if xdist else "sharded by file"}): {parallel:.1f}s, {serial / parallel:.1f}× as fast')
+
+        for name in ('test_sample_000.py', f'test_sample_{args.files - 1:03d}.py'):
+            with open(os.path.join('tests', name), 'a') as f:
+                f.write('def test_broken():\n    assert 1 == 2\n')
+        try:
+            testing.runPytest(sys.executable, args.workers)
+            raise AssertionError('broken tests passed')
+        except TestFailuresError as ex:
+            assert len(ex.failures) == 2, ex.failures
+            print(f'Failures reported together: {", ".join(ex.failures)}')
+        os.chdir('/')
+
+
+if __name__ == '__main__':
+    main()
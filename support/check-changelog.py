@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Check of the Roundup's changelog engine against a local stand-in for GitHub's GraphQL API and a
+# throwaway repository with a few tags: does it group issues by tag and section the way
+# github_changelog_generator did, and on the next roundup ask only for issues updated since the
+# last one? Typical usage:
+#
+#     venv/bin/python support/check-changelog.py
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pds.roundup import changelog
+from pds.roundup.github import GitHubClient
+import json, os, subprocess, tempfile, threading
+
+
+_sections = {
+    'requirements': {'prefix': '**Requirements:**', 'labels': ['requirement']},
+    'improvements': {'prefix': '**Improvements:**', 'labels': ['enhancement']},
+    'defects': {'prefix': '**Defects:**', 'labels': ['bug']},
+}
+_url = 'https://github.com/o/r'
+
+
+def _issue(number, title, closedAt, updatedAt, labels=(), state='CLOSED', milestone=None):
+    return {
+        'number': number, 'title': title, 'url': f'{_url}/issues/{number}', 'state': state,
+        'closedAt': closedAt, 'updatedAt': updatedAt, 'milestone': {'title': milestone} if milestone else None,
+        'labels': {'nodes': [{'name': i} for i in labels]},
+    }
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    '''Just enough of GitHub's GraphQL API for the changelog's issue query, two issues a page'''
+    protocol_version = 'HTTP/1.1'
+    issues, queries = [], []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        variables = request['variables']
+        _StandIn.queries.append(variables)
+        matching = sorted(
+            (i for i in _StandIn.issues if not variables['since'] or i['updatedAt'] >= variables['since']),
+            key=lambda i: i['updatedAt']
+        )
+        start = int(variables['after'] or 0)
+        page = matching[start:start + 2]
+        body = {'data': {'repository': {'url': _url, 'issues': {
+            'pageInfo': {'hasNextPage': start + 2 < len(matching), 'endCursor': str(start + 2)},
+            'nodes': page,
+        }}}}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _git(*args, date=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME='Check', GIT_AUTHOR_EMAIL='check@example.com',
+               GIT_COMMITTER_NAME='Check', GIT_COMMITTER_EMAIL='check@example.com')
+    if date: env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    return subprocess.run(['git', *args], env=env, check=True, capture_output=True).stdout.decode('utf-8')
+
+
+def _generate(client, cacheDir):
+    return changelog.generate(
+        client, cacheDir, 'o', 'r', 'CHANGELOG.md', '1.2.0', _sections, '**Other closed issues:**',
+        ('wontfix', 'duplicate', 'invalid', 'theme'), ('s.critical', 's.high', 's.low', 's.medium')
+    )
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = GitHubClient('token', None, f'http://127.0.0.1:{server.server_address[1]}')
+    with tempfile.TemporaryDirectory() as repo, tempfile.TemporaryDirectory() as cacheDir:
+        os.chdir(repo)
+        _git('init', '--quiet')
+        _git('commit', '--quiet', '--allow-empty', '--message', 'First', date='2021-01-01T00:00:00Z')
+        _git('tag', 'v1.0.0', date='2021-01-01T00:00:00Z')
+        _git('commit', '--quiet', '--allow-empty', '--message', 'Second', date='2021-03-01T00:00:00Z')
+        _git('tag', '--annotate', '--message', 'Release', 'v1.1.0', date='2021-04-01T00:00:00Z')
+        first = _git('rev-list', '--max-parents=0', 'HEAD').strip()
+
+        _StandIn.issues = [
+            _issue(1, 'Make it go', '2020-12-01T00:00:00Z', '2020-12-02T00:00:00Z', ['requirement']),
+            _issue(2, 'Crash on `a_b` with <html>', '2021-02-01T00:00:00Z', '2021-02-01T00:00:00Z', ['bug', 's.high']),
+            _issue(3, 'Go faster', '2021-02-15T00:00:00Z', '2021-02-15T00:00:00Z', ['enhancement']),
+            _issue(4, 'Not a real problem', '2021-02-16T00:00:00Z', '2021-02-16T00:00:00Z', ['bug', 'invalid']),
+            _issue(5, 'Tidy up', '2021-05-01T00:00:00Z', '2021-05-01T00:00:00Z'),
+            _issue(6, 'Still open', None, '2021-05-02T00:00:00Z', state='OPEN'),
+            _issue(7, 'Planned for 1.0', '2021-02-20T00:00:00Z', '2021-02-20T00:00:00Z', milestone='v1.0.0'),
+        ]
+        assert _generate(client, cacheDir), 'changelog not written'
+        with open('CHANGELOG.md') as f:
+            text = f.read()
+        today = text.split('## [1.2.0]')[1].split('(')[2].split(')')[0]
+        expected = f'''# Changelog
+
+## [1.2.0]({_url}/tree/1.2.0) ({today})
+
+[Full Changelog]({_url}/compare/v1.1.0...1.2.0)
+
+**Other closed issues:**
+
+- Tidy up [\\#5]({_url}/issues/5)
+
+## [v1.1.0]({_url}/tree/v1.1.0) (2021-03-01)
+
+[Full Changelog]({_url}/compare/v1.0.0...v1.1.0)
+
+**Improvements:**
+
+- Go faster [\\#3]({_url}/issues/3)
+
+**Defects:**
+
+- Crash on `a_b` with \\<html\\> [\\#2]({_url}/issues/2) [[s.high]({_url}/labels/s.high)]
+
+## [v1.0.0]({_url}/tree/v1.0.0) (2021-01-01)
+
+[Full Changelog]({_url}/compare/{first}...v1.0.0)
+
+**Requirements:**
+
+- Make it go [\\#1]({_url}/issues/1)
+
+**Other closed issues:**
+
+- Planned for 1.0 [\\#7]({_url}/issues/7)
+
+
+
+{changelog._footer}
+'''
+        assert text == expected, f'Got:\n{text}\nExpected:\n{expected}'
+        assert [q['since'] for q in _StandIn.queries] == [None] * 4, _StandIn.queries
+        print(f'First roundup: {len(_StandIn.queries)} page(s) of issues for {len(_StandIn.issues)} issue(s)')
+
+        # Next roundup: one issue got a new label and nothing else changed
+        _StandIn.queries.clear()
+        _StandIn.issues[4] = _issue(5, 'Tidy up', '2021-05-01T00:00:00Z', '2021-06-01T00:00:00Z', ['enhancement'])
+        assert _generate(client, cacheDir), 'changelog not rewritten'
+        assert len(_StandIn.queries) == 1 and _StandIn.queries[0]['since'] == '2021-05-02T00:00:00Z', _StandIn.queries
+        with open('CHANGELOG.md') as f:
+            assert '**Improvements:**\n\n- Tidy up' in f.read(), 'updated issue not in its new section'
+        print(f'Next roundup: {len(_StandIn.queries)} page(s) of issues updated since the last one')
+
+        _StandIn.queries.clear()
+        assert not _generate(client, cacheDir), 'unchanged changelog rewritten'
+        os.chdir('/')
+    client.close()
+    server.shutdown()
+    print('All good')
+
+
+if __name__ == '__main__':
+    main()
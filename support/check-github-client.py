@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Check of the Roundup's GitHub API client against a local stand-in for the API: does it find
+# releases by tag, answer repeated requests from its cache with conditional requests, download,
+# delete, and upload assets, and reuse one connection throughout? Typical usage:
+#
+#     venv/bin/python support/check-github-client.py
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pds.roundup.github import GitHubClient
+from urllib.parse import urlsplit, parse_qs
+import json, tempfile, threading
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    '''Just enough of the GitHub API for a release with one asset'''
+    protocol_version = 'HTTP/1.1'
+    connections, uploads, deleted = set(), [], []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, etag=None):
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if etag: self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _release(self):
+        base = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+        return {
+            'id': 1, 'tag_name': 'v1.2.3',
+            'assets_url': f'{base}/repos/o/r/releases/1/assets',
+            'upload_url': f'{base}/uploads/repos/o/r/releases/1/assets{{?name,label}}',
+        }
+
+    def do_GET(self):
+        _StandIn.connections.add(self.client_address)
+        path = urlsplit(self.path).path
+        if path == '/repos/o/r/releases/tags/v1.2.3' or path == '/repos/o/r/releases':
+            body = self._release() if path.endswith('v1.2.3') else [self._release()]
+            if self.headers.get('If-None-Match') == '"release"':
+                self._send(304)
+            else:
+                self._send(200, body, '"release"')
+        elif path == '/repos/o/r/releases/assets/7' and self.headers.get('Accept') == 'application/octet-stream':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', '4')
+            self.end_headers()
+            self.wfile.write(b'PK\x05\x06')
+        elif path == '/repos/o/r/releases/1/assets':
+            assets = [] if _StandIn.deleted else [{'id': 7, 'name': 'documentation.zip', 'url': self._assetURL()}]
+            self._send(200, assets, f'"assets-{len(assets)}"')
+        else:
+            self._send(404, {'message': 'Not Found'})
+
+    def do_DELETE(self):
+        _StandIn.connections.add(self.client_address)
+        _StandIn.deleted.append(self.path)
+        self._send(204)
+
+    def do_POST(self):
+        _StandIn.connections.add(self.client_address)
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        query = parse_qs(urlsplit(self.path).query)
+        _StandIn.uploads.append((query['name'][0], query.get('label', [None])[0], data))
+        self._send(201, {'id': 8, 'name': query['name'][0], 'size': len(data)})
+
+    def _assetURL(self):
+        return f'http://{self.server.server_address[0]}:{self.server.server_address[1]}/repos/o/r/releases/assets/7'
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = f'http://127.0.0.1:{server.server_address[1]}'
+    with tempfile.TemporaryDirectory() as cacheDir:
+        client = GitHubClient('token', cacheDir, api)
+        release = client.release('o', 'r', 'v1.2.3')
+        assert release['tag_name'] == 'v1.2.3', release
+        assert client.release('o', 'r', 'v1.2.3') == release, 'cached release differs'
+        assert client.metrics['notModified'] == 1, client.metrics
+        assert client.release('o', 'r', 'v9.9.9') is None, 'missing release found'
+        assert client.release('o', 'r')['id'] == 1, 'latest release not found'
+        for asset in client.assets(release):
+            if asset['name'] == 'documentation.zip':
+                assert client.downloadAsset(asset) == b'PK\x05\x06', 'wrong asset contents'
+                client.deleteAsset(asset)
+        assert _StandIn.deleted == ['/repos/o/r/releases/assets/7'], _StandIn.deleted
+        asset = client.uploadAsset(release, 'documentation.zip', 'application/zip', b'PK\x03\x04', 'Documentation (zip)')
+        assert asset['size'] == len(b'PK\x03\x04'), asset
+        assert _StandIn.uploads == [('documentation.zip', 'Documentation (zip)', b'PK\x03\x04')], _StandIn.uploads
+
+        # A new client (like the next roundup) still has the cache on disk
+        again = GitHubClient('token', cacheDir, api)
+        assert again.release('o', 'r', 'v1.2.3') == release and again.metrics['notModified'] == 1, again.metrics
+        # But not if it has a different token
+        other = GitHubClient('other', cacheDir, api)
+        assert other.release('o', 'r', 'v1.2.3') == release and other.metrics['notModified'] == 0, other.metrics
+
+        print(f'{client.metrics["requests"]} requests over {len(_StandIn.connections)} connection(s): {dict(client.metrics)}')
+        assert len(_StandIn.connections) <= 3, 'connections not reused'
+        for c in (client, again, other): c.close()
+    server.shutdown()
+    print('All good')
+
+
+if __name__ == '__main__':
+    main()
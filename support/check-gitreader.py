@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Check of the Roundup's read-only git queries against a throwaway repository: do ``git_rev_parse``,
+# ``git_symbolic_ref``, ``git_describe_tag``, ``git_list_tags``, and ``get_default_branch`` answer
+# just as the ``git`` command does, with tracing on and off, and do they still answer by asking
+# ``git`` when reading the repository in-process fails? Typical usage:
+#
+#     venv/bin/python support/check-gitreader.py
+
+from pds.roundup import tracing, util
+from pds.roundup.gitreader import GitReader
+import os, subprocess, tempfile
+
+
+def _git(*args):
+    env = dict(
+        os.environ, GIT_AUTHOR_NAME='Check', GIT_AUTHOR_EMAIL='check@example.com',
+        GIT_COMMITTER_NAME='Check', GIT_COMMITTER_EMAIL='check@example.com',
+    )
+    return subprocess.run(['git', *args], env=env, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _makeRepository():
+    '''Make a repository in the current directory with a few commits and tags on ``main``, and a
+    bare clone of it as ``origin``.
+    '''
+    _git('init', '--quiet', '--initial-branch', 'main')
+    for number, tag in enumerate(('v1.0.0', 'v1.1.0', None)):
+        _git('commit', '--quiet', '--allow-empty', '--message', f'Commit {number}')
+        if tag: _git('tag', '--annotate', '--message', tag, tag)
+    _git('clone', '--quiet', '--bare', '.', 'origin.git')
+    _git('remote', 'add', 'origin', os.path.abspath('origin.git'))
+
+
+def _answers():
+    return {
+        'git_rev_parse': util.git_rev_parse('HEAD'),
+        'git_symbolic_ref': util.git_symbolic_ref('HEAD'),
+        'git_describe_tag': util.git_describe_tag('v*'),
+        'git_list_tags': util.git_list_tags('v*'),
+        'get_default_branch': util.get_default_branch(),
+    }
+
+
+def main():
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        _makeRepository()
+        expected = {
+            'git_rev_parse': _git('rev-parse', 'HEAD'),
+            'git_symbolic_ref': _git('symbolic-ref', 'HEAD'),
+            'git_describe_tag': _git('describe', '--tags', '--abbrev=0', '--match', 'v*'),
+            'git_list_tags': _git('tag', '--list', 'v*').split(),
+            'get_default_branch': 'main',
+        }
+
+        assert _answers() == expected, _answers()
+        print('In-process answers match git')
+
+        tracer = tracing.enable(os.path.join(scratch, 'trace.json'))
+        assert _answers() == expected, _answers()
+        spans = {event['name']: event['args'] for event in tracer.events if event.get('cat') == 'gitreader'}
+        assert spans['resolve'] == {'ref': 'HEAD', 'answered': True}, spans
+        assert spans['symbolicRef'] == {'ref': 'HEAD', 'answered': True}, spans
+        print(f'Traced answers match git, in {len(spans)} kind(s) of gitreader span')
+
+        def broken(cls, cwd): raise OSError('unreadable')
+        discover, GitReader.discover = GitReader.discover, classmethod(broken)
+        try:
+            assert _answers() == expected, _answers()
+        finally:
+            GitReader.discover = discover
+        print('Answers from git when the in-process reader fails match too')
+        os.chdir('/')
+    print('All good')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Check of the Roundup's requirements report against a local stand-in for GitHub's issues API and
+# a throwaway repository with a few tags: does it mark the requirements the current version
+# impacts the way ``requirement-report`` did, ask only for issues updated since the last roundup,
+# and leave the report alone when nothing changed? Typical usage:
+#
+#     venv/bin/python support/check-requirements.py
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pds.roundup import requirements
+from pds.roundup.github import GitHubClient
+from urllib.parse import urlsplit, parse_qs
+import json, os, subprocess, tempfile, threading
+
+
+def _issue(number, title, updated, labels=(), closed=None, body=None):
+    return {
+        'number': number, 'title': title, 'state': 'closed' if closed else 'open', 'closed_at': closed,
+        'updated_at': updated, 'labels': [{'name': i} for i in labels], 'body': body,
+    }
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    '''Just enough of GitHub's issues API, with two issues a page and links to the next'''
+    protocol_version = 'HTTP/1.1'
+    issues, queries = [], []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        _StandIn.queries.append(query)
+        matching = sorted(
+            (i for i in _StandIn.issues if i['updated_at'] >= query.get('since', '')), key=lambda i: i['updated_at']
+        )
+        page = int(query.get('page', 1))
+        payload = json.dumps(matching[(page - 1) * 2:page * 2]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if page * 2 < len(matching):
+            since = f'&since={query["since"]}' if 'since' in query else ''
+            base = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+            self.send_header('Link', f'<{base}/repos/o/r/issues?state=all&page={page + 1}{since}>; rel="next"')
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _git(*args, date=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME='Check', GIT_AUTHOR_EMAIL='check@example.com',
+               GIT_COMMITTER_NAME='Check', GIT_COMMITTER_EMAIL='check@example.com')
+    if date: env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    return subprocess.run(['git', *args], env=env, check=True, capture_output=True).stdout.decode('utf-8')
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = GitHubClient('token', None, f'http://127.0.0.1:{server.server_address[1]}')
+    with tempfile.TemporaryDirectory() as repo, tempfile.TemporaryDirectory() as indexDir:
+        os.chdir(repo)
+        _git('init', '--quiet')
+        _git('commit', '--quiet', '--allow-empty', '--message', 'First', date='2021-01-01T00:00:00Z')
+        _git('tag', 'v1.0.0', date='2021-01-01T00:00:00Z')
+        _git('commit', '--quiet', '--allow-empty', '--message', 'Second', date='2021-03-01T00:00:00Z')
+        _git('tag', 'v1.1.0-dev', date='2021-03-01T00:00:00Z')
+
+        _StandIn.issues = [
+            _issue(1, 'Shall go', '2020-12-01T00:00:00Z', ['requirement', 'requirement-topic:Going']),
+            _issue(2, 'Shall stop', '2020-12-02T00:00:00Z', ['requirement', 'requirement-topic:Going']),
+            _issue(3, 'Shall log', '2020-12-03T00:00:00Z', ['requirement']),
+            _issue(4, 'Crash when going', '2021-02-01T00:00:00Z', ['bug'], '2021-02-01T00:00:00Z',
+                   'It crashes.\r\n\r\n**Applicable requirements** #1'),
+            _issue(5, 'Go faster', '2021-02-02T00:00:00Z', ['enhancement'], '2021-02-02T00:00:00Z',
+                   '**Applicable requirements:** #1 and #3'),
+            _issue(6, 'Old stop fix', '2020-12-15T00:00:00Z', ['bug'], '2020-12-15T00:00:00Z',
+                   '**Applicable requirements** #2'),
+        ]
+        path, changed = requirements.generate(client, indexDir, 'o', 'r', 'docs/requirements/', True)
+        assert path == 'docs/requirements/v1.1.0-dev/REQUIREMENTS.md' and changed, (path, changed)
+        base = 'https://github.com/o/r/issues'
+        expected = f'''Requirements Summary
+====================
+
+# Going
+
+## Shall go ([#1]({base}/1)) :boom:
+
+
+The bugs which impact this requirements are:
+- Crash when going ([#4]({base}/4))
+
+
+The enhancements which impact this requirements are:
+- Go faster ([#5]({base}/5))
+
+## Shall stop ([#2]({base}/2)){" "}
+
+
+This requirement is not impacted by the current version
+# default
+
+## Shall log ([#3]({base}/3)) :boom:
+
+
+The enhancements which impact this requirements are:
+- Go faster ([#5]({base}/5))
+'''
+        with open(path) as f:
+            text = f.read()
+        assert text == expected, f'Got:\n{text}\nExpected:\n{expected}'
+        print(f'First roundup: {len(_StandIn.queries)} page(s) for {len(_StandIn.issues)} issue(s)')
+
+        # Next roundup: nothing changed, so only the last issue comes back and the report stays put
+        _StandIn.queries.clear()
+        path, changed = requirements.generate(client, indexDir, 'o', 'r', 'docs/requirements/', True)
+        assert not changed, 'unchanged report rewritten'
+        assert [q.get('since') for q in _StandIn.queries] == ['2021-02-02T00:00:00Z'], _StandIn.queries
+        print(f'Next roundup: {len(_StandIn.queries)} page(s) of issues updated since the last one; report unchanged')
+
+        # A requirement gets retitled
+        _StandIn.issues[1] = _issue(2, 'Shall halt', '2021-02-03T00:00:00Z', ['requirement', 'requirement-topic:Going'])
+        path, changed = requirements.generate(client, indexDir, 'o', 'r', 'docs/requirements/', True)
+        with open(path) as f:
+            assert changed and '## Shall halt' in f.read(), 'retitled requirement not in the report'
+
+        assert requirements.generate(client, indexDir, 'o', 'r', 'docs/requirements/', False)[0].endswith('v1.0.0/REQUIREMENTS.md')
+        os.chdir('/')
+    client.close()
+    server.shutdown()
+    print('All good')
+
+
+if __name__ == '__main__':
+    main()
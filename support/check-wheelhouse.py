@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# Check of the Roundup's wheelhouse against a local stand-in for a package index: does it fetch
+# what pip would install several at a time, install from the wheelhouse alone, fetch nothing it
+# already has on the next go, and install with the index gone? Only the wheelhouse's own downloads
+# count, as some versions of pip download whole wheels even for a dry run. Typical usage:
+#
+#     venv/bin/python support/check-wheelhouse.py
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pds.roundup import wheelhouse
+import base64, hashlib, io, logging, os, subprocess, sys, tempfile, threading, time, zipfile
+
+
+# The stand-in index's projects: name → (version, requirements)
+_projects = {
+    'alpha': ('1.0', ['beta>=2', 'gamma']),
+    'beta': ('2.1', ['delta']),
+    'gamma': ('0.3', []),
+    'delta': ('4.0', []),
+    'setuptools': ('99.0', []),
+    'wheel': ('99.0', []),
+}
+
+
+def _wheel(name, version, requires):
+    '''Make a wheel for a project with one empty module and the given requirements'''
+    distInfo = f'{name}-{version}.dist-info'
+    files = {
+        f'{name}/__init__.py': b'',
+        f'{distInfo}/METADATA': (
+            f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n' + ''.join(f'Requires-Dist: {i}\n' for i in requires)
+        ).encode('utf-8'),
+        f'{distInfo}/WHEEL': b'Wheel-Version: 1.0\nGenerator: check\nRoot-Is-Purelib: true\nTag: py3-none-any\n',
+    }
+    record = ''
+    for path, data in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode('ascii')
+        record += f'{path},sha256={digest},{len(data)}\n'
+    files[f'{distInfo}/RECORD'] = (record + f'{distInfo}/RECORD,,\n').encode('utf-8')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        for path, data in files.items():
+            z.writestr(path, data)
+    return f'{name}-{version}-py3-none-any.whl', buffer.getvalue(), files[f'{distInfo}/METADATA']
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    '''Just enough of a PEP 503 simple index, with PEP 658 metadata so pip needn't download a
+    wheel to see what it requires, and slow to hand out wheels so parallel downloads show.
+    '''
+    wheels, downloads, active, busiest, lock = {}, [], 0, 0, threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, kind):
+        self.send_response(200)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts[0] == 'simple' and len(parts) == 2 and parts[1] in _projects:
+            filename, data, metadata = _StandIn.wheels[parts[1]]
+            digest, metadataDigest = hashlib.sha256(data).hexdigest(), hashlib.sha256(metadata).hexdigest()
+            self._send((
+                f'<html><body><a href="/files/{filename}#sha256={digest}" '
+                f'data-dist-info-metadata="sha256={metadataDigest}">{filename}</a></body></html>'
+            ).encode('utf-8'), 'text/html')
+        elif parts[0] == 'files' and parts[1].endswith('.metadata'):
+            self._send(next(m for name, data, m in _StandIn.wheels.values() if f'{name}.metadata' == parts[1]), 'text/plain')
+        elif parts[0] == 'files':
+            ours = self.headers['User-Agent'] == 'pds-roundup'
+            with _StandIn.lock:
+                if ours:
+                    _StandIn.active += 1
+                    _StandIn.busiest = max(_StandIn.busiest, _StandIn.active)
+                    _StandIn.downloads.append(parts[1])
+            time.sleep(0.2)
+            self._send(next(data for name, data, m in _StandIn.wheels.values() if name == parts[1]), 'application/octet-stream')
+            with _StandIn.lock:
+                if ours: _StandIn.active -= 1
+        else:
+            self.send_error(404)
+
+
+def _installed(venv):
+    out = subprocess.run([os.path.join(venv, 'bin', 'pip'), 'freeze'], check=True, capture_output=True, text=True).stdout
+    return sorted(out.split())
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    _StandIn.wheels = {name: _wheel(name, version, requires) for name, (version, requires) in _projects.items()}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update(PIP_INDEX_URL=f'http://127.0.0.1:{server.server_address[1]}/simple', PIP_RETRIES='0')
+    os.environ.update(PIP_DISABLE_PIP_VERSION_CHECK='1', PIP_NO_CACHE_DIR='1')
+    with tempfile.TemporaryDirectory() as scratch:
+        house, project = os.path.join(scratch, 'wheelhouse'), os.path.join(scratch, 'project')
+        os.makedirs(house)
+        os.makedirs(project)
+        expected = ['alpha==1.0', 'beta==2.1', 'delta==4.0', 'gamma==0.3']
+
+        venv = os.path.join(scratch, 'venv1')
+        subprocess.run([sys.executable, '-m', 'venv', venv], check=True)
+        pip = os.path.join(venv, 'bin', 'pip')
+        started = time.time()
+        wheelhouse.install(pip, house, project, ['alpha'])
+        assert _installed(venv) == expected, _installed(venv)
+        assert sorted(_StandIn.downloads) == sorted(f'{i}-{v}-py3-none-any.whl' for i, (v, r) in _projects.items())
+        assert _StandIn.busiest > 1, 'downloads were one at a time'
+        print(f'First install: {len(_StandIn.downloads)} wheel(s) fetched, up to {_StandIn.busiest} at once, '
+              f'in {time.time() - started:.1f}s')
+
+        # Next time everything's in the wheelhouse already
+        _StandIn.downloads.clear()
+        venv = os.path.join(scratch, 'venv2')
+        subprocess.run([sys.executable, '-m', 'venv', venv], check=True)
+        wheelhouse.install(os.path.join(venv, 'bin', 'pip'), house, project, ['alpha'])
+        assert _installed(venv) == expected and not _StandIn.downloads, _StandIn.downloads
+        print('Second install: nothing fetched')
+
+        # And with the index gone
+        server.shutdown()
+        server.server_close()
+        venv = os.path.join(scratch, 'venv3')
+        subprocess.run([sys.executable, '-m', 'venv', venv], check=True)
+        wheelhouse.install(os.path.join(venv, 'bin', 'pip'), house, project, ['alpha'])
+        assert _installed(venv) == expected, _installed(venv)
+        print('Offline install: fine')
+    print('All good')
+
+
+if __name__ == '__main__':
+    main()
@@ -33,18 +33,10 @@
 #
 # You'll also need these on your PATH:
 #
-# gem install --silent github_changelog_generator --version 1.16.4
 # pip install --quiet sphinx==3.2.1 sphinx-argparse==0.2.5 sphinx-rtd-theme==0.5.0 twine==3.4.2
 #
-# i.e., the executables `github_changelog_generator` and `sphinx-build`
-# with `sphinx_rtd_theme` enabled.
+# i.e., the executable `sphinx-build` with `sphinx_rtd_theme` enabled.
 #
-# You'll also need the `deploy.sh` script:
-#
-# curl --location 'https://github.com/X1011/git-directory-deploy/raw/master/deploy.sh' > $HOME/bin/deploy.sh
-# chmod 755 $HOME/bin/deploy.sh
-#
-# Then add `~/bin` to your PATH.
 
 
 # Constantly